@@ -0,0 +1,92 @@
+"""
+Guards the cold-start latency of neko-cli.
+
+This runs `python -m neko --version` and the imports needed by a minimal download in fresh interpreters,
+takes the best of a few runs and fails if any of them exceeds its budget or if a module that should be
+loaded lazily (the viewer, Pillow, tkinter, selenium, the other providers) shows up.
+
+    python benchmarks/startup.py [--runs 5] [--version-budget 0.15] [--download-budget 0.6]
+"""
+from typing import List, Tuple
+
+import subprocess
+import argparse
+import json
+import time
+import sys
+
+VERSION = [sys.executable, '-m', 'neko', '--version']
+
+# Everything `neko-cli -c neko -a 1` imports before its first network call.
+MINIMAL_DOWNLOAD = """
+import sys, json
+import neko.main
+from neko.providers import ALL_PROVIDERS
+ALL_PROVIDERS['nekobot']
+print(json.dumps(sorted(sys.modules)))
+"""
+
+FORBIDDEN_MODULES = (
+    'neko.viewer',
+    'PIL',
+    'tkinter',
+    'selenium',
+    'undetected_chromedriver',
+    'neko.providers.danbooru',
+    'neko.providers.pixiv',
+    'neko.providers.nhentai',
+)
+
+def measure(command: List[str], runs: int) -> Tuple[float, str]:
+    best, output = float('inf'), ''
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run(command, check=True, capture_output=True, text=True)
+        best = min(best, time.perf_counter() - start)
+
+        output = result.stdout
+
+    return best, output
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Cold-start benchmark for neko-cli.')
+
+    parser.add_argument('--runs', type=int, help='The amount of runs per measurement. Defaults to 5.', default=5)
+    parser.add_argument('--version-budget', type=float, help='Budget in seconds for `neko-cli --version`. Defaults to 0.15.', default=0.15)
+    parser.add_argument('--download-budget', type=float, help='Budget in seconds for a minimal download startup. Defaults to 0.6.', default=0.6)
+
+    args = parser.parse_args()
+
+    baseline, _ = measure([sys.executable, '-c', 'pass'], args.runs)
+    version, _ = measure(VERSION, args.runs)
+    download, output = measure([sys.executable, '-c', MINIMAL_DOWNLOAD], args.runs)
+
+    modules = json.loads(output)
+    loaded = [name for name in FORBIDDEN_MODULES if any(module == name or module.startswith(f'{name}.') for module in modules)]
+
+    results = {
+        'interpreter': round(baseline, 4),
+        'version': round(version, 4),
+        'minimal_download': round(download, 4),
+        'unexpected_modules': loaded,
+    }
+
+    print(json.dumps(results, indent=4))
+
+    failed = False
+    if version - baseline > args.version_budget:
+        print(f'neko-cli --version took {version - baseline:.3f}s over the interpreter startup (budget: {args.version_budget}s)')
+        failed = True
+
+    if download - baseline > args.download_budget:
+        print(f'A minimal download took {download - baseline:.3f}s to start (budget: {args.download_budget}s)')
+        failed = True
+
+    if loaded:
+        print(f'Modules that should be loaded lazily were imported: {", ".join(loaded)}')
+        failed = True
+
+    return int(failed)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,344 @@
+"""
+Measures how the image viewer behaves as directories grow.
+
+Synthetic directories of JPEGs, PNGs and GIFs are generated for every combination of `--counts` and `--sizes`,
+and every one of them is benchmarked in a fresh interpreter so that the peak RSS of a scenario isn't polluted
+by the previous ones. For every scenario this records:
+
+- the time it takes to index the directory and to show the first image,
+- the latency of navigating to the next image (with prefetching) and to a random one (without),
+- the peak RSS of the process and its decode workers,
+- for GIFs, the time it takes to prepare the first frame and every frame after it.
+
+The navigation numbers go through `Application.show` and the Tk event loop, which requires a display
+(run it under `xvfb-run` on a headless machine). Without one the scenarios fall back to driving
+`DirectoryIndex` and `decode_image` directly and are marked as `headless` so they are only compared to each other.
+
+    python benchmarks/viewer.py [--counts 100 1000] [--sizes 1920x1080] [--output results.json]
+    python benchmarks/viewer.py --compare baseline.json [--tolerance 0.2]
+"""
+from typing import Any, Dict, List, Tuple
+
+import subprocess
+import statistics
+import tempfile
+import argparse
+import platform
+import resource
+import pathlib
+import random
+import json
+import time
+import sys
+import os
+
+VERSION = 1
+
+# The scenarios run this file directly, so the repository has to be importable from them
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+
+FORMATS = ('jpeg', 'png', 'gif')
+EXTENSIONS = {'jpeg': '.jpg', 'png': '.png', 'gif': '.gif'}
+
+# Metrics where a higher number is a regression, used by `--compare`
+TRACKED_METRICS = (
+    'index',
+    'first_image',
+    'next.p50',
+    'next.p95',
+    'random.p50',
+    'random.p95',
+    'gif.first_frame',
+    'gif.per_frame',
+    'peak_rss',
+)
+
+def parse_size(value: str) -> Tuple[int, int]:
+    width, _, height = value.partition('x')
+    return int(width), int(height)
+
+def generate(directory: pathlib.Path, format: str, count: int, size: Tuple[int, int], *, frames: int = 24) -> None:
+    """
+    Fills a directory with `count` synthetic images.
+    The images are noisy gradients so that they compress (and decode) roughly like real pictures.
+    """
+    from PIL import Image, ImageChops
+
+    directory.mkdir(parents=True, exist_ok=True)
+    width, height = size
+
+    gradient = Image.linear_gradient('L').resize(size)
+    noise = Image.effect_noise(size, 48)
+
+    base = Image.merge('RGB', (gradient, noise, ImageChops.invert(gradient)))
+    for index in range(count):
+        path = directory / f'{index}{EXTENSIONS[format]}'
+        image = base.rotate(index % 360)
+
+        if format == 'gif':
+            images = [image.rotate(frame * 15).quantize(64) for frame in range(frames)]
+            images[0].save(path, save_all=True, append_images=images[1:], duration=40, loop=0)
+        elif format == 'jpeg':
+            image.save(path, quality=90)
+        else:
+            image.save(path)
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {}
+
+    ordered = sorted(samples)
+    return {
+        'mean': round(statistics.fmean(ordered), 5),
+        'p50': round(ordered[len(ordered) // 2], 5),
+        'p95': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 5),
+        'max': round(ordered[-1], 5),
+    }
+
+def get_peak_rss() -> int:
+    # `ru_maxrss` is in kilobytes on Linux and in bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+
+    this = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+
+    return (this + children) * scale
+
+def measure_frames(path: pathlib.Path, size: Tuple[int, int], frames: int) -> Dict[str, float]:
+    from neko.viewer import FrameStream
+
+    stream = FrameStream(str(path), size)
+
+    start = time.perf_counter()
+    stream.start()
+
+    stream.frames.get()
+    first = time.perf_counter() - start
+
+    for _ in range(frames - 1):
+        stream.frames.get()
+
+    stream.stop()
+    total = time.perf_counter() - start
+
+    return {'first_frame': round(first, 5), 'per_frame': round((total - first) / max(1, frames - 1), 5)}
+
+def run_ui(directory: pathlib.Path, args: argparse.Namespace) -> Dict[str, Any]:
+    from neko.viewer import Application
+
+    def wait(app: Application) -> None:
+        while app.waiting is not None:
+            app.update()
+            time.sleep(0.001)
+
+    start = time.perf_counter()
+    app = Application(paths=[str(directory)], width=args.width, height=args.height, workers=args.workers)
+    indexed = time.perf_counter() - start
+
+    app.show(0)
+    wait(app)
+
+    first_image = time.perf_counter() - start
+
+    steps = min(args.navigations, len(app.images) - 1)
+
+    latencies: List[float] = []
+    for _ in range(steps):
+        # Give prefetching the time a person would spend looking at the image
+        deadline = time.perf_counter() + args.dwell
+        while time.perf_counter() < deadline:
+            app.update()
+            time.sleep(0.001)
+
+        start = time.perf_counter()
+        app.next()
+        wait(app)
+
+        latencies.append(time.perf_counter() - start)
+
+    rng = random.Random(0)
+
+    jumps: List[float] = []
+    for _ in range(steps):
+        start = time.perf_counter()
+        app.show(rng.randrange(len(app.images)))
+        wait(app)
+
+        jumps.append(time.perf_counter() - start)
+
+    app.destroy()
+    return {
+        'index': round(indexed, 5),
+        'first_image': round(first_image, 5),
+        'next': summarize(latencies),
+        'random': summarize(jumps),
+    }
+
+def run_headless(directory: pathlib.Path, args: argparse.Namespace) -> Dict[str, Any]:
+    from neko.viewer import DirectoryIndex, decode_image
+
+    size = (args.width, args.height)
+
+    start = time.perf_counter()
+    images = DirectoryIndex(directory).load(workers=args.workers)
+    indexed = time.perf_counter() - start
+
+    decode_image(images[0], size)
+    first_image = time.perf_counter() - start
+
+    steps = min(args.navigations, len(images) - 1)
+    rng = random.Random(0)
+
+    # Without the event loop there is no prefetching, so both of these are cold decodes
+    latencies: List[float] = []
+    for path in images[1:steps + 1]:
+        start = time.perf_counter()
+        decode_image(path, size)
+
+        latencies.append(time.perf_counter() - start)
+
+    jumps: List[float] = []
+    for _ in range(steps):
+        start = time.perf_counter()
+        decode_image(images[rng.randrange(len(images))], size)
+
+        jumps.append(time.perf_counter() - start)
+
+    return {
+        'index': round(indexed, 5),
+        'first_image': round(first_image, 5),
+        'next': summarize(latencies),
+        'random': summarize(jumps),
+    }
+
+def run_scenario(directory: pathlib.Path, args: argparse.Namespace) -> Dict[str, Any]:
+    import tkinter
+
+    try:
+        results = run_ui(directory, args)
+        results['mode'] = 'ui'
+    except tkinter.TclError:
+        results = run_headless(directory, args)
+        results['mode'] = 'headless'
+
+    gifs = sorted(directory.glob('*.gif'))
+    if gifs:
+        results['gif'] = measure_frames(gifs[0], (args.width, args.height), args.frames)
+
+    results['peak_rss'] = get_peak_rss()
+    return results
+
+def flatten(results: Dict[str, Any], prefix: str = '') -> Dict[str, float]:
+    flat: Dict[str, float] = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f'{prefix}{key}.'))
+        elif isinstance(value, (int, float)):
+            flat[f'{prefix}{key}'] = value
+
+    return flat
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """
+    Returns the metrics of `current` that are more than `tolerance` worse than the same scenario in `baseline`.
+    """
+    previous = {scenario['name']: scenario for scenario in baseline['scenarios']}
+
+    regressions: List[str] = []
+    for scenario in current['scenarios']:
+        other = previous.get(scenario['name'])
+        if other is None or other.get('mode') != scenario.get('mode'):
+            continue
+
+        new, old = flatten(scenario), flatten(other)
+        for metric in TRACKED_METRICS:
+            if metric not in new or not old.get(metric):
+                continue
+
+            ratio = new[metric] / old[metric]
+            if ratio > 1 + tolerance:
+                regressions.append(f'{scenario["name"]}: {metric} went from {old[metric]} to {new[metric]} ({ratio:.2f}x)')
+
+    return regressions
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Viewer benchmark for neko-cli.')
+
+    parser.add_argument('--formats', nargs='+', choices=FORMATS, help='The image formats to generate. Defaults to all of them.', default=list(FORMATS))
+    parser.add_argument('--counts', nargs='+', type=int, help='The amount of images per directory. Defaults to 50 and 500.', default=[50, 500])
+    parser.add_argument('--sizes', nargs='+', type=parse_size, help='The sizes of the images, e.g. 1920x1080. Defaults to 1920x1080.', default=[(1920, 1080)])
+    parser.add_argument('--frames', type=int, help='The amount of frames per GIF. Defaults to 24.', default=24)
+    parser.add_argument('--width', type=int, help='The width of the viewer. Defaults to 720.', default=720)
+    parser.add_argument('--height', type=int, help='The height of the viewer. Defaults to 720.', default=720)
+    parser.add_argument('--workers', type=int, help='The amount of decode workers. Defaults to the amount of CPUs.', required=False)
+    parser.add_argument('--navigations', type=int, help='The amount of navigations measured per scenario. Defaults to 30.', default=30)
+    parser.add_argument('--dwell', type=float, help='The amount of seconds spent on an image before moving on. Defaults to 0.1.', default=0.1)
+    parser.add_argument('--directory', type=pathlib.Path, help='Where to generate the images. Defaults to a temporary directory.', required=False)
+    parser.add_argument('--output', type=pathlib.Path, help='Where to write the results. Defaults to stdout.', required=False)
+    parser.add_argument('--compare', type=pathlib.Path, help='Previous results to compare against. Exits with 1 on regressions.', required=False)
+    parser.add_argument('--tolerance', type=float, help='The allowed slowdown when comparing, as a fraction. Defaults to 0.2.', default=0.2)
+    parser.add_argument('--scenario', type=pathlib.Path, help=argparse.SUPPRESS, required=False)
+
+    args = parser.parse_args()
+
+    if args.scenario is not None:
+        print(json.dumps(run_scenario(args.scenario, args)))
+        return 0
+
+    env = os.environ.copy()
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [str(ROOT), env.get('PYTHONPATH')]))
+
+    with tempfile.TemporaryDirectory(prefix='neko-viewer-bench-') as tmp:
+        root = args.directory or pathlib.Path(tmp)
+
+        scenarios: List[Dict[str, Any]] = []
+        for format in args.formats:
+            for count in args.counts:
+                for size in args.sizes:
+                    name = f'{format}-{count}-{size[0]}x{size[1]}'
+                    directory = root / name
+
+                    if not directory.exists():
+                        generate(directory, format, count, size, frames=args.frames)
+
+                    command = [sys.executable, __file__, '--scenario', str(directory)]
+                    for option in ('width', 'height', 'navigations', 'dwell', 'frames', 'workers'):
+                        value = getattr(args, option)
+                        if value is not None:
+                            command.extend([f'--{option}', str(value)])
+
+                    result = subprocess.run(command, capture_output=True, text=True, env=env)
+                    if result.returncode != 0:
+                        print(f'{name} failed:\n{result.stderr}', file=sys.stderr)
+                        return 1
+
+                    scenario = {'name': name, 'format': format, 'count': count, 'size': list(size)}
+                    scenario.update(json.loads(result.stdout.splitlines()[-1]))
+
+                    print(f'{name}: first image in {scenario["first_image"]:.3f}s', file=sys.stderr)
+                    scenarios.append(scenario)
+
+    results = {
+        'version': VERSION,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'created': time.time(),
+        'scenarios': scenarios,
+    }
+
+    output = json.dumps(results, indent=4)
+    if args.output is not None:
+        args.output.write_text(output)
+    else:
+        print(output)
+
+    regressions: List[str] = []
+    if args.compare is not None:
+        regressions = compare(results, json.loads(args.compare.read_text()), args.tolerance)
+        for regression in regressions:
+            print(regression, file=sys.stderr)
+
+    return int(bool(regressions))
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,9 +1,9 @@
-import asyncio
 import argparse
+import logging
 import sys
 
 from . import __version__
-from .main import main as amain
+from .constants import MEDIA_TYPES, QUALITIES
 from .providers import ALL_PROVIDERS
 
 def create_argument_parser() -> argparse.ArgumentParser:
@@ -41,7 +41,7 @@ def create_argument_parser() -> argparse.ArgumentParser:
         type=str, 
         help='The provider to use.', 
         required=False,
-        choices=ALL_PROVIDERS.keys()
+        choices=ALL_PROVIDERS
     )
 
     parser.add_argument(
@@ -72,17 +72,355 @@ def create_argument_parser() -> argparse.ArgumentParser:
         default=False
     )
 
-    parser.add_argument('--view', action='store_true', help='View the images after downloading.')
+    parser.add_argument(
+        '--quality', 
+        type=str, 
+        help=(
+            'Which rendition of every image to download: the `original` file or a downsized `large` (up to 2048px), '
+            '`sample` (up to 1024px) or `thumb` (up to 320px) one. Only matters with danbooru, booru.io and reddit. '
+            'Defaults to `original`.'
+        ),
+        choices=QUALITIES,
+        default='original'
+    )
+
+    parser.add_argument(
+        '--min-size', 
+        type=str, 
+        help='Skip files smaller than this, e.g. `50K`. Checked against the API and the Content-Length header.', 
+        required=False
+    )
+
+    parser.add_argument(
+        '--max-size', 
+        type=str, 
+        help='Skip files bigger than this, e.g. `20M`. Checked against the API and the Content-Length header.', 
+        required=False
+    )
+
+    parser.add_argument(
+        '--max-width', 
+        type=int, 
+        help='Skip images wider than this many pixels. Only checked when the API reports dimensions.', 
+        required=False
+    )
+
+    parser.add_argument(
+        '--max-height', 
+        type=int, 
+        help='Skip images taller than this many pixels. Only checked when the API reports dimensions.', 
+        required=False
+    )
+
+    parser.add_argument(
+        '--media-types', 
+        type=str, 
+        nargs='+',
+        help='Only download these kinds of files. Defaults to all of them.', 
+        choices=MEDIA_TYPES,
+        required=False
+    )
+
+    parser.add_argument(
+        '--budget', 
+        type=str, 
+        help='Stop once this many bytes were downloaded, e.g. `5G`.', 
+        required=False
+    )
+
+    parser.add_argument(
+        '--min-free-space', 
+        type=str, 
+        help='Stop before the free space on the disk of the output path drops below this, e.g. `10G`.', 
+        required=False
+    )
+
+    parser.add_argument(
+        '--host-weight', 
+        type=str, 
+        action='append',
+        help=(
+            'Give a host a bigger (or smaller) share of the concurrent downloads, e.g. `i.redd.it=2`. '
+            'Hosts have a weight of 1 by default. Can be passed multiple times.'
+        ),
+        metavar='HOST=WEIGHT',
+        required=False
+    )
+
+    parser.add_argument(
+        '--smallest-first', 
+        action='store_true', 
+        help='Download the smallest files of every host first when their size is known in advance. Defaults to False.', 
+        default=False
+    )
+
+    parser.add_argument(
+        '--connection-limit', 
+        type=int, 
+        help='The maximum amount of open connections, 0 means unlimited. Defaults to 100.', 
+        required=False
+    )
+
+    parser.add_argument(
+        '--connection-limit-per-host', 
+        type=int, 
+        help='The maximum amount of open connections to a single host, 0 means unlimited. Defaults to 0.', 
+        required=False
+    )
+
+    parser.add_argument(
+        '--dns-cache-ttl', 
+        type=float, 
+        help='The amount of seconds resolved hosts are cached for, 0 disables the cache. Defaults to 300.', 
+        required=False
+    )
+
+    parser.add_argument(
+        '--keepalive-timeout', 
+        type=float, 
+        help='The amount of seconds idle connections are kept open for. Defaults to 60.', 
+        required=False
+    )
+
+    parser.add_argument(
+        '--connect-timeout', 
+        type=float, 
+        help='The maximum amount of seconds to wait for a connection, 0 disables the timeout. Defaults to 30.', 
+        required=False
+    )
+
+    parser.add_argument(
+        '--read-timeout', 
+        type=float, 
+        help='The maximum amount of seconds to wait for more data from a response, 0 disables the timeout. Defaults to 0.', 
+        required=False
+    )
+
+    parser.add_argument(
+        '--total-timeout', 
+        type=float, 
+        help=(
+            'The maximum amount of seconds a request may take, including its body, 0 disables the timeout. Defaults to 300. '
+            'These options can also be set in the `[http]` table of a TOML extras file.'
+        ),
+        required=False
+    )
+
+    parser.add_argument(
+        '--warm-connections', 
+        type=int, 
+        help=(
+            'The amount of connections to open to the image hosts of the provider while its API is being queried, '
+            'so that the first downloads start right away. 0 disables this. Defaults to 2.'
+        ),
+        default=2
+    )
+
+    parser.add_argument(
+        '--saturation', 
+        type=float, 
+        help='Stop fetching from random providers once this fraction of recent results are duplicates. Defaults to 0.95.', 
+        default=0.95
+    )
+
+    parser.add_argument(
+        '--no-seen-cache', 
+        action='store_true', 
+        help='Do not persist the identifiers that were already fetched between runs. Defaults to False.', 
+        default=False
+    )
+
+    parser.add_argument(
+        '--no-cache', 
+        action='store_true', 
+        help='Do not use cached API responses (e.g. categories). Defaults to False.', 
+        default=False
+    )
+
+    parser.add_argument(
+        '--clear-cache', 
+        action='store_true', 
+        help='Remove all cached API responses before running. Defaults to False.', 
+        default=False
+    )
+
+    parser.add_argument(
+        '--layout', 
+        type=str, 
+        help=(
+            'How files are organized inside of the output path: `flat`, `hash` (`ab/cd/<name>` shards) or `tree` '
+            '(`<provider>/<category>/<name>`). The layout is remembered per output path. Defaults to `flat`.'
+        ),
+        choices=('flat', 'hash', 'tree'),
+        required=False
+    )
+
+    parser.add_argument(
+        '--backend', 
+        type=str, 
+        help=(
+            'How downloads are stored: as separate files (`filesystem`), appended to rolling archive volumes '
+            'inside of the output path (`archive`) or uploaded to an S3-compatible bucket (`s3`). Defaults to `filesystem`.'
+        ),
+        choices=('filesystem', 'archive', 's3'),
+        default='filesystem'
+    )
+
+    parser.add_argument(
+        '--archive-format', 
+        type=str, 
+        help='The format of archive volumes. Defaults to `tar`.', 
+        choices=('tar', 'zip'),
+        default='tar'
+    )
+
+    parser.add_argument(
+        '--archive-volume-size', 
+        type=int, 
+        help='The size in megabytes after which a new archive volume is started. Defaults to 1024.', 
+        default=1024
+    )
+
+    parser.add_argument(
+        '--s3-bucket', 
+        type=str, 
+        help=(
+            'The bucket to upload to with `--backend s3`. Credentials are read from the `AWS_ACCESS_KEY_ID`, '
+            '`AWS_SECRET_ACCESS_KEY` and `AWS_SESSION_TOKEN` environment variables.'
+        ),
+        required=False
+    )
+
+    parser.add_argument(
+        '--s3-prefix', 
+        type=str, 
+        help='Prepended to the key of every uploaded object, e.g. `neko/`. Defaults to nothing.', 
+        default=''
+    )
+
+    parser.add_argument(
+        '--s3-endpoint', 
+        type=str, 
+        help='The URL of the S3-compatible service, e.g. `http://localhost:9000` for MinIO. Defaults to AWS.', 
+        default='https://s3.amazonaws.com'
+    )
+
+    parser.add_argument(
+        '--s3-region', 
+        type=str, 
+        help='The region used to sign requests. Defaults to the `AWS_REGION` environment variable or `us-east-1`.', 
+        required=False
+    )
+
+    parser.add_argument(
+        '--s3-virtual-hosted', 
+        action='store_true', 
+        help='Address the bucket as part of the host (`bucket.endpoint`) instead of the path. Defaults to False.', 
+        default=False
+    )
+
+    parser.add_argument(
+        '--s3-part-size', 
+        type=int, 
+        help='The size in megabytes of the parts of multipart uploads, at least 5. Defaults to 8.', 
+        default=8
+    )
+
+    parser.add_argument(
+        '--s3-concurrency', 
+        type=int, 
+        help='The maximum amount of parts of a single download that are uploaded at once. Defaults to 4.', 
+        default=4
+    )
+
+    parser.add_argument(
+        '--cas', 
+        type=str, 
+        help=(
+            'Store downloads once per unique content inside of this directory and hardlink them into the output path. '
+            'Files downloaded with this share their data with the store, so edit copies of them rather than the files themselves.'
+        ),
+        required=False
+    )
+
+    parser.add_argument(
+        '--near-duplicates', 
+        type=str, 
+        help=(
+            'After downloading, look for images that are re-encoded or resized copies of images that were already in the '
+            'output directory and either list (`flag`) or delete (`drop`) them. Of every pair, the copy with the lower resolution '
+            'is the one flagged or deleted. Requires Pillow.'
+        ),
+        choices=('flag', 'drop'),
+        required=False
+    )
+
+    parser.add_argument(
+        '--near-duplicate-distance', 
+        type=int, 
+        help='The maximum amount of differing bits (out of 64) between the perceptual hashes of near-duplicates, at most 7. Defaults to 6.', 
+        default=6
+    )
+
+    parser.add_argument('--view', action='store_true', help='View the images while they are being downloaded.')
     parser.add_argument('--debug', action='store_true', help='Print debug information.')
     parser.add_argument('--version', action='version', version=f'%(prog)s {__version__}')
 
+    commands = parser.add_subparsers(dest='command')
+
+    scan = commands.add_parser(
+        'scan', help='Index the files inside of existing download directories and find exact duplicates.'
+    )
+
+    scan.add_argument('paths', nargs='+', help='The directories to scan.')
+
+    scan.add_argument(
+        '--index', 
+        type=str, 
+        help='The index file. Defaults to `library.sqlite3` inside of the cache directory.', 
+        required=False
+    )
+
+    scan.add_argument(
+        '--workers', 
+        type=int, 
+        help='The amount of processes used to hash files. Defaults to the amount of CPUs.', 
+        required=False
+    )
+
+    scan.add_argument(
+        '--action', 
+        type=str, 
+        help='What to do with duplicates: list them, replace them with hardlinks to the oldest copy or remove them. Defaults to `report`.', 
+        choices=('report', 'link', 'remove'),
+        default='report'
+    )
+
+    # Suppressed so that the subcommand doesn't override `neko --debug scan ...`
+    scan.add_argument('--debug', action='store_true', default=argparse.SUPPRESS, help='Print debug information.')
+
     return parser
 
 def main() -> int:
     parser = create_argument_parser()
+    args = parser.parse_args()
+
+    if args.command == 'scan':
+        from .scanner import main as scan
+        from .log import create_logger
+
+        logger = create_logger()
+        if not args.debug:
+            logger.setLevel(logging.ERROR)
+
+        return scan(args)
+
+    # Imported after parsing so that `--help` and `--version` don't have to load asyncio and aiohttp
+    from .main import main as amain
+    import asyncio
 
     try:
-        return asyncio.run(amain(parser.parse_args()))
+        return asyncio.run(amain(args))
     except KeyboardInterrupt:
         return 1
 
@@ -0,0 +1,4 @@
+from .abc import Backend, Writer
+from .filesystem import FileSystemBackend, FileWriter
+from .archive import ArchiveBackend, ArchiveEntry, ArchiveIndex, ArchiveWriter
+from .s3 import S3Backend, S3Error, S3Writer
@@ -0,0 +1,139 @@
+from typing import BinaryIO, ClassVar, Iterator, Tuple
+
+from abc import ABC, abstractmethod
+import pathlib
+import shutil
+import uuid
+
+class Writer(ABC):
+    """
+    Receives the content of a single download as it streams in.
+    Nothing is visible to readers of the backend until :meth:`commit` is called.
+    """
+    @abstractmethod
+    async def write(self, data: bytes) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def commit(self) -> None:
+        """
+        Makes the download available under its final path.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def abort(self) -> None:
+        """
+        Discards everything that was written so far.
+        """
+        raise NotImplementedError
+
+class Backend(ABC):
+    """
+    Decides how and where downloads are stored.
+
+    Paths given to a backend are the paths computed by :class:`neko.downloader.Downloader` (and its layout)
+    inside of the output path. The filesystem backend stores files right there, other backends only use the
+    path relative to the output path as the name of the download.
+
+    Parameters
+    ----------
+    path: :class:`pathlib.Path`
+        The output path.
+    """
+    NAME: ClassVar[str]
+
+    # In-flight downloads are written here and moved into place once they're complete. It's inside of the output
+    # path so that the rename never crosses filesystems, and hidden so that the viewer and the scanner skip it.
+    STAGING_DIRECTORY = '.staging'
+
+    def __init__(self, path: pathlib.Path) -> None:
+        self.path = path
+        self.staging = path / self.STAGING_DIRECTORY
+
+        # Downloads whose content was already stored and the amount of bytes that weren't stored again because of it
+        self.duplicates = 0
+        self.saved = 0
+
+    def get_name(self, path: pathlib.Path) -> str:
+        return path.relative_to(self.path).as_posix()
+
+    def prepare(self) -> int:
+        """
+        Creates the staging directory and removes the partial downloads left over from a previous run.
+        This only looks at the staging directory, so it doesn't get slower as the output path grows.
+        This function returns the amount of removed files.
+        """
+        if not self.staging.exists():
+            self.staging.mkdir(parents=True)
+            return 0
+
+        removed = 0
+        for file in self.staging.iterdir():
+            if file.is_dir():
+                shutil.rmtree(file, ignore_errors=True)
+            else:
+                file.unlink()
+
+            removed += 1
+
+        return removed
+
+    def create_staging_file(self, name: str) -> Tuple[pathlib.Path, BinaryIO]:
+        """
+        Creates a new file inside of the staging directory and returns its path and the file opened for writing.
+        The name of the download is only used as a prefix, so downloads that share a name never share a file.
+        Unlike :func:`tempfile.mkstemp`, the file gets the usual permissions since it ends up being the download itself.
+
+        Parameters
+        ----------
+        name: :class:`str`
+            The name of the download.
+        """
+        self.staging.mkdir(exist_ok=True)
+
+        tmp = self.staging / f'{name.replace("/", "_")}.{uuid.uuid4().hex[:8]}.tmp'
+        return tmp, tmp.open('xb')
+
+    @abstractmethod
+    def exists(self, path: pathlib.Path) -> bool:
+        """
+        Returns whether or not a download was already stored under the given path.
+
+        Parameters
+        ----------
+        path: :class:`pathlib.Path`
+            The download path.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def open(self, path: pathlib.Path) -> Writer:
+        """
+        Returns a writer that stores a new download under the given path.
+
+        Parameters
+        ----------
+        path: :class:`pathlib.Path`
+            The download path.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def iter_names(self) -> Iterator[str]:
+        """
+        Yields the file names of every stored download.
+        """
+        raise NotImplementedError
+
+    async def start(self) -> None:
+        """
+        Called once before the first download, after :meth:`prepare`.
+        """
+        return
+
+    async def close(self) -> None:
+        """
+        Flushes everything that is still buffered. Called once every download is done.
+        """
+        return
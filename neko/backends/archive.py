@@ -0,0 +1,308 @@
+from typing import BinaryIO, Dict, Iterator, List, NamedTuple, Optional, Union
+
+import tarfile
+import zipfile
+import asyncio
+import hashlib
+import pathlib
+import logging
+import json
+import time
+import io
+
+from ..utils import to_thread
+from .abc import Backend, Writer
+
+logger = logging.getLogger('neko')
+
+INDEX_NAME = 'archive-index.jsonl'
+FORMATS = ('tar', 'zip')
+
+class ArchiveEntry(NamedTuple):
+    """
+    A download stored inside of an archive volume. Entries are stored uncompressed, so the content
+    of an entry can be read straight from the volume without going through the archive format.
+    """
+    member: str
+    volume: pathlib.Path
+    offset: int
+    size: int
+    sha256: str
+
+    @property
+    def name(self) -> str:
+        return self.member.rpartition('/')[2]
+
+    @property
+    def suffix(self) -> str:
+        return pathlib.PurePosixPath(self.member).suffix
+
+    def read(self) -> bytes:
+        with self.volume.open('rb') as file:
+            file.seek(self.offset)
+            return file.read(self.size)
+
+    def open(self) -> BinaryIO:
+        return io.BytesIO(self.read())
+
+class ArchiveIndex:
+    """
+    The sidecar index of an archive directory: one JSON line per stored download with the volume and offset of its
+    content and its SHA-256 digest. Lines are only ever appended, so readers (like the viewer while a download is
+    still running) can pick up new entries by reading from where they left off.
+
+    Parameters
+    ----------
+    directory: :class:`pathlib.Path`
+        The directory holding the volumes and the index.
+    """
+    def __init__(self, directory: pathlib.Path) -> None:
+        self.directory = directory
+        self.path = directory / INDEX_NAME
+
+        self.entries: Dict[str, ArchiveEntry] = {}
+        self.digests: Dict[str, ArchiveEntry] = {}
+
+        self.position = 0
+        self.file: Optional[io.TextIOWrapper] = None
+
+    @staticmethod
+    def exists(directory: pathlib.Path) -> bool:
+        return (directory / INDEX_NAME).exists()
+
+    def _add(self, entry: ArchiveEntry) -> None:
+        self.entries[entry.member] = entry
+        self.digests.setdefault(entry.sha256, entry)
+
+    def update(self) -> List[ArchiveEntry]:
+        """
+        Reads the entries that were appended since the last call.
+        """
+        try:
+            file = self.path.open('rb')
+        except FileNotFoundError:
+            return []
+
+        added: List[ArchiveEntry] = []
+        with file:
+            file.seek(self.position)
+            for line in file:
+                if not line.endswith(b'\n'):
+                    break # Still being written
+
+                self.position += len(line)
+                try:
+                    data = json.loads(line)
+                    entry = ArchiveEntry(data['name'], self.directory / data['volume'], data['offset'], data['size'], data['sha256'])
+                except (ValueError, KeyError, TypeError):
+                    logger.warning('Ignoring corrupted line in %r.', self.path.name)
+                    continue
+
+                self._add(entry)
+                added.append(entry)
+
+        return added
+
+    def append(self, entry: ArchiveEntry) -> None:
+        if self.file is None:
+            self.file = self.path.open('a')
+
+        data = {'name': entry.member, 'volume': entry.volume.name, 'offset': entry.offset, 'size': entry.size, 'sha256': entry.sha256}
+        self.file.write(json.dumps(data) + '\n')
+        self.file.flush()
+
+        self._add(entry)
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+class Volume:
+    """
+    A single archive file that downloads are appended to, either a tar or an uncompressed zip.
+
+    Parameters
+    ----------
+    path: :class:`pathlib.Path`
+        The path of the volume. This must not exist.
+    format: :class:`str`
+        Either `tar` or `zip`.
+    """
+    def __init__(self, path: pathlib.Path, format: str) -> None:
+        self.path = path
+        self.format = format
+        self.count = 0
+
+        self.archive: Union[tarfile.TarFile, zipfile.ZipFile]
+        if format == 'tar':
+            self.archive = tarfile.open(path, 'x', format=tarfile.PAX_FORMAT)
+        else:
+            self.archive = zipfile.ZipFile(path, 'x', compression=zipfile.ZIP_STORED, allowZip64=True)
+
+    @property
+    def size(self) -> int:
+        if isinstance(self.archive, tarfile.TarFile):
+            return self.archive.offset
+
+        return self.archive.fp.tell() # type: ignore
+
+    def add(self, source: pathlib.Path, name: str) -> int:
+        """
+        Appends a file to the volume and returns the offset of its content.
+        """
+        self.count += 1
+        if isinstance(self.archive, tarfile.TarFile):
+            info = tarfile.TarInfo(name)
+            info.size = source.stat().st_size
+            info.mtime = int(time.time())
+
+            with source.open('rb') as file:
+                self.archive.addfile(info, file)
+
+            # Flushed before the entry is indexed so that readers never see an entry whose content isn't there yet
+            self.archive.fileobj.flush() # type: ignore
+
+            # The content is followed by padding up to the next 512 byte block
+            return self.archive.offset - -(-info.size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+
+        self.archive.write(source, name)
+        self.archive.fp.flush() # type: ignore
+
+        zinfo = self.archive.getinfo(name)
+
+        # The local file header is 30 bytes followed by the name and the extra field
+        return zinfo.header_offset + 30 + len(zinfo.filename.encode('utf-8')) + len(zinfo.extra)
+
+    def close(self) -> None:
+        self.archive.close()
+
+class ArchiveWriter(Writer):
+    def __init__(self, backend: 'ArchiveBackend', name: str) -> None:
+        self.backend = backend
+        self.name = name
+
+        self.tmp, self.file = backend.create_staging_file(name)
+        self.sha256 = hashlib.sha256()
+
+    async def write(self, data: bytes) -> None:
+        self.file.write(data)
+        self.sha256.update(data)
+
+    async def commit(self) -> None:
+        self.file.close()
+        try:
+            await self.backend.add(self.tmp, self.name, self.sha256.hexdigest())
+        finally:
+            self.tmp.unlink()
+
+    async def abort(self) -> None:
+        self.file.close()
+        self.tmp.unlink()
+
+class ArchiveBackend(Backend):
+    """
+    Streams downloads into rolling archive volumes (`archive-00000.tar`, `archive-00001.tar`, ...) instead of
+    storing them as separate files, which keeps the amount of inodes down and makes backups cheap.
+
+    Downloads are staged until they're complete and then appended to the current volume, a new volume is started once
+    the current one would grow past `volume_size`. Every run starts a new volume, so volumes are never modified once
+    they're closed. Downloads whose content was already archived aren't stored again, their index entry points to the
+    existing content instead.
+
+    Parameters
+    ----------
+    path: :class:`pathlib.Path`
+        The output path, holding the volumes and the index.
+    format: :class:`str`
+        Either `tar` or `zip`. Defaults to `tar`.
+    volume_size: :class:`int`
+        The maximum size of a volume in bytes. Downloads bigger than this get a volume of their own. Defaults to 1 GiB.
+    """
+    NAME = 'archive'
+
+    def __init__(self, path: pathlib.Path, *, format: str = 'tar', volume_size: int = 1024 * 1024 * 1024) -> None:
+        super().__init__(path)
+
+        if format not in FORMATS:
+            raise ValueError(f'Invalid archive format {format!r}')
+
+        self.format = format
+        self.volume_size = volume_size
+
+        self.index = ArchiveIndex(path)
+        self.index.update()
+
+        # Created right away so that readers (like the viewer) know that this directory is an archive
+        path.mkdir(parents=True, exist_ok=True)
+        self.index.path.touch()
+
+        self.volume: Optional[Volume] = None
+        self.lock = asyncio.Lock()
+
+    def exists(self, path: pathlib.Path) -> bool:
+        return self.get_name(path) in self.index.entries
+
+    def open(self, path: pathlib.Path) -> ArchiveWriter:
+        return ArchiveWriter(self, self.get_name(path))
+
+    def iter_names(self) -> Iterator[str]:
+        for entry in self.index.entries.values():
+            yield entry.name
+
+    def get_next_volume_path(self) -> pathlib.Path:
+        numbers = [int(path.stem.rpartition('-')[2]) for path in self.path.glob(f'archive-*.{self.format}') if path.stem[-5:].isdigit()]
+        return self.path / f'archive-{max(numbers, default=-1) + 1:05}.{self.format}'
+
+    def _append(self, tmp: pathlib.Path, name: str, digest: str) -> ArchiveEntry:
+        size = tmp.stat().st_size
+
+        volume = self.volume
+        if volume is not None and volume.count and volume.size + size > self.volume_size:
+            volume.close()
+            volume = None
+
+        if volume is None:
+            volume = self.volume = Volume(self.get_next_volume_path(), self.format)
+            logger.info('Started archive volume %r.', volume.path.name)
+
+        offset = volume.add(tmp, name)
+        return ArchiveEntry(name, volume.path, offset, size, digest)
+
+    async def add(self, tmp: pathlib.Path, name: str, digest: str) -> None:
+        """
+        Archives a finished download, see :class:`ArchiveBackend`.
+
+        Parameters
+        ----------
+        tmp: :class:`pathlib.Path`
+            The staged download.
+        name: :class:`str`
+            The name of the download inside of the archive.
+        digest: :class:`str`
+            The hex SHA-256 digest of the download.
+        """
+        async with self.lock:
+            if name in self.index.entries:
+                return
+
+            existing = self.index.digests.get(digest)
+            if existing is not None:
+                self.index.append(existing._replace(member=name))
+
+                self.duplicates += 1
+                self.saved += existing.size
+
+                logger.info('%r has the same content as %r. Not archiving it again.', name, existing.member)
+                return
+
+            entry = await to_thread(self._append, tmp, name, digest)
+            self.index.append(entry)
+
+    async def close(self) -> None:
+        async with self.lock:
+            if self.volume is not None:
+                self.volume.close()
+                self.volume = None
+
+            self.index.close()
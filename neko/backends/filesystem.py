@@ -0,0 +1,98 @@
+from typing import Iterator, List, Optional
+
+import hashlib
+import pathlib
+
+from ..layout import FlatLayout, Layout
+from ..storage import ContentStore
+from .abc import Backend, Writer
+
+class FileWriter(Writer):
+    def __init__(self, backend: 'FileSystemBackend', path: pathlib.Path) -> None:
+        self.backend = backend
+        self.path = path
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.tmp, self.file = backend.create_staging_file(backend.get_name(path))
+
+        self.sha256 = hashlib.sha256() if backend.store is not None else None
+
+    async def write(self, data: bytes) -> None:
+        self.file.write(data)
+        if self.sha256 is not None:
+            self.sha256.update(data)
+
+    async def commit(self) -> None:
+        self.file.close()
+
+        store = self.backend.store
+        if store is not None and self.sha256 is not None:
+            size = self.tmp.stat().st_size
+            if not store.add(self.tmp, self.path, self.sha256.hexdigest()):
+                self.backend.duplicates += 1
+                self.backend.saved += size
+
+            self.backend.written.append(self.path)
+            return
+
+        try:
+            self.tmp.rename(self.path)
+        except FileExistsError:
+            self.tmp.unlink()
+        else:
+            self.backend.written.append(self.path)
+
+    async def abort(self) -> None:
+        self.file.close()
+        self.tmp.unlink()
+
+class FileSystemBackend(Backend):
+    """
+    Stores every download as a file inside of the output path. This is the default.
+
+    Parameters
+    ----------
+    path: :class:`pathlib.Path`
+        The output path.
+    layout: Optional[:class:`neko.layout.Layout`]
+        The layout of the output path. Defaults to :class:`neko.layout.FlatLayout`.
+    store: Optional[:class:`neko.storage.ContentStore`]
+        If given, files are stored once per unique content and linked into the output path.
+    """
+    NAME = 'filesystem'
+
+    def __init__(self, path: pathlib.Path, *, layout: Optional[Layout] = None, store: Optional[ContentStore] = None) -> None:
+        super().__init__(path)
+
+        self.layout = layout or FlatLayout()
+        self.store = store
+
+        # The files downloaded by this run, the near-duplicate stage only has to look at these
+        self.written: List[pathlib.Path] = []
+
+    def prepare(self) -> int:
+        """
+        Same as :meth:`neko.backends.abc.Backend.prepare`. The first time an output path is used with a staging directory,
+        this also removes the partial downloads that older versions left next to the finished files.
+        """
+        if self.staging.exists():
+            return super().prepare()
+
+        removed = 0
+        for file in self.layout.iter_files(self.path):
+            if file.suffix == '.tmp':
+                file.unlink()
+                removed += 1
+
+        return removed + super().prepare()
+
+    def exists(self, path: pathlib.Path) -> bool:
+        return path.exists()
+
+    def open(self, path: pathlib.Path) -> FileWriter:
+        return FileWriter(self, path)
+
+    def iter_names(self) -> Iterator[str]:
+        for file in self.layout.iter_files(self.path):
+            if file.suffix != '.tmp':
+                yield file.name
@@ -0,0 +1,412 @@
+from typing import Dict, Iterator, List, Mapping, Optional, Set, Tuple
+
+from urllib.parse import quote, unquote, urlsplit
+from xml.etree import ElementTree
+import mimetypes
+import datetime
+import asyncio
+import hashlib
+import aiohttp
+import pathlib
+import logging
+import hmac
+import yarl
+import os
+
+from ..http import SessionOptions, create_session
+from ..utils import get_cache_directory
+from .abc import Backend, Writer
+
+logger = logging.getLogger('neko')
+
+S3_NAMESPACE = '{http://s3.amazonaws.com/doc/2006-03-01/}'
+EMPTY_SHA256 = hashlib.sha256(b'').hexdigest()
+
+# S3 rejects parts smaller than this, except for the last one
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+class S3Error(Exception):
+    def __init__(self, status: int, message: str) -> None:
+        self.status = status
+        self.message = message
+
+        super().__init__(f'{status}: {message}')
+
+def _quote(value: str, safe: str = '-_.~') -> str:
+    return quote(value, safe=safe)
+
+def sign(
+    method: str,
+    url: str,
+    headers: Dict[str, str],
+    payload_hash: str,
+    *,
+    access_key: str,
+    secret_key: str,
+    region: str,
+    service: str = 's3',
+    now: Optional[datetime.datetime] = None,
+) -> Dict[str, str]:
+    """
+    Returns the headers of a request signed with AWS Signature Version 4.
+
+    Parameters
+    ----------
+    method: :class:`str`
+        The HTTP method.
+    url: :class:`str`
+        The URL of the request, including its query string. The path and the query string must already be URL-encoded.
+    headers: :class:`dict`
+        The headers to sign. `Host`, `x-amz-date` and `x-amz-content-sha256` are added.
+    payload_hash: :class:`str`
+        The hex SHA-256 digest of the body.
+    access_key: :class:`str`
+        The access key ID.
+    secret_key: :class:`str`
+        The secret access key.
+    region: :class:`str`
+        The region of the endpoint.
+    service: :class:`str`
+        The service being requested. Defaults to `s3`.
+    now: Optional[:class:`datetime.datetime`]
+        The time of the request. Defaults to the current time.
+    """
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    timestamp = now.strftime('%Y%m%dT%H%M%SZ')
+    date = timestamp[:8]
+
+    parts = urlsplit(url)
+
+    headers = {**headers, 'host': parts.netloc, 'x-amz-date': timestamp, 'x-amz-content-sha256': payload_hash}
+    canonical_headers = sorted((key.lower(), ' '.join(str(value).split())) for key, value in headers.items())
+
+    query: List[Tuple[str, str]] = []
+    for pair in filter(None, parts.query.split('&')):
+        # Re-encoded from the decoded values, encoding them again would sign `%2F` as `%252F`
+        key, _, value = pair.partition('=')
+        query.append((_quote(unquote(key)), _quote(unquote(value))))
+
+    signed_headers = ';'.join(key for key, _ in canonical_headers)
+    canonical_request = '\n'.join([
+        method,
+        parts.path or '/',
+        '&'.join(f'{key}={value}' for key, value in sorted(query)),
+        ''.join(f'{key}:{value}\n' for key, value in canonical_headers),
+        signed_headers,
+        payload_hash,
+    ])
+
+    scope = f'{date}/{region}/{service}/aws4_request'
+    string_to_sign = '\n'.join([
+        'AWS4-HMAC-SHA256', timestamp, scope, hashlib.sha256(canonical_request.encode()).hexdigest()
+    ])
+
+    key = f'AWS4{secret_key}'.encode()
+    for part in (date, region, service, 'aws4_request'):
+        key = hmac.new(key, part.encode(), hashlib.sha256).digest()
+
+    signature = hmac.new(key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+    headers['Authorization'] = (
+        f'AWS4-HMAC-SHA256 Credential={access_key}/{scope}, SignedHeaders={signed_headers}, Signature={signature}'
+    )
+
+    # aiohttp sets the Host header itself
+    del headers['host']
+    return headers
+
+class S3Writer(Writer):
+    """
+    Streams a single download into an S3 object.
+
+    The body is buffered up to `part_size`. Objects that fit in a single part are uploaded with one `PutObject` once
+    they're complete, bigger ones turn into a multipart upload whose parts are uploaded while the rest of the download
+    is still streaming. At most `concurrency` parts are in flight at once and :meth:`write` waits for one of them to
+    finish before buffering another, which bounds the memory used by a transfer to `(concurrency + 1) * part_size`.
+    """
+    def __init__(self, backend: 'S3Backend', key: str, name: str) -> None:
+        self.backend = backend
+        self.key = key
+        self.name = name
+
+        self.buffer = bytearray()
+        self.upload_id: Optional[str] = None
+
+        self.parts: Dict[int, str] = {}
+        self.tasks: List['asyncio.Task[None]'] = []
+        self.slots = asyncio.Semaphore(backend.concurrency)
+
+    async def write(self, data: bytes) -> None:
+        self.buffer.extend(data)
+        if len(self.buffer) >= self.backend.part_size:
+            await self.flush()
+
+    async def flush(self) -> None:
+        for task in self.tasks:
+            # Stops streaming the rest of the download into an upload that already failed
+            if task.done() and not task.cancelled() and task.exception() is not None:
+                raise task.exception() # type: ignore
+
+        if self.upload_id is None:
+            self.upload_id = await self.backend.create_multipart_upload(self.key)
+
+        body = bytes(self.buffer)
+        self.buffer.clear()
+
+        await self.slots.acquire()
+
+        number = len(self.tasks) + 1
+        self.tasks.append(asyncio.create_task(self.upload_part(number, body)))
+
+    async def upload_part(self, number: int, body: bytes) -> None:
+        assert self.upload_id is not None
+        try:
+            self.parts[number] = await self.backend.upload_part(self.key, self.upload_id, number, body)
+        finally:
+            self.slots.release()
+
+    async def commit(self) -> None:
+        if self.upload_id is None:
+            await self.backend.put_object(self.key, bytes(self.buffer))
+        else:
+            if self.buffer:
+                await self.flush()
+
+            try:
+                await asyncio.gather(*self.tasks)
+                await self.backend.complete_multipart_upload(self.key, self.upload_id, self.parts)
+            except BaseException:
+                await self.abort()
+                raise
+
+        self.backend.index_key(self.name)
+
+    async def abort(self) -> None:
+        self.buffer.clear()
+
+        for task in self.tasks:
+            task.cancel()
+
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+        if self.upload_id is not None:
+            try:
+                await self.backend.abort_multipart_upload(self.key, self.upload_id)
+            except (S3Error, aiohttp.ClientError):
+                logger.warning('Failed to abort the upload of %r.', self.key, exc_info=True)
+
+            self.upload_id = None
+
+class S3Backend(Backend):
+    """
+    Uploads downloads straight to an S3-compatible object store (AWS S3, MinIO, ...) without writing them to disk.
+
+    Objects are stored under `prefix` followed by the path of the download relative to the output path. The keys that
+    were uploaded are remembered in a local index inside of the user's cache directory, so existence checks never
+    send a request. The first time a bucket and prefix are used, the index is built by listing the objects under the prefix.
+
+    Parameters
+    ----------
+    path: :class:`pathlib.Path`
+        The output path. Only used to compute the names of downloads.
+    bucket: :class:`str`
+        The bucket to upload to.
+    access_key: :class:`str`
+        The access key ID.
+    secret_key: :class:`str`
+        The secret access key.
+    session_token: Optional[:class:`str`]
+        The session token of temporary credentials.
+    prefix: :class:`str`
+        Prepended to the key of every object. Defaults to an empty string.
+    endpoint: :class:`str`
+        The URL of the service. Defaults to `https://s3.amazonaws.com`.
+    region: :class:`str`
+        The region used for signing requests. Defaults to `us-east-1`.
+    path_style: :class:`bool`
+        Whether to address the bucket as part of the path (`endpoint/bucket/key`), which is what most
+        self-hosted services expect, instead of as part of the host (`bucket.endpoint/key`). Defaults to `True`.
+    part_size: :class:`int`
+        The size of the parts of a multipart upload in bytes. Defaults to 8 MiB, the minimum is 5 MiB.
+    concurrency: :class:`int`
+        The maximum amount of parts of a single download that are uploaded at once. Defaults to 4.
+    session_options: Optional[:class:`neko.http.SessionOptions`]
+        The settings of the session used to talk to the service. It's separate from the session of the downloads.
+    """
+    NAME = 's3'
+
+    def __init__(
+        self,
+        path: pathlib.Path,
+        *,
+        bucket: str,
+        access_key: str,
+        secret_key: str,
+        session_token: Optional[str] = None,
+        prefix: str = '',
+        endpoint: str = 'https://s3.amazonaws.com',
+        region: str = 'us-east-1',
+        path_style: bool = True,
+        part_size: int = 8 * 1024 * 1024,
+        concurrency: int = 4,
+        session_options: Optional[SessionOptions] = None,
+    ) -> None:
+        super().__init__(path)
+
+        self.bucket = bucket
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.session_token = session_token
+        self.prefix = prefix
+        self.endpoint = endpoint.rstrip('/')
+        self.region = region
+        self.path_style = path_style
+        self.part_size = max(part_size, MIN_PART_SIZE)
+        self.concurrency = max(concurrency, 1)
+        self.session_options = session_options
+
+        key = hashlib.sha1(f'{self.endpoint}\n{bucket}\n{prefix}'.encode()).hexdigest()[:16]
+        self.index_path = get_cache_directory('s3') / f'{key}.index'
+
+        self.keys: Set[str] = set()
+        self.session: Optional[aiohttp.ClientSession] = None
+
+    def get_url(self, key: str = '', query: str = '') -> str:
+        path = _quote(key, safe='-_.~/')
+        if self.path_style:
+            url = f'{self.endpoint}/{self.bucket}/{path}'
+        else:
+            scheme, _, host = self.endpoint.partition('://')
+            url = f'{scheme}://{self.bucket}.{host}/{path}'
+
+        return f'{url}?{query}' if query else url
+
+    async def request(
+        self,
+        method: str,
+        key: str = '',
+        *,
+        query: str = '',
+        body: bytes = b'',
+        headers: Optional[Dict[str, str]] = None
+    ) -> Tuple[Mapping[str, str], bytes]:
+        """
+        Sends a signed request and returns the headers and the body of the response.
+        Raises :class:`S3Error` if the service responded with an error.
+        """
+        assert self.session is not None
+
+        url = self.get_url(key, query)
+        headers = dict(headers or {})
+        if self.session_token is not None:
+            headers['x-amz-security-token'] = self.session_token
+
+        signed = sign(
+            method, url, headers, hashlib.sha256(body).hexdigest() if body else EMPTY_SHA256,
+            access_key=self.access_key, secret_key=self.secret_key, region=self.region,
+        )
+
+        # The query string is already encoded and signed as is, so it must not be encoded again
+        async with self.session.request(method, yarl.URL(url, encoded=True), data=body or None, headers=signed) as response:
+            data = await response.read()
+            if response.status >= 300:
+                raise S3Error(response.status, data.decode(errors='replace'))
+
+            return response.headers, data
+
+    async def put_object(self, key: str, body: bytes) -> None:
+        content_type = mimetypes.guess_type(key)[0] or 'application/octet-stream'
+        await self.request('PUT', key, body=body, headers={'Content-Type': content_type})
+
+    async def create_multipart_upload(self, key: str) -> str:
+        content_type = mimetypes.guess_type(key)[0] or 'application/octet-stream'
+        _, data = await self.request('POST', key, query='uploads=', headers={'Content-Type': content_type})
+
+        upload_id = ElementTree.fromstring(data).findtext(f'{S3_NAMESPACE}UploadId')
+        if not upload_id:
+            raise S3Error(200, 'CreateMultipartUpload did not return an upload ID')
+
+        return upload_id
+
+    async def upload_part(self, key: str, upload_id: str, number: int, body: bytes) -> str:
+        headers, _ = await self.request('PUT', key, query=f'partNumber={number}&uploadId={_quote(upload_id)}', body=body)
+        return headers['ETag']
+
+    async def complete_multipart_upload(self, key: str, upload_id: str, parts: Dict[int, str]) -> None:
+        body = ''.join(
+            f'<Part><PartNumber>{number}</PartNumber><ETag>{etag}</ETag></Part>' for number, etag in sorted(parts.items())
+        )
+
+        payload = f'<CompleteMultipartUpload>{body}</CompleteMultipartUpload>'.encode()
+        _, data = await self.request('POST', key, query=f'uploadId={_quote(upload_id)}', body=payload)
+
+        # Errors that happen after the upload started are reported with a 200 status
+        if b'<Error>' in data:
+            raise S3Error(200, data.decode(errors='replace'))
+
+    async def abort_multipart_upload(self, key: str, upload_id: str) -> None:
+        await self.request('DELETE', key, query=f'uploadId={_quote(upload_id)}')
+
+    async def list_keys(self) -> List[str]:
+        keys: List[str] = []
+        token: Optional[str] = None
+
+        while True:
+            query = f'list-type=2&prefix={_quote(self.prefix)}'
+            if token is not None:
+                query += f'&continuation-token={_quote(token)}'
+
+            _, data = await self.request('GET', query=query)
+
+            root = ElementTree.fromstring(data)
+            keys.extend(element.text or '' for element in root.iter(f'{S3_NAMESPACE}Key'))
+
+            token = root.findtext(f'{S3_NAMESPACE}NextContinuationToken')
+            if root.findtext(f'{S3_NAMESPACE}IsTruncated') != 'true' or not token:
+                return keys
+
+    def get_key(self, name: str) -> str:
+        return f'{self.prefix}{name}'
+
+    def index_key(self, name: str) -> None:
+        self.keys.add(name)
+        with self.index_path.open('a') as file:
+            file.write(name + '\n')
+
+    def prepare(self) -> int:
+        return 0 # Nothing is staged on disk
+
+    async def start(self) -> None:
+        self.session = create_session(self.session_options)
+
+        if self.index_path.exists():
+            with self.index_path.open('r') as file:
+                self.keys.update(line.rstrip('\n') for line in file if line.strip())
+
+            return
+
+        logger.info('Building the local index of s3://%s/%s.', self.bucket, self.prefix)
+        names = [key[len(self.prefix):] for key in await self.list_keys() if key.startswith(self.prefix)]
+
+        self.keys.update(names)
+
+        tmp = self.index_path.with_suffix('.tmp')
+        with tmp.open('w') as file:
+            file.writelines(name + '\n' for name in names)
+
+        os.replace(tmp, self.index_path)
+
+    def exists(self, path: pathlib.Path) -> bool:
+        return self.get_name(path) in self.keys
+
+    def open(self, path: pathlib.Path) -> S3Writer:
+        name = self.get_name(path)
+        return S3Writer(self, self.get_key(name), name)
+
+    def iter_names(self) -> Iterator[str]:
+        for name in self.keys:
+            yield name.rpartition('/')[2]
+
+    async def close(self) -> None:
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
@@ -0,0 +1,156 @@
+from typing import Any, Iterable, Mapping, NamedTuple, Optional, Tuple, Union
+
+from collections import OrderedDict
+import hashlib
+import pathlib
+import logging
+import shutil
+import json
+import time
+
+from .utils import get_cache_directory
+
+logger = logging.getLogger('neko')
+
+Params = Union[Mapping[str, Any], Iterable[Tuple[str, Any]], None]
+
+# Categories barely ever change, so there is no need to ask for them more than once a day.
+CATEGORIES_TTL = 24 * 60 * 60
+
+class CachedResponse(NamedTuple):
+    data: Any
+    created: float
+    ttl: float
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
+    @property
+    def is_fresh(self) -> bool:
+        return time.time() - self.created < self.ttl
+
+    def get_revalidation_headers(self) -> Mapping[str, str]:
+        """
+        Returns the conditional request headers used to revalidate this response once it has expired.
+        """
+        headers = {}
+        if self.etag is not None:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified is not None:
+            headers['If-Modified-Since'] = self.last_modified
+
+        return headers
+
+class ResponseCache:
+    """
+    An on-disk cache for JSON responses with a small in-memory LRU in front of it.
+
+    Entries are never dropped once they expire since they can still be revalidated with the
+    `ETag` and `Last-Modified` headers that were sent along with the original response.
+
+    Parameters
+    ----------
+    path: Optional[:class:`pathlib.Path`]
+        The directory where responses are stored. Defaults to `responses` inside of the user's cache directory.
+    max_size: :class:`int`
+        The maximum amount of responses kept in memory. Defaults to 64.
+    """
+    def __init__(self, path: Optional[pathlib.Path] = None, *, max_size: int = 64) -> None:
+        self.path = path or get_cache_directory('responses')
+        self.max_size = max_size
+
+        self.memory: 'OrderedDict[str, CachedResponse]' = OrderedDict()
+
+    @staticmethod
+    def make_key(method: str, url: str, params: Params = None) -> str:
+        """
+        Creates a cache key from the method, URL and query parameters of a request.
+
+        Parameters
+        ----------
+        method: :class:`str`
+            The HTTP method.
+        url: :class:`str`
+            The URL being requested.
+        params: Optional[Union[:class:`dict`, :class:`list`]]
+            The query parameters of the request.
+        """
+        if params is None:
+            items = []
+        elif isinstance(params, Mapping):
+            items = sorted((str(key), str(value)) for key, value in params.items())
+        else:
+            items = sorted((str(key), str(value)) for key, value in params)
+
+        raw = json.dumps([method.upper(), url, items])
+        return hashlib.sha1(raw.encode()).hexdigest()
+
+    def get_path(self, key: str) -> pathlib.Path:
+        return self.path / key[:2] / f'{key}.json'
+
+    def _remember(self, key: str, response: CachedResponse) -> None:
+        self.memory[key] = response
+        self.memory.move_to_end(key)
+
+        if len(self.memory) > self.max_size:
+            self.memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        """
+        Returns the cached response for the given key, whether or not it's still fresh.
+
+        Parameters
+        ----------
+        key: :class:`str`
+            The key returned by :meth:`make_key`.
+        """
+        response = self.memory.get(key)
+        if response is not None:
+            self.memory.move_to_end(key)
+            return response
+
+        path = self.get_path(key)
+        try:
+            with path.open('r') as file:
+                response = CachedResponse(**json.load(file))
+        except FileNotFoundError:
+            return None
+        except (ValueError, TypeError):
+            logger.warning('Ignoring corrupted cache entry %r.', path.name)
+            return None
+
+        self._remember(key, response)
+        return response
+
+    def set(self, key: str, response: CachedResponse) -> None:
+        """
+        Stores a response both in memory and on disk.
+
+        Parameters
+        ----------
+        key: :class:`str`
+            The key returned by :meth:`make_key`.
+        response: :class:`CachedResponse`
+            The response to store.
+        """
+        self._remember(key, response)
+
+        path = self.get_path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        tmp = path.with_suffix('.tmp')
+        try:
+            with tmp.open('w') as file:
+                json.dump(response._asdict(), file)
+
+            tmp.replace(path)
+        except (OSError, TypeError):
+            logger.warning('Failed to write cache entry %r.', path.name, exc_info=True)
+
+    def clear(self) -> None:
+        """
+        Removes every cached response.
+        """
+        self.memory.clear()
+        shutil.rmtree(self.path, ignore_errors=True)
+
+        self.path.mkdir(parents=True, exist_ok=True)
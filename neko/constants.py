@@ -0,0 +1,8 @@
+# Shared by the command line parser and the modules that use these values. This module must not import
+# anything, `neko-cli --version` loads it.
+
+# From the biggest to the smallest rendition, see `neko.providers.abc.Provider.select_rendition`
+QUALITIES = ('original', 'large', 'sample', 'thumb')
+
+# The kinds of files `neko.filters.DownloadFilter` can filter on
+MEDIA_TYPES = ('image', 'gif', 'video')
@@ -1,11 +1,15 @@
-from typing import Mapping, Optional, Tuple, Dict
+from typing import Iterable, Mapping, Optional, Tuple, Dict
 
 import multidict
 import aiohttp
 import pathlib
 import asyncio
 import logging
+import time
 
+from .backends import Backend, FileSystemBackend
+from .filters import BudgetExhausted, DownloadFilter, DownloadRejected
+from .layout import FlatLayout, Layout
 from .providers import Provider
 from .utils import Colors, format_exception
 
@@ -15,12 +19,51 @@ VALID_EXTENSIONS: Tuple[str, ...] = (
     'jpg', 'jpeg', 'png', 'gif', 'webm', 'mp4'
 )
 
+WARM_UP_TIMEOUT = aiohttp.ClientTimeout(total=10)
+
 def _transform_headers(headers: multidict.CIMultiDictProxy[str]) -> Mapping[str, str]:
     # I do this in order to suppress the type errors
     return {key: value for key, value in headers.items()}
 
+async def warm_up(
+    session: aiohttp.ClientSession,
+    hosts: Iterable[str],
+    *,
+    connections: int = 2,
+    headers: Optional[Dict[str, str]] = None
+) -> int:
+    """
+    Opens keep-alive connections to the given hosts ahead of time by sending `HEAD /` requests, so that the first
+    downloads don't have to wait for DNS, TCP and TLS. The connections go back into the pool of the session once
+    the responses arrive, whatever their status. This function returns the amount of opened connections.
+
+    Parameters
+    ----------
+    session: :class:`aiohttp.ClientSession`
+        The session the downloads are going to use.
+    hosts: Iterable[:class:`str`]
+        The hosts to connect to.
+    connections: :class:`int`
+        The amount of connections to open to every host. Defaults to 2.
+    headers: Optional[:class:`dict`]
+        Extra headers to send with the requests.
+    """
+    async def connect(host: str) -> bool:
+        try:
+            async with session.head(f'https://{host}/', headers=headers, allow_redirects=False, timeout=WARM_UP_TIMEOUT):
+                return True
+        except Exception as e: # Warming up is best effort, the downloads report their own errors
+            logger.info('Failed to warm up a connection to %r: %r', host, e)
+            return False
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*[connect(host) for host in hosts for _ in range(connections)])
+
+    logger.info('Warmed up %d connections in %.2fs.', sum(results), time.perf_counter() - start)
+    return sum(results)
+
 class Downloader:
-    __slots__ = ('provider', 'path', 'headers')
+    __slots__ = ('provider', 'path', 'headers', 'layout', 'backend', 'filter', 'rejected')
 
     def __init__(
         self, 
@@ -28,15 +71,65 @@ class Downloader:
         path: pathlib.Path,
         *,
         headers: Optional[Dict[str, str]] = None,
+        layout: Optional[Layout] = None,
+        backend: Optional[Backend] = None,
+        filter: Optional[DownloadFilter] = None,
     ) -> None:
         self.path = path
         self.provider = provider
         self.headers = headers or {}
+        self.layout = layout or FlatLayout()
+        self.backend = backend or FileSystemBackend(path, layout=self.layout)
+        self.filter = filter
+
+        self.rejected = 0
 
     @property
     def session(self) -> aiohttp.ClientSession:
         return self.provider.session
     
+    def exists(self, path: pathlib.Path) -> bool:
+        """
+        Returns whether or not something was already downloaded to the given path, see :meth:`Backend.exists`.
+
+        Parameters
+        ----------
+        path: :class:`pathlib.Path`
+            The download path.
+        """
+        return self.backend.exists(path)
+
+    def check_filters(self, url: str) -> Optional[str]:
+        """
+        Returns why the image at the given URL is filtered out according to the metadata of the provider,
+        or `None` if it may be downloaded. This doesn't send any requests.
+
+        Parameters
+        ----------
+        url: :class:`str`
+            The URL of the file.
+        """
+        if self.filter is None:
+            return None
+
+        reason = self.filter.check_metadata(self.provider.get_metadata(url))
+        if reason is not None:
+            self.rejected += 1
+
+        return reason
+
+    def get_expected_size(self, url: str) -> Optional[int]:
+        """
+        Returns the size of the file at the given URL as reported by the provider, if known.
+
+        Parameters
+        ----------
+        url: :class:`str`
+            The URL of the file.
+        """
+        metadata = self.provider.get_metadata(url)
+        return metadata.size if metadata is not None else None
+
     def get_file_extension_from_header(self, content_type: str) -> str:
         """
         Parses the file extension from a Content-Type header.
@@ -51,7 +144,7 @@ class Downloader:
 
     def get_download_path(self, identifier: str, extension: str) -> pathlib.Path:
         """
-        Gets the download path from an identifier and file extension.
+        Gets the download path from an identifier and file extension, see :class:`Layout`.
         The :class:`pathlib.Path` may not exist.
 
         Parameters
@@ -62,7 +155,9 @@ class Downloader:
             The extension of the file.
         """
         extension = extension if extension.startswith('.') else f'.{extension}'
-        return (self.path / identifier).with_suffix(extension)
+        name = pathlib.PurePath(identifier).with_suffix(extension).name
+
+        return self.layout.get_path(self.path, name)
 
     def has_extension(self, identifier: str) -> bool:
         """
@@ -91,7 +186,7 @@ class Downloader:
             extension = self.get_file_extension_from_header(headers['Content-Type'])
             path = self.get_download_path(identifier, extension)
         else:
-            path = self.path / identifier
+            path = self.layout.get_path(self.path, identifier)
 
         return path
 
@@ -126,11 +221,12 @@ class Downloader:
 
             yield chunk
 
-    async def write(self, path: pathlib.Path, response: aiohttp.ClientResponse) -> None:
+    async def write(self, path: pathlib.Path, response: aiohttp.ClientResponse, *, reserved: int = 0) -> bool:
         """
-        Writes the response to the given path.
-        This creates a temporary file and then if the download succeeds, renames it to the final path else
-        it deletes the file.
+        Writes the response to the given path through the backend.
+        The response is streamed into a temporary file inside of the staging directory and if the download succeeds,
+        the backend moves it into place (or into an archive) else it deletes the file.
+        This function returns a boolean indicating whether or not the download succeeded.
 
         Parameters
         ----------
@@ -138,22 +234,40 @@ class Downloader:
             The path to write to.
         response: :class:`aiohttp.ClientResponse`
             The response to write.
+        reserved: :class:`int`
+            The amount of bytes reserved for this download in the byte budget of :attr:`filter`.
         """
-        tmp = path.with_suffix('.tmp')
+        writer = self.backend.open(path)
+        streamed = 0
         try:
-            with tmp.open('wb') as file:
-                async for chunk in self.chunk(response):
-                    file.write(chunk)
-
-            logger.info('Successfully downloaded %r', path.name)
+            async for chunk in self.chunk(response):
+                streamed += len(chunk)
+                if self.filter is not None and streamed > reserved:
+                    self.filter.consume(min(len(chunk), streamed - reserved))
+
+                await writer.write(chunk)
+        except DownloadRejected:
+            await writer.abort()
+            raise
         except Exception as e:
-            tmp.unlink()
+            await writer.abort()
             logger.exception('Failed to download %r', path.name, exc_info=e)
-        else:
-            try:
-                tmp.rename(path)
-            except FileExistsError:
-                pass
+
+            if self.filter is not None and reserved > streamed:
+                self.filter.release(reserved - streamed)
+
+            return False
+
+        try:
+            await writer.commit()
+        finally:
+            # The body can be shorter than its Content-Length, e.g. when it was sent compressed
+            if self.filter is not None and reserved > streamed:
+                self.filter.release(reserved - streamed)
+
+        logger.info('Successfully downloaded %r', path.name)
+
+        return True
 
     async def fetch_download_path(self, url: str) -> pathlib.Path:
         """
@@ -186,12 +300,22 @@ class Downloader:
         """
         Downloads the given URL.
         This function returns a boolean indicating whether or not the downloaded succeeded.
+        Raises :class:`neko.filters.DownloadRejected` if the file doesn't pass :attr:`filter`, in which case
+        the body of the response is never read.
 
         Parameters
         -----------
         url: :class:`str`
             The URL of the file.
         """
+        if self.filter is not None:
+            if self.filter.exhausted is not None:
+                raise BudgetExhausted(self.filter.exhausted)
+
+            reason = self.check_filters(url)
+            if reason is not None:
+                raise DownloadRejected(reason)
+
         async with self.session.get(url, headers=self.headers) as response:
             identifier = self.provider.get_identifier_from_url(url)
             if response.status != 200:
@@ -208,7 +332,16 @@ class Downloader:
                 logger.error('Failed to download %r with status code %d (invalid extension %r)', identifier, response.status, extension)
                 return False
 
-            path = self.get_download_path_from_headers(identifier, _transform_headers(response.headers))
-            await self.write(path, response)
+            reserved = 0
+            if self.filter is not None:
+                headers = _transform_headers(response.headers)
 
-        return True
+                reason = self.filter.check_headers(headers)
+                if reason is not None:
+                    self.rejected += 1
+                    raise DownloadRejected(reason)
+
+                reserved = self.filter.reserve(self.filter.get_content_length(headers))
+
+            path = self.get_download_path_from_headers(identifier, _transform_headers(response.headers))
+            return await self.write(path, response, reserved=reserved)
@@ -0,0 +1,208 @@
+from typing import TYPE_CHECKING, Mapping, Optional, Tuple
+
+import pathlib
+import shutil
+import logging
+
+from .constants import MEDIA_TYPES
+
+if TYPE_CHECKING:
+    from .providers.abc import ImageMetadata
+
+logger = logging.getLogger('neko')
+
+class DownloadRejected(Exception):
+    """
+    Raised by :meth:`neko.downloader.Downloader.download` when a download doesn't pass the filters.
+    Nothing was written and retrying won't change the outcome.
+    """
+    def __init__(self, reason: str) -> None:
+        self.reason = reason
+        super().__init__(reason)
+
+class BudgetExhausted(DownloadRejected):
+    """
+    Raised once the byte budget of the job is used up or the disk is about to be full.
+    Every download started after this is rejected as well.
+    """
+
+def get_media_type(content_type: str) -> Optional[str]:
+    content_type = content_type.split(';', 1)[0].strip().lower()
+    if content_type == 'image/gif':
+        return 'gif'
+
+    kind = content_type.split('/', 1)[0]
+    return kind if kind in ('image', 'video') else None
+
+class DownloadFilter:
+    """
+    Decides whether an image is worth downloading before its content is streamed.
+
+    Images are first checked against the metadata their provider reported (file size, dimensions, content type) and,
+    once the response of the download arrived, against its `Content-Length` and `Content-Type` headers. Limits that
+    can't be checked because the value is unknown are ignored.
+
+    The byte budget is shared by every download of the job. Downloads with a `Content-Length` reserve their size up front,
+    so a download never starts if it wouldn't fit. Downloads without one are counted as they stream and are aborted
+    if they go over the budget.
+
+    Parameters
+    ----------
+    path: :class:`pathlib.Path`
+        The output path, used to check the free disk space.
+    min_size: Optional[:class:`int`]
+        The minimum size of a file in bytes.
+    max_size: Optional[:class:`int`]
+        The maximum size of a file in bytes.
+    max_width: Optional[:class:`int`]
+        The maximum width of an image in pixels.
+    max_height: Optional[:class:`int`]
+        The maximum height of an image in pixels.
+    media_types: Optional[Tuple[:class:`str`, ...]]
+        The media types to download, any of :data:`neko.constants.MEDIA_TYPES`. Defaults to all of them.
+    budget: Optional[:class:`int`]
+        The maximum amount of bytes to download during the job.
+    min_free_space: Optional[:class:`int`]
+        The amount of bytes that must stay free on the disk of the output path.
+    """
+    def __init__(
+        self,
+        path: pathlib.Path,
+        *,
+        min_size: Optional[int] = None,
+        max_size: Optional[int] = None,
+        max_width: Optional[int] = None,
+        max_height: Optional[int] = None,
+        media_types: Optional[Tuple[str, ...]] = None,
+        budget: Optional[int] = None,
+        min_free_space: Optional[int] = None,
+    ) -> None:
+        if media_types is not None and not set(media_types) <= set(MEDIA_TYPES):
+            raise ValueError(f'media_types must only contain {", ".join(MEDIA_TYPES)}')
+
+        self.path = path
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_width = max_width
+        self.max_height = max_height
+        self.media_types = media_types
+        self.budget = budget
+        self.min_free_space = min_free_space
+
+        self.used = 0
+        self.exhausted: Optional[str] = None
+
+    def check_size(self, size: Optional[int]) -> Optional[str]:
+        if size is None:
+            return None
+
+        if self.min_size is not None and size < self.min_size:
+            return f'{size} bytes is below the minimum size'
+        if self.max_size is not None and size > self.max_size:
+            return f'{size} bytes is above the maximum size'
+
+        return None
+
+    def check_content_type(self, content_type: Optional[str]) -> Optional[str]:
+        if content_type is None or self.media_types is None:
+            return None
+
+        media_type = get_media_type(content_type)
+        if media_type not in self.media_types:
+            return f'{content_type!r} is not an allowed media type'
+
+        return None
+
+    def check_metadata(self, metadata: 'Optional[ImageMetadata]') -> Optional[str]:
+        """
+        Returns why an image should be skipped according to the metadata of its provider or `None` if it may be downloaded.
+
+        Parameters
+        ----------
+        metadata: Optional[:class:`neko.providers.abc.ImageMetadata`]
+            The metadata of the image, see :meth:`neko.providers.abc.Provider.get_metadata`.
+        """
+        if metadata is None:
+            return None
+
+        if self.max_width is not None and metadata.width is not None and metadata.width > self.max_width:
+            return f'{metadata.width}px is wider than the maximum width'
+        if self.max_height is not None and metadata.height is not None and metadata.height > self.max_height:
+            return f'{metadata.height}px is taller than the maximum height'
+
+        return self.check_size(metadata.size) or self.check_content_type(metadata.content_type)
+
+    def check_headers(self, headers: Mapping[str, str]) -> Optional[str]:
+        """
+        Returns why a download should be skipped according to its response headers or `None` if it may be streamed.
+
+        Parameters
+        ----------
+        headers: Mapping[:class:`str`, :class:`str`]
+            The headers of the response.
+        """
+        return self.check_size(self.get_content_length(headers)) or self.check_content_type(headers.get('Content-Type'))
+
+    @staticmethod
+    def get_content_length(headers: Mapping[str, str]) -> Optional[int]:
+        try:
+            return int(headers['Content-Length'])
+        except (KeyError, ValueError):
+            return None
+
+    def exhaust(self, reason: str) -> BudgetExhausted:
+        if self.exhausted is None:
+            logger.warning('Stopping: %s.', reason)
+            self.exhausted = reason
+
+        return BudgetExhausted(reason)
+
+    def reserve(self, size: Optional[int]) -> int:
+        """
+        Reserves room for a download that is about to be streamed and returns the amount of reserved bytes.
+        Raises :class:`BudgetExhausted` if the download doesn't fit in the budget or on the disk.
+
+        Parameters
+        ----------
+        size: Optional[:class:`int`]
+            The size of the download, if known.
+        """
+        if self.exhausted is not None:
+            raise BudgetExhausted(self.exhausted)
+
+        if self.min_free_space is not None:
+            free = shutil.disk_usage(self.path).free
+            if free - (size or 0) < self.min_free_space:
+                raise self.exhaust(f'only {free} bytes of disk space are left')
+
+        if self.budget is None or size is None:
+            return 0
+
+        if self.used + size > self.budget:
+            raise self.exhaust(f'the byte budget of {self.budget} bytes is used up')
+
+        self.used += size
+        return size
+
+    def consume(self, size: int) -> None:
+        """
+        Counts bytes that were streamed past the reservation of a download.
+        Raises :class:`BudgetExhausted` if this goes over the budget.
+
+        Parameters
+        ----------
+        size: :class:`int`
+            The amount of bytes.
+        """
+        if self.budget is None:
+            return
+
+        self.used += size
+        if self.used > self.budget:
+            raise self.exhaust(f'the byte budget of {self.budget} bytes is used up')
+
+    def release(self, size: int) -> None:
+        """
+        Gives back the part of a reservation that wasn't streamed because the download failed.
+        """
+        self.used -= size
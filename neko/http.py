@@ -0,0 +1,89 @@
+from typing import Any, Dict, Mapping, NamedTuple, Optional
+
+import aiohttp
+
+class SessionOptions(NamedTuple):
+    """
+    The connection pool and timeout settings of the session shared by a provider and its downloads.
+    The defaults match aiohttp's, except for DNS results and idle connections being kept around longer.
+
+    Attributes
+    ----------
+    limit: :class:`int`
+        The maximum amount of open connections. 0 means unlimited.
+    limit_per_host: :class:`int`
+        The maximum amount of open connections to a single host. 0 means unlimited.
+    dns_cache_ttl: :class:`float`
+        The amount of seconds resolved hosts are cached for. 0 disables the cache.
+    keepalive_timeout: :class:`float`
+        The amount of seconds an idle connection is kept open for.
+    connect_timeout: :class:`float`
+        The maximum amount of seconds to wait for a connection to be established. 0 disables the timeout.
+    read_timeout: :class:`float`
+        The maximum amount of seconds to wait between two reads of a response. 0 disables the timeout.
+    total_timeout: :class:`float`
+        The maximum amount of seconds a whole request, including reading its body, may take. 0 disables the timeout.
+    """
+    limit: int = 100
+    limit_per_host: int = 0
+    dns_cache_ttl: float = 300
+    keepalive_timeout: float = 60
+    connect_timeout: float = 30
+    read_timeout: float = 0
+    total_timeout: float = 300
+
+    @classmethod
+    def from_config(cls, config: Mapping[str, Any], **overrides: Any) -> 'SessionOptions':
+        """
+        Creates the options from the `[http]` table of a config file, see :attr:`_fields` for the keys.
+        Keyword arguments that aren't `None` take precedence over the config.
+
+        Parameters
+        ----------
+        config: Mapping[:class:`str`, Any]
+            The table.
+        **overrides: Any
+            The options given on the command line.
+        """
+        unknown = set(config) - set(cls._fields)
+        if unknown:
+            raise ValueError(f'Unknown http options: {", ".join(sorted(unknown))}')
+
+        values: Dict[str, Any] = dict(config)
+        values.update((key, value) for key, value in overrides.items() if value is not None)
+
+        for key, value in values.items():
+            if not isinstance(value, (int, float)) or isinstance(value, bool) or value < 0:
+                raise ValueError(f'http.{key} must be a non-negative number')
+
+        return cls(**values)
+
+    def get_timeout(self) -> aiohttp.ClientTimeout:
+        return aiohttp.ClientTimeout(
+            total=self.total_timeout or None, sock_connect=self.connect_timeout or None, sock_read=self.read_timeout or None
+        )
+
+def create_session(options: Optional[SessionOptions] = None, *, headers: Optional[Dict[str, str]] = None) -> aiohttp.ClientSession:
+    """
+    Creates a session with its own connection pool.
+
+    Headers that only matter to a single provider (like Reddit's User-Agent) don't belong here,
+    see :attr:`neko.providers.abc.Provider.headers`.
+
+    Parameters
+    ----------
+    options: Optional[:class:`SessionOptions`]
+        The pool and timeout settings. Defaults to :class:`SessionOptions` with its defaults.
+    headers: Optional[:class:`dict`]
+        Headers sent with every request of the session.
+    """
+    options = options or SessionOptions()
+    connector = aiohttp.TCPConnector(
+        limit=options.limit,
+        limit_per_host=options.limit_per_host,
+        use_dns_cache=options.dns_cache_ttl > 0,
+        ttl_dns_cache=options.dns_cache_ttl or None,
+        keepalive_timeout=options.keepalive_timeout,
+    )
+
+    return aiohttp.ClientSession(connector=connector, timeout=options.get_timeout(), headers=headers)
@@ -0,0 +1,139 @@
+from typing import ClassVar, Dict, Iterator, Optional, Type
+
+from abc import ABC, abstractmethod
+import hashlib
+import pathlib
+import json
+import os
+
+# Remembers the layout of an output directory so that later runs (and the viewer) don't have to be told again
+MARKER = '.neko-layout'
+
+class Layout(ABC):
+    """
+    Decides where a file goes inside of an output directory.
+
+    The path of a file only depends on its name (plus, for some layouts, the provider and category), which means
+    checking whether a file was already downloaded is still a single `stat` no matter how many files there are.
+    """
+    NAME: ClassVar[str]
+
+    @abstractmethod
+    def get_relative_path(self, name: str) -> pathlib.PurePath:
+        """
+        Returns the path of a file relative to the output directory.
+
+        Parameters
+        ----------
+        name: :class:`str`
+            The name of the file, including its extension.
+        """
+        raise NotImplementedError
+
+    def get_path(self, root: pathlib.Path, name: str) -> pathlib.Path:
+        return root / self.get_relative_path(name)
+
+    def iter_files(self, root: pathlib.Path) -> Iterator[pathlib.Path]:
+        """
+        Yields every file inside of an output directory, skipping hidden files and directories.
+
+        Parameters
+        ----------
+        root: :class:`pathlib.Path`
+            The output directory.
+        """
+        stack = [root]
+        while stack:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    if entry.name.startswith('.'):
+                        continue
+
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(pathlib.Path(entry.path))
+                    elif entry.is_file():
+                        yield pathlib.Path(entry.path)
+
+class FlatLayout(Layout):
+    """
+    Every file is written directly into the output directory. This is the default.
+    """
+    NAME = 'flat'
+
+    def get_relative_path(self, name: str) -> pathlib.PurePath:
+        return pathlib.PurePath(name)
+
+    def iter_files(self, root: pathlib.Path) -> Iterator[pathlib.Path]:
+        for path in root.iterdir():
+            if not path.name.startswith('.') and path.is_file():
+                yield path
+
+class HashLayout(Layout):
+    """
+    Files are spread over `ab/cd/` shards taken from the hash of their name, which keeps every directory
+    at a few files even with millions of downloads.
+    The extension isn't part of the hash so that a file ends up in the same shard no matter which extension it's given.
+    """
+    NAME = 'hash'
+
+    def get_relative_path(self, name: str) -> pathlib.PurePath:
+        stem = name.rsplit('.', 1)[0]
+        digest = hashlib.md5(stem.encode()).hexdigest()
+
+        return pathlib.PurePath(digest[:2], digest[2:4], name)
+
+class TreeLayout(Layout):
+    """
+    Files are grouped by provider and then by category, e.g. `waifu.im/maid/<name>`.
+
+    Parameters
+    ----------
+    provider: :class:`str`
+        The name of the provider.
+    category: Optional[:class:`str`]
+        The category being downloaded. Providers without categories use `uncategorized`.
+    """
+    NAME = 'tree'
+
+    def __init__(self, provider: str, category: Optional[str]) -> None:
+        self.provider = self.sanitize(provider)
+        self.category = self.sanitize(category or 'uncategorized')
+
+    @staticmethod
+    def sanitize(segment: str) -> str:
+        segment = segment.replace('/', '_').replace('\\', '_')
+        return segment.lstrip('.') or '_'
+
+    def get_relative_path(self, name: str) -> pathlib.PurePath:
+        return pathlib.PurePath(self.provider, self.category, name)
+
+LAYOUTS: Dict[str, Type[Layout]] = {
+    FlatLayout.NAME: FlatLayout,
+    HashLayout.NAME: HashLayout,
+    TreeLayout.NAME: TreeLayout,
+}
+
+def create_layout(name: str, *, provider: str, category: Optional[str]) -> Layout:
+    if name == TreeLayout.NAME:
+        return TreeLayout(provider, category)
+
+    return LAYOUTS[name]()
+
+def read_layout(root: pathlib.Path) -> Optional[str]:
+    """
+    Returns the name of the layout an output directory was created with or `None` if it doesn't have one yet.
+
+    Parameters
+    ----------
+    root: :class:`pathlib.Path`
+        The output directory.
+    """
+    try:
+        with (root / MARKER).open('r') as file:
+            return json.load(file)['layout']
+    except (FileNotFoundError, ValueError, KeyError, TypeError):
+        return None
+
+def write_layout(root: pathlib.Path, name: str) -> None:
+    with (root / MARKER).open('w') as file:
+        json.dump({'layout': name}, file)
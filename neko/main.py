@@ -1,4 +1,4 @@
-from typing import Set, Any, Dict, TextIO
+from typing import List, Optional, Set, Any, Dict, TextIO, Tuple
 
 import aiohttp
 import pathlib
@@ -6,24 +6,32 @@ import argparse
 import asyncio
 import toml
 import json
+import subprocess
 import logging
 import sys
+import os
 
 from . import __version__
-from .downloader import Downloader
-from .providers import ALL_PROVIDERS, get_providers_that_require_extras
-from .utils import Colors, chunk as _chunk, get_input
-from .viewer import Application as ImageViewer
+from .cache import ResponseCache
+from .backends import ArchiveBackend, Backend, FileSystemBackend, S3Backend, S3Error
+from .downloader import Downloader, warm_up
+from .http import SessionOptions, create_session
+from .scheduler import FairScheduler
+from .filters import BudgetExhausted, DownloadFilter, DownloadRejected
+from .layout import FlatLayout, create_layout, read_layout, write_layout
+from .seen import SeenSet, get_seen_path
+from .storage import ContentStore
+from .providers import ALL_PROVIDERS, Provider, get_provider
+from .utils import Colors, get_input, parse_size, to_thread
 from .log import create_logger
 
-REQUIRE_EXTRAS = get_providers_that_require_extras()
-
 class State:
     def __init__(self, downloader: Downloader, logger: logging.Logger) -> None:
         self.downloader = downloader
         self.logger = logger
 
         self.successful = 0
+        self.completed: Set[str] = set()
 
         self.lock = asyncio.Lock()
 
@@ -33,12 +41,20 @@ class State:
             async with self.lock:
                 self.successful += is_successful
 
-            if not is_successful:
+            if is_successful:
+                self.completed.add(url)
+            else:
                 if depth == 5:
                     self.logger.error('Failed to download %r', url)
                     return
                 
                 return await self.download(url, depth=depth + 1)
+        except BudgetExhausted:
+            return
+        except DownloadRejected as e:
+            # Filtered out, trying again would give the same result
+            self.logger.info('Skipping %r: %s.', url, e.reason)
+            return
         except Exception as e:
             if depth == 5:
                 self.logger.exception('Failed to download %r', url, exc_info=e)
@@ -46,30 +62,105 @@ class State:
 
             return await self.download(url, depth=depth + 1)
         
-async def download(urls: Set[str], downloader: Downloader, logger: logging.Logger, amount: int) -> None:
+async def download(urls: Set[str], downloader: Downloader, logger: logging.Logger, amount: int, args: argparse.Namespace) -> Set[str]:
+    # Returns the URLs that were downloaded successfully
     state = State(downloader, logger)
-    for chunk in _chunk(urls, 50):
-        await asyncio.gather(*[state.download(url) for url in chunk])
+
+    get_size = downloader.get_expected_size if args.smallest_first else None
+
+    scheduler = FairScheduler(urls, concurrency=50, weights=args.host_weights, get_size=get_size)
+    await scheduler.run(state.download)
 
     print(f'\n{Colors.white}- Successfully downloaded {state.successful}/{amount} images.{Colors.reset}\n')
-    await downloader.session.close()
 
-def parse_extras(file: TextIO, provider: str) -> Dict[str, Any]:
+    if downloader.rejected:
+        print(f'{Colors.yellow}- Skipped {downloader.rejected} images that didn\'t pass the filters.{Colors.reset}')
+
+    filter = downloader.filter
+    if filter is not None and filter.exhausted is not None:
+        print(f'{Colors.yellow}- Stopped early: {filter.exhausted}.{Colors.reset}')
+
+    if filter is not None and filter.budget is not None:
+        logger.info('Used %d of the %d bytes in the budget.', filter.used, filter.budget)
+
+    backend = downloader.backend
+    if backend.duplicates:
+        logger.info('%d downloads had already stored content, saving %d bytes.', backend.duplicates, backend.saved)
+
+    return state.completed
+
+def open_viewer(path: pathlib.Path, *, debug: bool = False) -> 'subprocess.Popen[bytes]':
+    # Tk has to own the main thread of its process, so the viewer runs separately and picks up
+    # new files on its own while they are being downloaded.
+    command = [sys.executable, '-m', 'neko.viewer', str(path), '--watch']
+    if debug:
+        command.append('--debug')
+
+    return subprocess.Popen(command)
+
+async def check_near_duplicates(path: pathlib.Path, backend: Backend, args: argparse.Namespace) -> None:
+    from .phash import remove_near_duplicates
+
+    assert isinstance(backend, FileSystemBackend)
+
+    drop = args.near_duplicates == 'drop'
+    duplicates = await to_thread(
+        remove_near_duplicates, path, args.near_duplicate_distance, paths=backend.written, drop=drop
+    )
+
+    if not duplicates:
+        return
+
+    verb = 'Removed' if drop else 'Found'
+    print(f'{Colors.white}- {verb} {len(duplicates)} near-duplicates:{Colors.reset}')
+
+    for duplicate in duplicates:
+        original = pathlib.Path(duplicate.original).name
+        print(f'  {Colors.yellow}{pathlib.Path(duplicate.path).name}{Colors.reset} ~ {original} (distance: {duplicate.distance})')
+
+    print()
+
+def parse_host_weights(values: List[str]) -> Dict[str, float]:
+    weights: Dict[str, float] = {}
+    for value in values:
+        host, _, weight = value.partition('=')
+        try:
+            weights[host.strip().lower()] = float(weight)
+        except ValueError:
+            raise ValueError(f'Invalid host weight {value!r}, expected `<host>=<weight>`') from None
+
+        if not host.strip() or weights[host.strip().lower()] <= 0:
+            raise ValueError(f'Invalid host weight {value!r}, expected `<host>=<weight>`')
+
+    return weights
+
+def log_request_stats(provider: Provider, logger: logging.Logger) -> None:
+    flights = provider.flights
+    logger.info(
+        'Sent %d GET requests, %d of which were coalesced with an in-flight request (%.0f%%).',
+        flights.total, flights.hits, flights.hit_rate * 100
+    )
+
+def parse_extras(file: TextIO, provider: str) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    # Returns the extras of the provider and the `[http]` table, which only TOML files have
     path = pathlib.Path(file.name).resolve()
     if path.suffix == '.json':
-        return json.load(file)
+        return json.load(file), {}
     elif path.suffix != '.toml':
         print(f'{Colors.red}- Invalid file extension {path.suffix!r}. Supported file extensions are \'.json\' and \'.toml\'{Colors.reset}')
         sys.exit(1)
     
-    data = toml.load(file)['provider']
+    config = toml.load(file)
+
+    data = config['provider']
     extras = data.get(provider, {})
 
-    if not extras and provider in REQUIRE_EXTRAS:
+    cls = get_provider(provider)
+    if not extras and cls is not None and cls.REQUIRES_EXTRAS:
         print(f'{Colors.red}- Provider {provider!r} not found in {path.name!r}.{Colors.reset}')
         sys.exit(1)
 
-    return extras
+    return extras, config.get('http', {})
 
 async def main(args: argparse.Namespace) -> int:
     logger = create_logger()
@@ -77,13 +168,30 @@ async def main(args: argparse.Namespace) -> int:
     if not args.debug:
         logger.setLevel(logging.ERROR)
 
+    http: Dict[str, Any] = {}
     if args.extras is not None:
         with args.extras as file:
-            args.extras = parse_extras(file, args.provider)
+            args.extras, http = parse_extras(file, args.provider)
     else:
         args.extras = {}
 
+    try:
+        options = SessionOptions.from_config(
+            http,
+            limit=args.connection_limit,
+            limit_per_host=args.connection_limit_per_host,
+            dns_cache_ttl=args.dns_cache_ttl,
+            keepalive_timeout=args.keepalive_timeout,
+            connect_timeout=args.connect_timeout,
+            read_timeout=args.read_timeout,
+            total_timeout=args.total_timeout,
+        )
+    except (TypeError, ValueError) as e:
+        print(f'{Colors.red}- {e}.{Colors.reset}')
+        return 1
+
     args.extras['nsfw'] = args.nsfw
+    args.extras['quality'] = args.quality
 
     if args.max_retries.lower() == 'none':
         args.max_retries = float('inf')
@@ -93,133 +201,334 @@ async def main(args: argparse.Namespace) -> int:
         print(f'{Colors.red}- Invalid argument for --max-retries')
         return 1
 
-    session = aiohttp.ClientSession()
-    provider = ALL_PROVIDERS[args.provider](session, extras=args.extras)
+    try:
+        args.host_weights = parse_host_weights(args.host_weight or [])
+
+        for name in ('min_size', 'max_size', 'budget', 'min_free_space'):
+            value = getattr(args, name)
+            if value is not None:
+                setattr(args, name, parse_size(value))
+    except ValueError as e:
+        print(f'{Colors.red}- {e}.{Colors.reset}')
+        return 1
+
+    if not 0 <= args.near_duplicate_distance <= 7:
+        print(f'{Colors.red}- --near-duplicate-distance must be between 0 and 7.{Colors.reset}')
+        return 1
+
+    if args.backend != 'filesystem' and (args.cas is not None or args.near_duplicates is not None):
+        print(f'{Colors.red}- --cas and --near-duplicates only work with the filesystem backend.{Colors.reset}')
+        return 1
+
+    if args.backend == 's3':
+        if args.view:
+            print(f'{Colors.red}- --view doesn\'t work with the s3 backend.{Colors.reset}')
+            return 1
+
+        if args.s3_bucket is None:
+            print(f'{Colors.red}- --s3-bucket is required with the s3 backend.{Colors.reset}')
+            return 1
+
+        if not os.environ.get('AWS_ACCESS_KEY_ID') or not os.environ.get('AWS_SECRET_ACCESS_KEY'):
+            print(f'{Colors.red}- AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY must be set to use the s3 backend.{Colors.reset}')
+            return 1
+
+    session = create_session(options)
+    backend: Optional[Backend] = None
+
+    # Kept around so that the task isn't garbage collected while it runs and can be cancelled on exit
+    warming: 'Optional[asyncio.Future[int]]' = None
+    try:
+        provider = ALL_PROVIDERS[args.provider](session, extras=args.extras)
+
+        # The cache directory is only created when it's used, so --no-cache leaves nothing on disk
+        cache: Optional[ResponseCache] = None
+        if args.clear_cache or not args.no_cache:
+            cache = ResponseCache()
+
+        if cache is not None and args.clear_cache:
+            cache.clear()
+
+        if not args.no_cache:
+            provider.cache = cache
+
+        logger.info('Using provider %r.', args.provider)
 
-    logger.info('Using provider %r.', args.provider)
+        if args.quality != 'original' and not provider.HAS_RENDITIONS:
+            print(f'{Colors.yellow}- {args.provider!r} only serves original files, ignoring --quality.{Colors.reset}')
 
-    categories = await provider.fetch_categories()
-    if args.category is None and categories:
-        args.category = get_input('{white}- Please enter the category you want to download (You can also type `check` to see all the available categories){reset}: {green}')
-        print(Colors.reset.value, end='')
+        if args.warm_connections and provider.MEDIA_HOSTS:
+            warming = asyncio.ensure_future(
+                warm_up(session, provider.MEDIA_HOSTS, connections=args.warm_connections, headers=provider.get_download_headers())
+            )
+
+        categories = await provider.fetch_categories()
+        if args.category is None and categories:
+            args.category = get_input('{white}- Please enter the category you want to download (You can also type `check` to see all the available categories){reset}: {green}')
+            print(Colors.reset.value, end='')
         
-        if args.category in ('q', 'quit', 'exit'):
-            await session.close()
+            if args.category in ('q', 'quit', 'exit'):
+                return 0
 
-            return 0
+        if args.category == 'check':
+            print()
+            if not categories:
+                print(f'{Colors.white}- There are no categories available with this provider.{Colors.reset}')
+            else:
+                for key, value in categories.items():
+                    if value < 0:
+                        fmt = f'{Colors.white}- {key.title()}{Colors.reset}'
+                    else:
+                        fmt = f'{Colors.white}- {key.title()}{Colors.reset}: {Colors.green}{value}{Colors.reset}'
 
-    if args.category == 'check':
-        print()
-        if not categories:
-            print(f'{Colors.white}- There are no categories available with this provider.{Colors.reset}')
-        else:
-            for key, value in categories.items():
-                if value < 0:
-                    fmt = f'{Colors.white}- {key.title()}{Colors.reset}'
-                else:
-                    fmt = f'{Colors.white}- {key.title()}{Colors.reset}: {Colors.green}{value}{Colors.reset}'
+                    print(fmt)
 
-                print(fmt)
+            return 0
 
-        await session.close()
-        return 0
+        if categories and args.category not in categories:
+            print(f'\n{Colors.red}- Invalid category.{Colors.reset}')
 
-    if categories and args.category not in categories:
-        print(f'\n{Colors.red}- Invalid category.{Colors.reset}')
+            return 1
 
-        await session.close()
-        return 1
+        path = pathlib.Path(args.path).resolve()
+        path.mkdir(parents=True, exist_ok=True)
 
-    path = pathlib.Path(args.path).resolve()
-    path.mkdir(parents=True, exist_ok=True)
+        layout_name = read_layout(path)
+        if layout_name is None:
+            layout_name = args.layout or 'flat'
 
-    fetched = 0
-    retries = 0
+            # Directories from before layouts existed are flat, files would be downloaded again under another layout
+            if layout_name != 'flat' and any(FlatLayout().iter_files(path)):
+                print(f'{Colors.red}- {str(path)!r} already contains files in the \'flat\' layout.{Colors.reset}')
 
-    if args.amount == 'all':
-        args.amount = categories[args.category]
-        if args.amount < 0:
-            print(f'{Colors.red}- Sorry but `all` is not supported with this provider.{Colors.reset}')
-            await session.close()
+                return 1
+
+            write_layout(path, layout_name)
+        elif args.layout is not None and args.layout != layout_name:
+            print(f'{Colors.red}- {str(path)!r} uses the {layout_name!r} layout, not {args.layout!r}.{Colors.reset}')
 
             return 1
-    else:
-        if args.provider in ('pixiv', 'nhentai'):
-            args.amount = len(args.extras['ids'])
-        else:
-            args.amount = int(args.amount)
 
-    print()
+        layout = create_layout(layout_name, provider=args.provider, category=args.category)
 
-    downloader = Downloader(provider, path, headers=provider.EXTRA_DOWNLOAD_HEADERS)
+        fetched = 0
+        retries = 0
 
-    all_urls: Set[str] = set()
-    for file in path.iterdir():
-        if file.suffix == '.tmp':
-            file.unlink() # Remove any temporary files that might be left over from a previous run.
+        if args.amount == 'all':
+            args.amount = categories[args.category]
+            if args.amount < 0:
+                print(f'{Colors.red}- Sorry but `all` is not supported with this provider.{Colors.reset}')
+                return 1
+        else:
+            if args.provider in ('pixiv', 'nhentai'):
+                args.amount = len(args.extras['ids'])
+            else:
+                args.amount = int(args.amount)
 
-    if args.provider in ('pixiv', 'nhentai'):
-        urls = await provider.fetch_many(args.category)
-        fetched += len(urls)
+        print()
 
-        for url in urls:
-            p = await downloader.fetch_download_path(url)
-            if p.exists():
-                logger.info('%r already exists. Ignoring.', p.name)
-                continue
+        if args.backend == 'archive':
+            backend = ArchiveBackend(path, format=args.archive_format, volume_size=args.archive_volume_size * 1024 * 1024)
+        elif args.backend == 's3':
+            backend = S3Backend(
+                path,
+                bucket=args.s3_bucket,
+                access_key=os.environ['AWS_ACCESS_KEY_ID'],
+                secret_key=os.environ['AWS_SECRET_ACCESS_KEY'],
+                session_token=os.environ.get('AWS_SESSION_TOKEN'),
+                prefix=args.s3_prefix,
+                endpoint=args.s3_endpoint,
+                region=args.s3_region or os.environ.get('AWS_REGION') or 'us-east-1',
+                path_style=not args.s3_virtual_hosted,
+                part_size=args.s3_part_size * 1024 * 1024,
+                concurrency=args.s3_concurrency,
+                session_options=options,
+            )
+        else:
+            store: Optional[ContentStore] = None
+            if args.cas is not None:
+                store = ContentStore(pathlib.Path(args.cas).resolve())
+
+            backend = FileSystemBackend(path, layout=layout, store=store)
+
+        filter: Optional[DownloadFilter] = None
+        limits = (args.min_size, args.max_size, args.max_width, args.max_height, args.media_types, args.budget, args.min_free_space)
+        if any(limit is not None for limit in limits):
+            filter = DownloadFilter(
+                path,
+                min_size=args.min_size,
+                max_size=args.max_size,
+                max_width=args.max_width,
+                max_height=args.max_height,
+                media_types=tuple(args.media_types) if args.media_types else None,
+                budget=args.budget,
+                min_free_space=args.min_free_space,
+            )
+
+        downloader = Downloader(
+            provider, path, headers=provider.get_download_headers(), layout=layout, backend=backend, filter=filter
+        )
+
+        removed = backend.prepare()
+        if removed:
+            logger.info('Removed %d partial downloads from a previous run.', removed)
 
-            all_urls.add(url)
+        try:
+            await backend.start()
+        except (S3Error, aiohttp.ClientError) as e:
+            print(f'{Colors.red}- Failed to connect to the storage backend: {e}{Colors.reset}')
 
-        provider.finalize()
-        await download(all_urls, downloader, logger, args.amount)
+            return 1
 
-        if args.view:
-            viewer = ImageViewer(paths=[], debug=args.debug)
-            viewer.images = viewer.load_images([path])
+        # Only providers with server-side exclusion need to know about every file that already exists
+        if provider.MAX_EXCLUDED:
+            for name in backend.iter_names():
+                provider.exclude(name)
 
-            viewer.run()
+        all_urls: Set[str] = set()
 
-        return 0
+        viewer: 'Optional[subprocess.Popen[bytes]]' = None
+        if args.view:
+            viewer = open_viewer(path, debug=args.debug)
 
-    while fetched <= args.amount:
-        if args.amount >= 30 and (args.amount - fetched) >= 30:
+        if args.provider in ('pixiv', 'nhentai'):
             urls = await provider.fetch_many(args.category)
-        else:
-            urls = [await provider.fetch_image(args.category)]
+            fetched += len(urls)
+
+            for url in urls:
+                reason = downloader.check_filters(url)
+                if reason is not None:
+                    logger.info('Skipping %r: %s.', url, reason)
+                    continue
 
-        if not urls:
-            break
-        
-        for url in urls:
-            try:
                 p = await downloader.fetch_download_path(url)
-            except KeyError:
-                logger.warning('Invalid URL %r. Ignoring.', url)
-                continue
+                if downloader.exists(p):
+                    logger.info('%r already exists. Ignoring.', p.name)
+                    continue
+
+                all_urls.add(url)
 
-            if p.exists():
-                logger.info('%r already exists. Ignoring.', p.name)
+            provider.finalize()
+            await download(all_urls, downloader, logger, args.amount, args)
 
-                if not args.retry_if_exists:
-                    fetched += 1; continue
-                elif retries < args.max_retries:
-                    retries += 1; continue
+            if args.near_duplicates is not None:
+                await check_near_duplicates(path, backend, args)
 
-                logger.error('Reached maximum amount of consecutive retries.')
+            log_request_stats(provider, logger)
 
-                provider.finalize()
-                await session.close()
+            if viewer is not None:
+                await to_thread(viewer.wait)
 
-                return 1
+            return 0
+
+        # Identifiers only make it into the persisted seen-set once their download succeeded
+        identifiers: Dict[str, str] = {}
+
+        seen: Optional[SeenSet] = None
+        if provider.IS_RANDOM:
+            seen = SeenSet(None if args.no_seen_cache else get_seen_path(path, args.provider, args.category))
+
+        while fetched <= args.amount:
+            if args.amount >= 30 and (args.amount - fetched) >= 30:
+                urls = await provider.fetch_many(args.category)
             else:
-                all_urls.add(url)
-                fetched += 1
+                urls = [await provider.fetch_image(args.category)]
+
+            if not urls:
+                break
+        
+            for url in urls:
+                # Rejected before the HEAD request and without counting towards the amount
+                reason = downloader.check_filters(url)
+                if reason is not None:
+                    logger.info('Skipping %r: %s.', url, reason)
+                    continue
+
+                # Only a file that is really there confirms an identifier, a seen-set hit may still be in flight or fail
+                on_disk = False
+                try:
+                    identifier = provider.get_identifier_from_url(url)
+                    if seen is not None and identifier in seen:
+                        name, exists = identifier, True
+                    else:
+                        p = await downloader.fetch_download_path(url)
+                        name, exists = p.name, downloader.exists(p)
+                        on_disk = exists
+                except KeyError:
+                    logger.warning('Invalid URL %r. Ignoring.', url)
+                    continue
+
+                if seen is not None:
+                    seen.record(identifier, duplicate=exists)
+                    if on_disk:
+                        seen.confirm(identifier)
+
+                provider.exclude(identifier)
+
+                if exists:
+                    logger.info('%r already exists. Ignoring.', name)
+
+                    if not args.retry_if_exists:
+                        fetched += 1; continue
+                    elif retries < args.max_retries:
+                        retries += 1; continue
+
+                    logger.error('Reached maximum amount of consecutive retries.')
+
+                    if seen is not None:
+                        seen.save()
+
+                    provider.finalize()
+                    return 1
+                else:
+                    all_urls.add(url)
+                    identifiers[url] = identifier
+                    fetched += 1
+
+            if seen is not None:
+                if seen.is_saturated(args.saturation):
+                    size = seen.estimated_size
+                    print(
+                        f'{Colors.yellow}- Category {args.category!r} looks exhausted '
+                        f'({seen.duplicate_rate:.0%} duplicates, ~{size} images). Stopping early.{Colors.reset}'
+                    )
 
-    provider.finalize()
-    await download(all_urls, downloader, logger, args.amount)
+                    break
 
-    if args.view:
-        viewer = ImageViewer(paths=[str(path)], debug=args.debug)
-        viewer.run()
+                delay = seen.get_delay()
+                if delay:
+                    logger.info('Duplicate rate is %.0f%%. Waiting %.2f seconds.', seen.duplicate_rate * 100, delay)
+                    await asyncio.sleep(delay)
 
-    return 0
+        if seen is not None:
+            logger.info('Fetched %d results, %d of which were duplicates.', seen.total, seen.duplicates)
+
+        provider.finalize()
+        completed = await download(all_urls, downloader, logger, args.amount, args)
+
+        if seen is not None:
+            for url in completed:
+                seen.confirm(identifiers[url])
+
+            seen.save()
+
+        if args.near_duplicates is not None:
+            await check_near_duplicates(path, backend, args)
+
+        log_request_stats(provider, logger)
+
+        if viewer is not None:
+            await to_thread(viewer.wait)
+
+        return 0
+    finally:
+        # The warm-up requests use our session, so they have to be gone before it's closed
+        if warming is not None and not warming.done():
+            warming.cancel()
+            await asyncio.gather(warming, return_exceptions=True)
+
+        # Every exit goes through here so that the backend can flush (and close its own session) before ours
+        if backend is not None:
+            await backend.close()
+
+        await session.close()
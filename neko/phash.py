@@ -0,0 +1,452 @@
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import itertools
+import sqlite3
+import pathlib
+import logging
+import os
+
+from .scanner import get_index_path, walk
+from .utils import chunk
+
+logger = logging.getLogger('neko')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS perceptual (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime INTEGER NOT NULL,
+    hash INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS perceptual_buckets (
+    directory TEXT NOT NULL,
+    band INTEGER NOT NULL,
+    value INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    hash INTEGER NOT NULL,
+    PRIMARY KEY (directory, band, value, path)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS perceptual_buckets_path ON perceptual_buckets (path);
+
+CREATE TABLE IF NOT EXISTS perceptual_indexed (
+    directory TEXT PRIMARY KEY
+);
+"""
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp')
+
+def hamming(first: int, second: int) -> int:
+    return bin(first ^ second).count('1')
+
+def dhash(path: str, size: int = 8) -> Optional[int]:
+    """
+    Returns the difference hash of an image, or `None` if the file isn't an image.
+
+    The image is reduced to a `size + 1` by `size` grayscale thumbnail and every bit of the hash records whether a pixel
+    is brighter than its right neighbour. Re-encoding, resizing or converting an image barely changes the gradients,
+    so copies of the same image end up within a few bits of each other. This is meant to run inside of a worker process.
+
+    Parameters
+    ----------
+    path: :class:`str`
+        The path of the image.
+    size: :class:`int`
+        The size of the hash in bits is `size` squared. Defaults to 8.
+    """
+    from PIL import Image
+
+    try:
+        with Image.open(path) as image:
+            # JPEGs can be decoded at a fraction of their size which is all that is needed here
+            image.draft('L', (size * 8, size * 8))
+            pixels = list(image.convert('L').resize((size + 1, size)).getdata())
+    except Exception:
+        return None
+
+    value = 0
+    for row in range(size):
+        offset = row * (size + 1)
+        for column in range(size):
+            value = (value << 1) | (pixels[offset + column] > pixels[offset + column + 1])
+
+    return value
+
+class NearDuplicate(NamedTuple):
+    path: str
+    original: str
+    distance: int
+
+class PerceptualIndex:
+    """
+    Persists the perceptual hashes of the images inside of download directories next to the exact hashes
+    of :class:`neko.scanner.LibraryIndex`, so images are only hashed once.
+
+    Lookups use multi-index hashing: every hash is split into 4 bands of 16 bits and each band is indexed on its own,
+    per directory. Two hashes that differ in at most `r` bits differ in at most `r // 4` bits in at least one of their
+    bands, so a lookup only reads the buckets of the values within `r // 4` bits of each band of the query (17 per band
+    for the maximum distance of 7). A bucket holds about 1/65536th of a directory, which keeps lookups far below
+    a linear scan as the library grows. Nothing is loaded into memory, and a run only hashes and looks up
+    the images it downloaded.
+
+    Parameters
+    ----------
+    path: Optional[:class:`pathlib.Path`]
+        The database file. Defaults to the same file as :class:`neko.scanner.LibraryIndex`.
+    """
+    BATCH_SIZE = 1000
+    BANDS = 4
+    BAND_BITS = 16
+
+    # Keeps the amount of buckets read by a lookup at 4 * 17, it grows with the binomial coefficients past this
+    MAX_DISTANCE = 2 * BANDS - 1
+
+    def __init__(self, path: Optional[pathlib.Path] = None) -> None:
+        self.path = path or get_index_path()
+
+        self.connection = sqlite3.connect(str(self.path))
+        self.connection.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.connection.close()
+
+    @staticmethod
+    def to_signed(hash: Optional[int]) -> Optional[int]:
+        # SQLite integers are signed 64-bit
+        if hash is not None and hash >= 1 << 63:
+            return hash - (1 << 64)
+
+        return hash
+
+    @staticmethod
+    def to_unsigned(hash: int) -> int:
+        return hash + (1 << 64) if hash < 0 else hash
+
+    @classmethod
+    def get_bands(cls, hash: int) -> List[int]:
+        mask = (1 << cls.BAND_BITS) - 1
+        return [(hash >> (band * cls.BAND_BITS)) & mask for band in range(cls.BANDS)]
+
+    @classmethod
+    def get_neighbours(cls, value: int, radius: int) -> List[int]:
+        # Every band value that differs from `value` in at most `radius` bits
+        values = [value]
+        for bits in range(1, radius + 1):
+            for positions in itertools.combinations(range(cls.BAND_BITS), bits):
+                flipped = value
+                for position in positions:
+                    flipped ^= 1 << position
+
+                values.append(flipped)
+
+        return values
+
+    @staticmethod
+    def get_prefix(directory: pathlib.Path) -> str:
+        # GLOB is case-sensitive and can use the primary key index, unlike LIKE
+        return ''.join(f'[{char}]' if char in '*?[' else char for char in os.path.join(str(directory), '')) + '*'
+
+    def get_entries(self, directory: pathlib.Path) -> Dict[str, Tuple[int, int, Optional[int]]]:
+        rows = self.connection.execute(
+            'SELECT path, size, mtime, hash FROM perceptual WHERE path GLOB ?', (self.get_prefix(directory),)
+        )
+
+        return {path: (size, mtime, hash) for path, size, mtime, hash in rows}
+
+    def get_entry(self, path: str) -> Optional[Tuple[int, int, Optional[int]]]:
+        return self.connection.execute('SELECT size, mtime, hash FROM perceptual WHERE path = ?', (path,)).fetchone()
+
+    def is_indexed(self, directory: pathlib.Path) -> bool:
+        row = self.connection.execute(
+            'SELECT 1 FROM perceptual_indexed WHERE directory = ?', (str(directory),)
+        ).fetchone()
+
+        return row is not None
+
+    def add(self, directory: pathlib.Path, path: str, hash: int) -> None:
+        """
+        Makes an image that was already hashed show up in :meth:`search` for the given directory.
+        """
+        self.add_many(directory, [(path, hash)])
+
+    def add_many(self, directory: pathlib.Path, images: Iterable[Tuple[str, int]]) -> None:
+        rows = [
+            (str(directory), band, value, path, self.to_signed(hash))
+            for path, hash in images for band, value in enumerate(self.get_bands(hash))
+        ]
+
+        with self.connection:
+            self.connection.executemany('INSERT OR REPLACE INTO perceptual_buckets VALUES (?, ?, ?, ?, ?)', rows)
+
+    def remove(self, path: str) -> None:
+        self.remove_many([path])
+
+    def remove_many(self, paths: Iterable[str]) -> None:
+        rows = [(path,) for path in paths]
+        with self.connection:
+            self.connection.executemany('DELETE FROM perceptual WHERE path = ?', rows)
+            self.connection.executemany('DELETE FROM perceptual_buckets WHERE path = ?', rows)
+
+    def search(self, directory: pathlib.Path, hash: int, distance: int) -> List[Tuple[int, str]]:
+        """
+        Returns the distance and path of every indexed image inside of a directory whose hash is within `distance`
+        of the given hash, closest first.
+
+        Parameters
+        ----------
+        directory: :class:`pathlib.Path`
+            The directory to search in.
+        hash: :class:`int`
+            The hash to look for.
+        distance: :class:`int`
+            The maximum Hamming distance, at most :attr:`MAX_DISTANCE`.
+        """
+        if not 0 <= distance <= self.MAX_DISTANCE:
+            raise ValueError(f'distance must be between 0 and {self.MAX_DISTANCE}')
+
+        radius = distance // self.BANDS
+
+        candidates: Dict[str, int] = {}
+        for band, value in enumerate(self.get_bands(hash)):
+            values = self.get_neighbours(value, radius)
+            rows = self.connection.execute(
+                'SELECT path, hash FROM perceptual_buckets WHERE directory = ? AND band = ? '
+                f'AND value IN ({", ".join("?" * len(values))})',
+                (str(directory), band, *values)
+            )
+
+            candidates.update(rows)
+
+        matches: List[Tuple[int, str]] = []
+        for path, other in candidates.items():
+            current = hamming(hash, self.to_unsigned(other))
+            if current <= distance:
+                matches.append((current, path))
+
+        return sorted(matches)
+
+    def hash(self, pending: List[Tuple[str, int, int]], *, workers: Optional[int] = None) -> List[Tuple[str, int]]:
+        """
+        Hashes images and stores their hashes, without adding them to the lookup table.
+        This function returns the path and hash of every image, in the given order.
+        """
+        result: List[Tuple[str, int]] = []
+        if not pending:
+            return result
+
+        # A run usually only downloads a handful of images, which isn't worth starting every worker for
+        workers = min(workers or os.cpu_count() or 1, -(-len(pending) // 16))
+
+        # This runs in a thread of the event loop, forking a process that has other threads running isn't safe
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+            for batch in chunk(pending, self.BATCH_SIZE):
+                hashes = list(executor.map(dhash, [path for path, _, _ in batch], chunksize=16))
+
+                with self.connection:
+                    self.connection.executemany(
+                        'INSERT OR REPLACE INTO perceptual VALUES (?, ?, ?, ?)',
+                        [(path, size, mtime, self.to_signed(hash)) for (path, size, mtime), hash in zip(batch, hashes)]
+                    )
+
+                result.extend((path, hash) for (path, _, _), hash in zip(batch, hashes) if hash is not None)
+
+        return result
+
+    def index_directory(self, directory: pathlib.Path, *, workers: Optional[int] = None) -> List[Tuple[str, int]]:
+        """
+        Walks a whole directory, hashing its new or modified images and forgetting about the ones that were removed.
+        This only has to happen once per directory, later runs only look at the files they downloaded.
+        This function returns the paths and hashes of the new images, oldest first.
+        """
+        entries = self.get_entries(directory)
+
+        known: List[Tuple[str, int]] = []
+        pending: List[Tuple[str, int, int]] = []
+
+        for entry in walk(directory):
+            if not entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+
+            stat = entry.stat(follow_symlinks=False)
+
+            previous = entries.pop(entry.path, None)
+            if previous is not None and previous[:2] == (stat.st_size, stat.st_mtime_ns):
+                if previous[2] is not None:
+                    known.append((entry.path, self.to_unsigned(previous[2])))
+
+                continue
+
+            pending.append((entry.path, stat.st_size, stat.st_mtime_ns))
+
+        self.remove_many(entries)
+
+        # Hashes from before the lookup table existed, or that were only indexed for another directory
+        self.add_many(directory, known)
+
+        with self.connection:
+            self.connection.execute('INSERT OR IGNORE INTO perceptual_indexed VALUES (?)', (str(directory),))
+
+        pending.sort(key=lambda item: item[2])
+        if pending:
+            logger.info('%r: %d images to hash.', str(directory), len(pending))
+
+        return self.hash(pending, workers=workers)
+
+    def update(self, paths: Iterable[pathlib.Path], *, workers: Optional[int] = None) -> List[Tuple[str, int]]:
+        """
+        Hashes the given images if they're new or were modified.
+        This function returns the paths and hashes of the hashed images, oldest first.
+        """
+        pending: List[Tuple[str, int, int]] = []
+        for path in paths:
+            if not path.name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+
+            previous = self.get_entry(str(path))
+            if previous is not None and previous[:2] == (stat.st_size, stat.st_mtime_ns):
+                continue
+
+            pending.append((str(path), stat.st_size, stat.st_mtime_ns))
+
+        pending.sort(key=lambda item: item[2])
+        return self.hash(pending, workers=workers)
+
+    def find(
+        self,
+        directory: pathlib.Path,
+        distance: int,
+        *,
+        paths: Optional[Iterable[pathlib.Path]] = None,
+        drop: bool = False,
+        workers: Optional[int] = None
+    ) -> List[NearDuplicate]:
+        """
+        Hashes the new images of a directory and returns the ones that are within `distance` of another image.
+        New images are compared against every indexed image and against the new images that came before them.
+
+        Of every pair, the image with the lower resolution (or the smaller file, if they're the same size) is
+        the near-duplicate, whichever of the two is newer.
+
+        Parameters
+        ----------
+        directory: :class:`pathlib.Path`
+            The directory to check.
+        distance: :class:`int`
+            The maximum Hamming distance between two hashes for the images to count as near-duplicates.
+        paths: Optional[Iterable[:class:`pathlib.Path`]]
+            The new images, usually the downloads of the current run. The first time a directory is checked
+            (or if this is `None`) the whole directory is walked instead.
+        drop: :class:`bool`
+            Whether to delete the near-duplicates. Defaults to `False`.
+        workers: Optional[:class:`int`]
+            The amount of processes used to hash images. Defaults to the amount of CPUs.
+        """
+        directory = directory.resolve()
+        if paths is None or not self.is_indexed(directory):
+            new = self.index_directory(directory, workers=workers)
+        else:
+            new = self.update(paths, workers=workers)
+
+        duplicates: List[NearDuplicate] = []
+        for path, hash in new:
+            match = self.get_match(directory, path, hash, distance)
+            if match is None:
+                self.add(directory, path, hash)
+                continue
+
+            current, other = match
+            if get_quality(path) > get_quality(other):
+                duplicate, original = other, path
+            else:
+                duplicate, original = path, other
+
+            duplicates.append(NearDuplicate(duplicate, original, current))
+            if not drop:
+                self.add(directory, path, hash)
+                continue
+
+            try:
+                os.unlink(duplicate)
+            except OSError:
+                logger.error('Failed to remove %r.', duplicate, exc_info=True)
+                self.add(directory, path, hash)
+                continue
+
+            self.remove(duplicate)
+            if original == path:
+                self.add(directory, path, hash)
+
+        return duplicates
+
+    def get_match(self, directory: pathlib.Path, path: str, hash: int, distance: int) -> Optional[Tuple[int, str]]:
+        for current, other in self.search(directory, hash, distance):
+            if other == path:
+                continue
+
+            # Files removed since the directory was indexed are only noticed once they match
+            if not os.path.exists(other):
+                self.remove(other)
+                continue
+
+            return current, other
+
+        return None
+
+def get_quality(path: str) -> Tuple[int, int]:
+    """
+    Returns the amount of pixels and the size of an image, used to decide which of two near-duplicates to keep.
+    """
+    from PIL import Image
+
+    try:
+        size = os.path.getsize(path)
+        with Image.open(path) as image:
+            # Only reads the header
+            width, height = image.size
+    except Exception:
+        return (0, 0)
+
+    return (width * height, size)
+
+def remove_near_duplicates(
+    directory: pathlib.Path,
+    distance: int,
+    *,
+    paths: Optional[Iterable[pathlib.Path]] = None,
+    drop: bool = False,
+    index: Optional[PerceptualIndex] = None,
+    workers: Optional[int] = None
+) -> List[NearDuplicate]:
+    """
+    Runs the near-duplicate stage on a download directory, see :meth:`PerceptualIndex.find`.
+
+    Parameters
+    ----------
+    directory: :class:`pathlib.Path`
+        The download directory.
+    distance: :class:`int`
+        The maximum Hamming distance between near-duplicates, at most :attr:`PerceptualIndex.MAX_DISTANCE`.
+    paths: Optional[Iterable[:class:`pathlib.Path`]]
+        The images downloaded by this run. Defaults to walking the whole directory.
+    drop: :class:`bool`
+        Whether to delete the near-duplicates or to only return them. Defaults to `False`.
+    index: Optional[:class:`PerceptualIndex`]
+        The index to use. Defaults to the one inside of the user's cache directory.
+    workers: Optional[:class:`int`]
+        The amount of processes used to hash images. Defaults to the amount of CPUs.
+    """
+    index = index or PerceptualIndex()
+
+    try:
+        return index.find(directory, distance, paths=paths, drop=drop, workers=workers)
+    finally:
+        index.close()
@@ -1,13 +1,30 @@
-from .providers import ALL_PROVIDERS, add_provider, get_provider, get_providers_that_require_extras
-from .abc import Provider, CachableProvider
-
-from .akaneko import AkanekoProvider
-from .hmtai import HmtaiProvider
-from .nekobot import NekobotProvider
-from .waifupics import WaifupicsProvider
-from .waifuim import WaifuimProvider
-from .reddit import RedditProvider
-from .danbooru import DanbooruProvider
-from .booru import BooruProvider
-from .pixiv import PixivProvider
-from .nhentai import NHentaiProvider
\ No newline at end of file
+from typing import Any
+
+import importlib
+
+from .providers import ALL_PROVIDERS, ENTRY_POINT_GROUP, add_provider, get_provider, get_providers_that_require_extras
+
+# Everything below is imported on first access so that `import neko.providers` stays cheap
+# and only the provider that is actually used gets loaded.
+_LAZY_ATTRIBUTES = {
+    'Provider': '.abc',
+    'CachableProvider': '.abc',
+    'AkanekoProvider': '.akaneko',
+    'HmtaiProvider': '.hmtai',
+    'NekobotProvider': '.nekobot',
+    'WaifupicsProvider': '.waifupics',
+    'WaifuimProvider': '.waifuim',
+    'RedditProvider': '.reddit',
+    'DanbooruProvider': '.danbooru',
+    'BooruProvider': '.booru',
+    'PixivProvider': '.pixiv',
+    'NHentaiProvider': '.nhentai',
+}
+
+def __getattr__(name: str) -> Any:
+    try:
+        module = _LAZY_ATTRIBUTES[name]
+    except KeyError:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}') from None
+
+    return getattr(importlib.import_module(module, __name__), name)
@@ -1,36 +1,178 @@
-from typing import Any, Dict, Generic, List, Optional, TypeVar
+from typing import Any, Dict, Generic, Hashable, Iterable, List, NamedTuple, Optional, Set, Tuple, TypeVar
 
 from abc import ABC, abstractmethod
 import aiohttp
 import logging
 import asyncio
+import time
 
-from neko.utils import Colors
+from neko.cache import CachedResponse, ResponseCache
+from neko.constants import QUALITIES
+from neko.utils import Colors, SingleFlight
 
 logger = logging.getLogger('neko')
 
 T = TypeVar('T')
 
+# The longest side, in pixels, a rendition of each quality may have
+QUALITY_SIZES: Dict[str, int] = {
+    'large': 2048,
+    'sample': 1024,
+    'thumb': 320,
+}
+
+class ImageMetadata(NamedTuple):
+    """
+    What a provider knows about an image before it's downloaded. Every field is optional.
+    """
+    size: Optional[int] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
+    content_type: Optional[str] = None
+
 class Provider(ABC):
     EXTRA_DOWNLOAD_HEADERS: Dict[str, str] = {}
     REQUIRES_EXTRAS: bool = False
+    IS_RANDOM: bool = False
+    MAX_EXCLUDED: int = 0
+    HAS_RENDITIONS: bool = False
     BASE_URL: str
 
+    # The hosts images are downloaded from, connections to them are opened while the API is still being queried
+    MEDIA_HOSTS: Tuple[str, ...] = ()
+
     def __init__(self, session: aiohttp.ClientSession, *, extras: Dict[str, Any]):
         self.session = session
         self.extras = extras
 
+        self.quality: str = extras.pop('quality', 'original')
+        if self.quality not in QUALITIES:
+            raise ValueError(f'quality must be one of {", ".join(QUALITIES)}')
+
+        self._excluded: Dict[str, None] = {}
+        self.metadata: Dict[str, ImageMetadata] = {}
+
+        # The URLs returned by `select_rendition` that aren't the original file
+        self.renditions: Set[str] = set()
+
+        # Sent with the API requests of this provider only, the session is shared with the downloads and the warm-up
+        self.headers: Dict[str, str] = {}
+        self.cache: Optional[ResponseCache] = None
+        self.flights: SingleFlight[Any] = SingleFlight()
+
     def finalize(self) -> None:
         return 
 
-    async def request(self, route: Optional[str] = None, **kwargs: Any) -> Any:
+    def exclude(self, identifier: str) -> None:
+        """
+        Marks an identifier as already downloaded.
+        Providers whose API supports server-side exclusion send the `MAX_EXCLUDED` most recently excluded
+        identifiers along with their requests. For other providers this does nothing.
+
+        Parameters
+        -----------
+        identifier: :class:`str`
+            The identifier of the image, as returned by :meth:`get_identifier_from_url`.
+        """
+        if not self.MAX_EXCLUDED:
+            return
+
+        self._excluded.pop(identifier, None)
+        self._excluded[identifier] = None
+
+        if len(self._excluded) > self.MAX_EXCLUDED:
+            del self._excluded[next(iter(self._excluded))]
+
+    def get_metadata(self, url: str) -> Optional[ImageMetadata]:
+        """
+        Returns what the API reported about the image at the given URL, if anything.
+        Providers fill :attr:`metadata` while parsing their responses.
+
+        Parameters
+        -----------
+        url: :class:`str`
+            The URL of the image.
+        """
+        return self.metadata.get(url)
+
+    def select_rendition(self, original: str, renditions: Iterable[Tuple[int, str]]) -> str:
+        """
+        Returns the URL of the rendition that matches :attr:`quality` best: the biggest one that fits inside
+        of the size of the quality, else the smallest one. Providers that set `HAS_RENDITIONS` call this.
+
+        Parameters
+        -----------
+        original: :class:`str`
+            The URL of the original file. Returned for the `original` quality or if there are no renditions.
+        renditions: Iterable[Tuple[:class:`int`, :class:`str`]]
+            The longest side and the URL of every available rendition. This may include the original file.
+        """
+        if self.quality == 'original':
+            return original
+
+        limit = QUALITY_SIZES[self.quality]
+
+        fitting: Optional[Tuple[int, str]] = None
+        smallest: Optional[Tuple[int, str]] = None
+        for size, url in renditions:
+            if size <= limit and (fitting is None or size > fitting[0]):
+                fitting = (size, url)
+
+            if smallest is None or size < smallest[0]:
+                smallest = (size, url)
+
+        selected = fitting or smallest
+        if selected is None or selected[1] == original:
+            return original
+
+        self.renditions.add(selected[1])
+        return selected[1]
+
+    def get_rendition_identifier(self, url: str, identifier: str) -> str:
+        """
+        Appends the quality to the identifier of a rendition, e.g. `abc.jpg` becomes `abc-thumb.jpg`.
+        Renditions are often served under the same file name as their original, so without this a later run with
+        another quality would consider the original as already downloaded. Identifiers of originals are returned as is.
+
+        Parameters
+        -----------
+        url: :class:`str`
+            The URL of the image.
+        identifier: :class:`str`
+            The identifier parsed from the URL.
+        """
+        if url not in self.renditions:
+            return identifier
+
+        stem, dot, extension = identifier.rpartition('.')
+        if not dot:
+            return f'{identifier}-{self.quality}'
+
+        return f'{stem}-{self.quality}.{extension}'
+
+    def get_download_headers(self) -> Dict[str, str]:
+        """
+        Returns the headers to send along with the downloads of images from this provider.
+        """
+        return {**self.headers, **self.EXTRA_DOWNLOAD_HEADERS}
+
+    def get_excluded(self) -> List[str]:
+        """
+        Returns the identifiers that should be excluded from the next request, oldest first.
+        """
+        return list(self._excluded)
+
+    async def request(self, route: Optional[str] = None, *, ttl: Optional[float] = None, **kwargs: Any) -> Any:
         """
         Requests the given route with the given kwargs.
 
         Parameters
         -----------
         route: Optional[:class:`str`]
-            The route to request.
+            The route to request. This may also be an absolute URL.
+        ttl: Optional[:class:`float`]
+            The amount of seconds the response can be served from :attr:`cache` for.
+            Only GET requests are cached and only if this is given.
         **kwargs: Any
             Extra arguments to pass to the request.
 
@@ -39,12 +181,59 @@ class Provider(ABC):
         :class:`dict`
             The JSON response.
         """
+        kwargs.setdefault('method', 'GET')
+        if kwargs['method'] != 'GET':
+            return await self._request(route, ttl=ttl, **kwargs)
+
+        # Identical GET requests that are in flight at the same time are only sent once
+        key = self.make_flight_key(self.get_request_url(route), kwargs)
+        return await self.flights.do(key, lambda: self._request(route, ttl=ttl, **kwargs))
+
+    @staticmethod
+    def make_flight_key(url: str, kwargs: Dict[str, Any]) -> Hashable:
+        # Requests that differ in anything that may change the response (headers, a body, cookies, ...) don't share a result
+        headers = sorted((str(key).lower(), str(value)) for key, value in (kwargs.get('headers') or {}).items())
+        extra = sorted((name, repr(value)) for name, value in kwargs.items() if name not in ('method', 'params', 'headers'))
+
+        return (ResponseCache.make_key('GET', url, kwargs.get('params')), tuple(headers), tuple(extra))
+
+    def get_request_url(self, route: Optional[str] = None) -> str:
+        """
+        Returns the full URL of the given route.
+        Routes that are already absolute URLs are returned as is.
+
+        Parameters
+        -----------
+        route: Optional[:class:`str`]
+            The route to request.
+        """
         if route is None:
-            url = self.BASE_URL
-        else:
-            url = self.BASE_URL + route
+            return self.BASE_URL
+        elif route.startswith(('http://', 'https://')):
+            return route
+
+        return self.BASE_URL + route
+
+    async def _request(self, route: Optional[str] = None, *, ttl: Optional[float] = None, **kwargs: Any) -> Any:
+        url = self.get_request_url(route)
+
+        key: Optional[str] = None
+        cached: Optional[CachedResponse] = None
+
+        if self.cache is not None and ttl is not None and kwargs['method'] == 'GET':
+            key = self.cache.make_key(kwargs['method'], url, kwargs.get('params'))
+            cached = self.cache.get(key)
+
+            if cached is not None:
+                if cached.is_fresh:
+                    logger.info('%r: Using cached response.', url)
+                    return cached.data
+
+                kwargs['headers'] = {**kwargs.get('headers', {}), **cached.get_revalidation_headers()}
+
+        if self.headers:
+            kwargs['headers'] = {**self.headers, **kwargs.get('headers', {})}
 
-        kwargs.setdefault('method', 'GET')
         async with self.session.request(url=url, **kwargs) as response: # type: ignore
             if response.status == 429:
                 try:
@@ -55,13 +244,33 @@ class Provider(ABC):
                 logger.error('%r: Too many requests. Retrying in %f seconds.', url, retry_after)
 
                 await asyncio.sleep(retry_after)
-                return await self.request(route, **kwargs)
+                return await self._request(route, ttl=ttl, **kwargs)
+
+            if response.status == 304 and cached is not None:
+                assert self.cache is not None and key is not None
+
+                logger.info('%r: Cached response is still valid.', url)
+                self.cache.set(key, cached._replace(created=time.time()))
+
+                return cached.data
 
             if response.status != 200:
                 logger.error('%r: %d %s', url, response.status, response.reason)
                 return {}
 
-            return await response.json()
+            data = await response.json()
+            if key is not None:
+                assert self.cache is not None and ttl is not None
+
+                self.cache.set(key, CachedResponse(
+                    data=data,
+                    created=time.time(),
+                    ttl=ttl,
+                    etag=response.headers.get('ETag'),
+                    last_modified=response.headers.get('Last-Modified'),
+                ))
+
+            return data
 
         return {}
 
@@ -132,7 +341,7 @@ class Provider(ABC):
         :class:`str`
             The identifier of the image.
         """
-        return url.split('/')[-1]
+        return self.get_rendition_identifier(url, url.split('/')[-1])
 
 class CachableProvider(Provider, Generic[T]):
     def __init__(self, session: aiohttp.ClientSession, *, extras: Dict[str, Any]):
@@ -21,6 +21,7 @@ MEDIA_DISCORD_REGEX = re.compile(r'https:\/\/media\.discordapp\.net\/attachments
 
 @register('akaneko')
 class AkanekoProvider(Provider):
+    IS_RANDOM = True
     BASE_URL = 'https://akaneko-api.herokuapp.com/api/'
 
     async def fetch_image(self, category: str) -> str:
@@ -1,12 +1,15 @@
-from typing import List, NamedTuple, Dict, Any
+from typing import List, NamedTuple, Dict, Any, Tuple
 
 import aiohttp
 import urllib.parse
+import re
 
-from neko.providers.abc import CachableProvider
+from neko.providers.abc import CachableProvider, ImageMetadata
 from neko.providers.providers import register
 
 BASE_URL = 'https://booru.io/api/legacy'
+# Transforms are named after their format and longest side, e.g. `jpeg:1280`. Formats like `mp4` contain digits too.
+TRANSFORM_SIZE_REGEX = re.compile(r':(\d+)$')
 
 class BooruImage(NamedTuple):
     key: str
@@ -14,17 +17,14 @@ class BooruImage(NamedTuple):
     width: int
     height: int
     tags: List[str]
-    transforms: List[str]
-
-    @property
-    def url(self) -> str:
-        transform = self.transforms[0]
-        return f'{BASE_URL}/data/{transform}'
+    transforms: Dict[str, str]
+    url: str
 
 @register('booru.io')
 class BooruProvider(CachableProvider[BooruImage]):
     BASE_URL = BASE_URL
     REQUIRES_EXTRAS = True
+    HAS_RENDITIONS = True
 
     def __init__(self, session: aiohttp.ClientSession, *, extras: Dict[str, Any]):
         super().__init__(session, extras=extras)
@@ -44,17 +44,39 @@ class BooruProvider(CachableProvider[BooruImage]):
         except KeyError:
             self.params['cursor'] = 0
             
-        return [
-            BooruImage(
+        images: List[BooruImage] = []
+        for image in data['data']:
+            transforms: Dict[str, str] = image['transforms']
+            width, height = image['attributes']['width'], image['attributes']['height']
+
+            original = f'{BASE_URL}/data/{next(iter(transforms.values()))}'
+            url = self.select_rendition(original, self.get_renditions(transforms, max(width, height)))
+
+            images.append(BooruImage(
                 key=image['key'],
                 content_type=image['contentType'],
-                width=image['attributes']['width'],
-                height=image['attributes']['height'],
+                width=width,
+                height=height,
                 tags=list(image['tags'].keys()),
-                transforms=list(image['transforms'].values()),
-            )
-            for image in data['data']
-        ]
+                transforms=transforms,
+                url=url,
+            ))
+
+            # Transforms may be re-encoded, so only the original is known to have the reported type
+            if url == original:
+                self.metadata[url] = ImageMetadata(width=width, height=height, content_type=image['contentType'])
+
+        return images
+
+    @staticmethod
+    def get_renditions(transforms: Dict[str, str], size: int) -> List[Tuple[int, str]]:
+        # Transforms without a size are the original
+        renditions: List[Tuple[int, str]] = []
+        for name, transform in transforms.items():
+            match = TRANSFORM_SIZE_REGEX.search(name.strip())
+            renditions.append((min(int(match.group(1)), size) if match else size, f'{BASE_URL}/data/{transform}'))
+
+        return renditions
 
     async def fetch_image(self, _: str = '') -> str:
         if not self._cache:
@@ -71,4 +93,4 @@ class BooruProvider(CachableProvider[BooruImage]):
         return {}
 
     def get_identifier_from_url(self, url: str) -> str:
-        return urllib.parse.urlparse(url).path.split('/')[-2]
\ No newline at end of file
+        return self.get_rendition_identifier(url, urllib.parse.urlparse(url).path.split('/')[-2])
\ No newline at end of file
@@ -1,8 +1,9 @@
-from typing import Dict, Any, List, Optional, NamedTuple
+from typing import Dict, Any, List, Optional, NamedTuple, Tuple
 
+import mimetypes
 import aiohttp
 
-from neko.providers.abc import CachableProvider
+from neko.providers.abc import CachableProvider, ImageMetadata
 from neko.providers.utils import get_str_value
 from neko.providers.providers import register
 
@@ -21,7 +22,7 @@ RATINGS: Dict[str, str] = {
 
 class DanbooruFile(NamedTuple):
     extension: str
-    size: int
+    size: Optional[int] # Only known for the original file
     url: str
 
 class DanbooruImage(NamedTuple):
@@ -33,7 +34,9 @@ class DanbooruImage(NamedTuple):
 @register('danbooru')
 class DanbooruProvider(CachableProvider[DanbooruImage]):
     BASE_URL = 'https://danbooru.donmai.us/'
+    MEDIA_HOSTS = ('cdn.donmai.us',)
     REQUIRES_EXTRAS = True
+    HAS_RENDITIONS = True
 
     def __init__(self, session: aiohttp.ClientSession, *, extras: Dict[str, Any]):
         super().__init__(session, extras=extras)
@@ -103,13 +106,49 @@ class DanbooruProvider(CachableProvider[DanbooruImage]):
             if 'file_url' not in data:
                 continue
 
-            file = DanbooruFile(extension=data['file_ext'], size=data['file_size'], url=data['file_url'])
+            file = self.get_file(data)
             image = DanbooruImage(md5=data['md5'], source=data['source'], file=file, tags=data['tag_string_general'].split(' '))
 
             images.append(image)
 
         return images
 
+    def get_file(self, data: Dict[str, Any]) -> DanbooruFile:
+        original = data['file_url']
+
+        renditions: List[Tuple[int, str]] = []
+        dimensions: Dict[str, Tuple[int, int]] = {}
+
+        if 'image_width' in data and 'image_height' in data:
+            renditions.append((max(data['image_width'], data['image_height']), original))
+            dimensions[original] = (data['image_width'], data['image_height'])
+
+        variants: List[Dict[str, Any]] = (data.get('media_asset') or {}).get('variants') or []
+        for variant in variants:
+            if variant.get('type') != 'original' and 'url' in variant:
+                renditions.append((max(variant['width'], variant['height']), variant['url']))
+                dimensions[variant['url']] = (variant['width'], variant['height'])
+
+        # Older responses don't list the variants, only the 850px sample and the 180px preview
+        if not variants:
+            if data.get('large_file_url'):
+                renditions.append((850, data['large_file_url']))
+            if data.get('preview_file_url'):
+                renditions.append((180, data['preview_file_url']))
+
+        url = self.select_rendition(original, renditions)
+        if url == original:
+            file = DanbooruFile(extension=data['file_ext'], size=data['file_size'], url=url)
+        else:
+            file = DanbooruFile(extension=url.rsplit('.', 1)[-1], size=None, url=url)
+
+        width, height = dimensions.get(url, (None, None))
+        self.metadata[url] = ImageMetadata(
+            size=file.size, width=width, height=height, content_type=mimetypes.guess_type(f'file.{file.extension}')[0]
+        )
+
+        return file
+
     def get_request_route(self) -> str:
         return REQUEST_ROUTES.get(self.sort_by, 'posts.json') # type: ignore
 
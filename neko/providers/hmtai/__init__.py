@@ -3,6 +3,7 @@ from typing import Dict
 import hashlib
 import re
 
+from neko.cache import CATEGORIES_TTL
 from neko.providers.abc import Provider
 from neko.providers.providers import register
 
@@ -10,6 +11,7 @@ DISCORD_CDN_REGEX = re.compile(r'https:\/\/cdn\.discordapp\.com\/attachments\/(?
 
 @register('hmtai')
 class HmtaiProvider(Provider):
+    IS_RANDOM = True
     BASE_URL = 'https://hmtai.herokuapp.com/v2/'
 
     async def fetch_image(self, category: str) -> str:
@@ -17,7 +19,7 @@ class HmtaiProvider(Provider):
         return data['url']
 
     async def fetch_categories(self) -> Dict[str, int]:
-        data = await self.request('endpoints')
+        data = await self.request('endpoints', ttl=CATEGORIES_TTL)
         categories: Dict[str, int] = {}
 
         categories.update({category: -1 for category in data['sfw']})
@@ -1,10 +1,12 @@
 from typing import Dict
 
+from neko.cache import CATEGORIES_TTL
 from neko.providers.abc import Provider
 from neko.providers.providers import register
 
 @register('nekobot')
 class NekobotProvider(Provider):
+    IS_RANDOM = True
     BASE_URL = 'https://nekobot.xyz/api/image'
 
     async def fetch_image(self, category: str) -> str:
@@ -14,5 +16,5 @@ class NekobotProvider(Provider):
         return data['message']
         
     async def fetch_categories(self) -> Dict[str, int]:
-        data = await self.request()
+        data = await self.request(ttl=CATEGORIES_TTL)
         return data['stats']
@@ -4,13 +4,6 @@ import aiohttp
 import logging
 import re
 
-try:
-    import undetected_chromedriver as uc
-    from selenium.webdriver.support.wait import WebDriverWait
-    from selenium.common.exceptions import TimeoutException
-except ImportError:
-    uc, WebDriverWait, TimeoutException = None, None, None
-
 from neko.providers.abc import Provider
 from neko.providers.providers import register
 from neko import utils
@@ -23,14 +16,21 @@ IMAGE_URL_REGEX = re.compile(r'https:\/\/(\w{2})\.nhentai\.net\/galleries\/(?P<i
 @register('nhentai')
 class NHentaiProvider(Provider):
     BASE_URL = 'https://nhentai.net'
+    MEDIA_HOSTS = ('i.nhentai.net',)
     REQUIRES_EXTRAS = True
 
     DEFAULT_TIMEOUT = 120.0
 
     def __init__(self, session: aiohttp.ClientSession, *, extras: Dict[str, Any]):
-        if not uc or not WebDriverWait:
-            raise RuntimeError('You need to install undetected_chromedriver to use this provider.')
+        # Selenium is slow to import, so it's only loaded once the provider is actually used
+        try:
+            import undetected_chromedriver as uc
+            from selenium.webdriver.support.wait import WebDriverWait
+            from selenium.common.exceptions import TimeoutException
+        except ImportError:
+            raise RuntimeError('You need to install undetected_chromedriver to use this provider.') from None
 
+        self.uc, self.WebDriverWait, self.TimeoutException = uc, WebDriverWait, TimeoutException
         super().__init__(session, extras=extras)
 
         self.ids: List[int] = []
@@ -50,7 +50,7 @@ class NHentaiProvider(Provider):
                 pass
 
         self.timeout = extras.get('timeout', self.DEFAULT_TIMEOUT)
-        self.driver = uc.Chrome(headless=True)
+        self.driver = self.uc.Chrome(headless=True)
 
     def finalize(self) -> None:
         self.driver.close()
@@ -60,10 +60,10 @@ class NHentaiProvider(Provider):
         self.driver.get(f'https://nhentai.net/g/{id}')
 
         try:
-            elements = WebDriverWait(self.driver, self.timeout).until(       # type: ignore
-                lambda driver: driver.find_elements(uc.By.CLASS_NAME, 'lazyload') # type: ignore
+            elements = self.WebDriverWait(self.driver, self.timeout).until(
+                lambda driver: driver.find_elements(self.uc.By.CLASS_NAME, 'lazyload')
             )
-        except TimeoutException:
+        except self.TimeoutException:
             logger.warning('Timed out while fetching doujin %d.', id)
             return []
 
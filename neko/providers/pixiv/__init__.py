@@ -41,6 +41,10 @@ class PixivProvider(Provider):
     EXTRA_DOWNLOAD_HEADERS = {'Referer': URL}
     REQUIRES_EXTRAS: bool = True
     BASE_URL = URL
+    MEDIA_HOSTS = ('i.pximg.net',)
+
+    # Pixiv starts answering with 429s when a long list of IDs is requested all at once
+    MAX_CONCURRENT_REQUESTS = 8
 
     def __init__(self, session: aiohttp.ClientSession, *, extras: Dict[str, Any]):
         super().__init__(session, extras=extras)
@@ -135,19 +139,31 @@ class PixivProvider(Provider):
 
         return images
     
+    async def fetch_illustration(self, id: int) -> List[str]:
+        data = await self.request(f'/ajax/illust/{id}')
+        if not data:
+            logger.warning('Failed to fetch illustration %d', id)
+            return []
+        
+        illust = Illustration(self.session, data['body'])
+        if not illust.urls.original:
+            return await self.fetch_non_original_images(illust)
+
+        return [illust.urls.original.replace('_p0', f'_p{i}') for i in range(illust.count)]
+
     async def fetch(self) -> List[str]:
+        # Illustrations are fetched concurrently, repeated IDs end up sharing the same request
+        semaphore = asyncio.Semaphore(self.MAX_CONCURRENT_REQUESTS)
+
+        async def fetch_limited(id: int) -> List[str]:
+            async with semaphore:
+                return await self.fetch_illustration(id)
+
+        results = await asyncio.gather(*[fetch_limited(id) for id in self.ids])
+
         images: List[str] = []
-        for id in self.ids:
-            data = await self.request(f'/ajax/illust/{id}')
-            if not data:
-                logger.warning('Failed to fetch illustration %d', id)
-                continue
-            
-            illust = Illustration(self.session, data['body'])
-            if not illust.urls.original:
-                images.extend(await self.fetch_non_original_images(illust))
-            else:
-                images.extend([illust.urls.original.replace('_p0', f'_p{i}') for i in range(illust.count)])
+        for urls in results:
+            images.extend(urls)
 
         return images
         
@@ -1,10 +1,110 @@
-from typing import Callable, Dict, Type, Optional, TypeVar
+from __future__ import annotations
 
-from .abc import Provider
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, Mapping, Type, Optional, TypeVar
 
-ALL_PROVIDERS: Dict[str, Type[Provider]] = {}
+import importlib
+import logging
+import sys
 
-T = TypeVar('T', bound=Provider)
+if TYPE_CHECKING:
+    from .abc import Provider
+
+logger = logging.getLogger('neko')
+
+# Third-party packages can expose providers under this group, either as the provider class itself
+# or as a module that registers its providers with `register` when imported.
+ENTRY_POINT_GROUP = 'neko.providers'
+
+BUILTIN_PROVIDERS: Dict[str, str] = {
+    'akaneko': 'neko.providers.akaneko',
+    'nekobot': 'neko.providers.nekobot',
+    'hmtai': 'neko.providers.hmtai',
+    'waifu.pics': 'neko.providers.waifupics',
+    'waifu.im': 'neko.providers.waifuim',
+    'reddit': 'neko.providers.reddit',
+    'danbooru': 'neko.providers.danbooru',
+    'booru.io': 'neko.providers.booru',
+    'pixiv': 'neko.providers.pixiv',
+    'nhentai': 'neko.providers.nhentai',
+}
+
+T = TypeVar('T', bound='Provider')
+
+def _load_entry_points() -> Dict[str, Any]:
+    from importlib import metadata
+
+    if sys.version_info >= (3, 10):
+        entry_points = metadata.entry_points(group=ENTRY_POINT_GROUP)
+    else:
+        entry_points = metadata.entry_points().get(ENTRY_POINT_GROUP, [])
+
+    return {entry_point.name: entry_point for entry_point in entry_points}
+
+class ProviderRegistry(Mapping[str, 'Type[Provider]']):
+    """
+    A mapping of provider names to provider classes.
+    The module of a provider is only imported the first time the provider is looked up, and third-party
+    providers are discovered through the `neko.providers` entry point group.
+    """
+    def __init__(self, modules: Mapping[str, str]) -> None:
+        self.providers: Dict[str, Type[Provider]] = {}
+        self.modules: Dict[str, str] = dict(modules)
+
+        self._entry_points: Optional[Dict[str, Any]] = None
+
+    @property
+    def entry_points(self) -> Dict[str, Any]:
+        if self._entry_points is None:
+            try:
+                self._entry_points = _load_entry_points()
+            except Exception:
+                logger.exception('Failed to load providers from entry points.')
+                self._entry_points = {}
+
+        return self._entry_points
+
+    def add(self, name: str, provider: Type[Provider]) -> None:
+        self.providers[name] = provider
+
+    def _load(self, name: str) -> Type[Provider]:
+        module = self.modules.get(name)
+        if module is not None:
+            importlib.import_module(module) # The module registers its providers when imported
+        else:
+            entry_point = self.entry_points.get(name)
+            if entry_point is None:
+                raise KeyError(name)
+
+            loaded = entry_point.load()
+            if isinstance(loaded, type):
+                self.add(name, loaded)
+
+        try:
+            return self.providers[name]
+        except KeyError:
+            raise KeyError(f'{name!r} was not registered by its module') from None
+
+    def __getitem__(self, name: str) -> Type[Provider]:
+        provider = self.providers.get(name)
+        if provider is None:
+            provider = self._load(name)
+
+        return provider
+
+    def __contains__(self, name: object) -> bool:
+        return name in self.providers or name in self.modules or name in self.entry_points
+
+    def __iter__(self) -> Iterator[str]:
+        names = dict.fromkeys(self.modules)
+        names.update(dict.fromkeys(self.providers))
+        names.update(dict.fromkeys(self.entry_points))
+
+        return iter(names)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+ALL_PROVIDERS = ProviderRegistry(BUILTIN_PROVIDERS)
 
 def register(name: str) -> Callable[[Type[T]], Type[T]]:
     def wrapper(cls: Type[T]):
@@ -14,10 +114,10 @@ def register(name: str) -> Callable[[Type[T]], Type[T]]:
     return wrapper
 
 def add_provider(name: str, provider: Type[Provider]):
-    ALL_PROVIDERS[name] = provider
+    ALL_PROVIDERS.add(name, provider)
 
 def get_provider(name: str) -> Optional[Type[Provider]]:
     return ALL_PROVIDERS.get(name)
 
 def get_providers_that_require_extras() -> Dict[str, Type[Provider]]:
-    return {name: provider for name, provider in ALL_PROVIDERS.items() if provider.REQUIRES_EXTRAS}
\ No newline at end of file
+    return {name: provider for name, provider in ALL_PROVIDERS.items() if provider.REQUIRES_EXTRAS}
@@ -1,10 +1,11 @@
-from typing import List, Dict, Any, Optional, NamedTuple
+from typing import List, Dict, Any, Optional, NamedTuple, Tuple
 
 import aiohttp
 import logging
+import html
 import re
 
-from neko.providers.abc import CachableProvider
+from neko.providers.abc import CachableProvider, ImageMetadata
 from neko.providers.utils import get_str_value
 from neko.providers.providers import register
 from neko.utils import Colors
@@ -14,6 +15,9 @@ logger = logging.getLogger('neko')
 USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/103.0.0.0 Safari/537.36'
 REDDIT_GALLERY_REGEX = re.compile(r'https:\/\/www\.reddit\.com\/gallery\/.+')
 
+# Previews of these are still images, so they're always downloaded as is
+ANIMATED_EXTENSIONS = ('.gif', '.gifv', '.mp4')
+
 class RedditImage(NamedTuple):
     url: str
     name: str
@@ -21,7 +25,9 @@ class RedditImage(NamedTuple):
 @register('reddit')
 class RedditProvider(CachableProvider[RedditImage]):
     BASE_URL = 'https://reddit.com/'
+    MEDIA_HOSTS = ('i.redd.it', 'preview.redd.it')
     REQUIRES_EXTRAS: bool = True
+    HAS_RENDITIONS: bool = True
 
     def __init__(self, session: aiohttp.ClientSession, *, extras: Dict[str, Any]):
         extras.pop('nsfw')
@@ -36,7 +42,7 @@ class RedditProvider(CachableProvider[RedditImage]):
         if self.sort not in ('hot', 'new', 'rising', 'top', 'controversial'):
             raise ValueError('sort must be one of hot, new, rising, top, controversial')
 
-        self.session.headers['User-Agent'] = extras.pop('user_agent', USER_AGENT)
+        self.headers['User-Agent'] = extras.pop('user_agent', USER_AGENT)
         self.last: Optional[str] = None 
     
         limit: int = self.extras.pop('limit', 30)
@@ -64,7 +70,7 @@ class RedditProvider(CachableProvider[RedditImage]):
             if post.get('is_gallery', False):
                 images.extend(await self._fetch_gallery_items(url, name))
             else:
-                images.append(RedditImage(url, name))
+                images.append(RedditImage(self.get_post_url(post), name))
 
             self.last = post['name']
 
@@ -76,20 +82,57 @@ class RedditProvider(CachableProvider[RedditImage]):
             logger.warning('%r is not a valid Reddit gallery URL. Skipping.', url)
             return []
 
-        new_url = url.replace('gallery', 'comments') + '.json'
-        async with self.session.get(new_url) as response:
-            data = await response.json()
-            medias: Dict[str, Any] = data[0]['data']['children'][0]['data']['media_metadata']
+        # Cross-posts point to the same gallery, so this goes through `request` in order to share in-flight calls
+        data = await self.request(url.replace('gallery', 'comments') + '.json')
+        if not data:
+            return []
+
+        medias: Dict[str, Any] = data[0]['data']['children'][0]['data']['media_metadata']
+
+        images: List[RedditImage] = []
+        for id, metadata in medias.items():
+            if metadata['status'] != 'valid':
+                continue
+
+            extension = metadata['m'].split('/')[-1]
+            original = f'https://i.redd.it/{id}.{extension}'
+
+            if metadata.get('e') == 'Image' and 's' in metadata:
+                # Gallery previews use single letter keys, `u` being the URL and `x` and `y` the size
+                previews = [metadata['s'], *metadata.get('p', [])]
+                renditions = [(max(preview['x'], preview['y']), html.unescape(preview['u'])) for preview in previews if 'u' in preview]
+
+                original = self.select_rendition(original, renditions)
 
-            images: List[RedditImage] = []
-            for id, metadata in medias.items():
-                if metadata['status'] != 'valid':
-                    continue
+            images.append(RedditImage(original, name))
 
-                extension = metadata['m'].split('/')[-1]
-                images.append(RedditImage(f'https://i.redd.it/{id}.{extension}', name))
+        return images
+
+    def get_post_url(self, post: Dict[str, Any]) -> str:
+        url: str = post['url']
+        if url.lower().endswith(ANIMATED_EXTENSIONS):
+            return url
+
+        try:
+            preview: Dict[str, Any] = post['preview']['images'][0]
+        except (KeyError, IndexError):
+            return url
+
+        renditions: List[Tuple[int, str]] = []
+        dimensions: Dict[str, Tuple[int, int]] = {url: (preview['source']['width'], preview['source']['height'])}
+
+        for resolution in (preview['source'], *preview.get('resolutions', [])):
+            rendition = html.unescape(resolution['url'])
 
-            return images
+            renditions.append((max(resolution['width'], resolution['height']), rendition))
+            dimensions[rendition] = (resolution['width'], resolution['height'])
+
+        url = self.select_rendition(url, renditions)
+
+        width, height = dimensions[url]
+        self.metadata[url] = ImageMetadata(width=width, height=height)
+
+        return url
 
     async def fetch_image(self, _: str = '') -> str:
         if not self._cache:
@@ -107,4 +150,8 @@ class RedditProvider(CachableProvider[RedditImage]):
 
     async def fetch_categories(self) -> Dict[str, int]:
         return {}
+
+    def get_identifier_from_url(self, url: str) -> str:
+        # Previews are signed through their query string, e.g. `<id>.jpg?width=640&s=...`
+        return self.get_rendition_identifier(url, url.split('?', 1)[0].split('/')[-1])
     
\ No newline at end of file
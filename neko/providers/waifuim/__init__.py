@@ -1,7 +1,8 @@
-from typing import Any, Dict, List, NamedTuple
+from typing import Any, Dict, List, NamedTuple, Tuple
 
 import aiohttp
 
+from neko.cache import CATEGORIES_TTL
 from neko.providers.abc import CachableProvider
 from neko.providers.providers import register
 
@@ -13,7 +14,10 @@ class WaifuimImage(NamedTuple):
 
 @register('waifu.im')
 class WaifuimProvider(CachableProvider[WaifuimImage]):
+    IS_RANDOM = True
+    MAX_EXCLUDED = 100 # Keeps the query string well within the usual URL length limits
     BASE_URL = 'https://api.waifu.im/'
+    MEDIA_HOSTS = ('cdn.waifu.im',)
 
     def __init__(self, session: aiohttp.ClientSession, *, extras: Dict[str, Any]):
         super().__init__(session, extras=extras)
@@ -23,7 +27,11 @@ class WaifuimProvider(CachableProvider[WaifuimImage]):
         params['selected_tags'] = category
         params.setdefault('is_nsfw', 'true' if self.nsfw else 'false')
 
-        return await super().request('random', params=params)
+        # The API expects file names without their extension, e.g. `3867126be8e260b5`
+        query: List[Tuple[str, str]] = list(params.items())
+        query.extend(('excluded_files', identifier.split('.')[0]) for identifier in self.get_excluded())
+
+        return await super().request('random', params=query)
 
     async def _fetch_many(self, category: str) -> List[WaifuimImage]:
         data = await self.request(category, many='true')
@@ -53,7 +61,7 @@ class WaifuimProvider(CachableProvider[WaifuimImage]):
         return [image.url for image in images]
 
     async def fetch_categories(self) -> Dict[str, int]:
-        data = await self.request('tags', params={'full': 'on'})
+        data = await super().request('tags', params={'full': 'on'}, ttl=CATEGORIES_TTL)
         categories: Dict[str, int] = {}
 
         categories.update({tag['name']: -1 for tag in data['versatile']})
@@ -2,12 +2,18 @@ from typing import Dict, List, Any
 
 import aiohttp
 
+from neko.cache import CATEGORIES_TTL
 from neko.providers.abc import CachableProvider
 from neko.providers.providers import register
 
+IMAGE_URL = 'https://i.waifu.pics/{}'
+
 @register('waifu.pics')
 class WaifupicsProvider(CachableProvider[str]):
+    IS_RANDOM = True
+    MAX_EXCLUDED = 500
     BASE_URL = 'https://api.waifu.pics/'
+    MEDIA_HOSTS = ('i.waifu.pics',)
 
     def __init__(self, session: aiohttp.ClientSession, *, extras: Dict[str, Any]):
         super().__init__(session, extras=extras)
@@ -24,11 +30,12 @@ class WaifupicsProvider(CachableProvider[str]):
         if self.nsfw:
             route = f'many/nsfw/{category}'
 
-        data = await self.request(route, method='POST', json={'exclude': []})
+        exclude = [IMAGE_URL.format(identifier) for identifier in self.get_excluded()]
+        data = await self.request(route, method='POST', json={'exclude': exclude})
         return data['files']
 
     async def fetch_categories(self) -> Dict[str, int]:
-        data = await self.request('endpoints')
+        data = await self.request('endpoints', ttl=CATEGORIES_TTL)
         categories: Dict[str, int] = {}
 
         categories.update({category: -1 for category in data['sfw']})
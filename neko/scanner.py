@@ -0,0 +1,278 @@
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import sqlite3
+import hashlib
+import pathlib
+import logging
+import mmap
+import time
+import os
+
+from .utils import Colors, chunk, get_cache_directory
+
+logger = logging.getLogger('neko')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime INTEGER NOT NULL,
+    hash TEXT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS files_hash ON files (hash);
+"""
+
+class FileEntry(NamedTuple):
+    path: str
+    size: int
+    mtime: int
+    hash: str
+
+def get_index_path() -> pathlib.Path:
+    return get_cache_directory() / 'library.sqlite3'
+
+def hash_file(path: str) -> Optional[str]:
+    """
+    Returns the hex SHA-256 digest of a file, the same digest used by :class:`neko.storage.ContentStore`.
+    The file is memory-mapped so that the kernel pages it in directly instead of copying it through read buffers.
+    This is meant to run inside of a worker process.
+
+    Parameters
+    ----------
+    path: :class:`str`
+        The path of the file.
+    """
+    try:
+        with open(path, 'rb') as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                return hashlib.sha256().hexdigest() # Empty files can't be mapped
+
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                return hashlib.sha256(view).hexdigest()
+    except OSError:
+        return None
+
+def walk(directory: pathlib.Path) -> Iterator[os.DirEntry]:
+    """
+    Recursively yields the files inside of a directory, skipping hidden entries and temporary downloads.
+    """
+    stack = [str(directory)]
+    while stack:
+        path = stack.pop()
+        try:
+            entries = os.scandir(path)
+        except OSError:
+            logger.warning('Failed to scan %r.', path, exc_info=True)
+            continue
+
+        with entries:
+            for entry in entries:
+                if entry.name.startswith('.') or entry.name.endswith('.tmp'):
+                    continue
+
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    yield entry
+
+class LibraryIndex:
+    """
+    An SQLite index of the files inside of one or more download directories, keyed by path.
+
+    Scans are incremental, files whose size and modification time didn't change since the last scan aren't hashed again.
+
+    Parameters
+    ----------
+    path: Optional[:class:`pathlib.Path`]
+        The database file. Defaults to `library.sqlite3` inside of the user's cache directory.
+    """
+    BATCH_SIZE = 1000
+
+    def __init__(self, path: Optional[pathlib.Path] = None) -> None:
+        self.path = path or get_index_path()
+
+        self.connection = sqlite3.connect(str(self.path))
+        self.connection.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def get_entries(self, directory: pathlib.Path) -> Dict[str, Tuple[int, int]]:
+        # GLOB is case-sensitive and can use the primary key index, unlike LIKE
+        prefix = ''.join(f'[{char}]' if char in '*?[' else char for char in os.path.join(str(directory), ''))
+        rows = self.connection.execute('SELECT path, size, mtime FROM files WHERE path GLOB ?', (prefix + '*',))
+
+        return {path: (size, mtime) for path, size, mtime in rows}
+
+    def scan(self, directories: Iterable[pathlib.Path], *, workers: Optional[int] = None) -> Tuple[int, int, int]:
+        """
+        Walks the given directories, hashing new or modified files in a process pool, and removes
+        the entries of files that no longer exist.
+        This function returns the amount of hashed, unchanged and removed files.
+
+        Parameters
+        ----------
+        directories: Iterable[:class:`pathlib.Path`]
+            The directories to scan.
+        workers: Optional[:class:`int`]
+            The amount of processes used to hash files. Defaults to the amount of CPUs.
+        """
+        hashed = unchanged = removed = 0
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for directory in directories:
+                directory = directory.resolve()
+                known = self.get_entries(directory)
+
+                pending: List[Tuple[str, int, int]] = []
+                for entry in walk(directory):
+                    stat = entry.stat(follow_symlinks=False)
+
+                    previous = known.pop(entry.path, None)
+                    if previous == (stat.st_size, stat.st_mtime_ns):
+                        unchanged += 1
+                        continue
+
+                    pending.append((entry.path, stat.st_size, stat.st_mtime_ns))
+
+                logger.info('%r: %d files to hash.', str(directory), len(pending))
+
+                for batch in chunk(pending, self.BATCH_SIZE):
+                    digests = executor.map(hash_file, [path for path, _, _ in batch], chunksize=32)
+
+                    entries = [FileEntry(path, size, mtime, digest) for (path, size, mtime), digest in zip(batch, digests) if digest is not None]
+                    hashed += len(entries)
+
+                    with self.connection:
+                        self.connection.executemany('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)', entries)
+
+                # Whatever is left wasn't found on disk anymore
+                with self.connection:
+                    self.connection.executemany('DELETE FROM files WHERE path = ?', ((path,) for path in known))
+
+                removed += len(known)
+
+        return hashed, unchanged, removed
+
+    def get_duplicates(self, directories: Iterable[pathlib.Path] = ()) -> List[List[FileEntry]]:
+        """
+        Returns groups of files that have the same content, the oldest file of each group first.
+
+        Parameters
+        ----------
+        directories: Iterable[:class:`pathlib.Path`]
+            Only consider files inside of these directories. Defaults to every indexed file.
+        """
+        prefixes = [os.path.join(str(directory.resolve()), '') for directory in directories]
+
+        rows = self.connection.execute(
+            'SELECT path, size, mtime, hash FROM files WHERE hash IN '
+            '(SELECT hash FROM files GROUP BY hash HAVING COUNT(*) > 1) ORDER BY hash, mtime, path'
+        )
+
+        groups: Dict[str, List[FileEntry]] = {}
+        for row in rows:
+            entry = FileEntry(*row)
+            if prefixes and not entry.path.startswith(tuple(prefixes)):
+                continue
+
+            groups.setdefault(entry.hash, []).append(entry)
+
+        return [group for group in groups.values() if len(group) > 1]
+
+    def remove(self, path: str) -> None:
+        with self.connection:
+            self.connection.execute('DELETE FROM files WHERE path = ?', (path,))
+
+    def update(self, path: str) -> None:
+        stat = os.stat(path)
+        with self.connection:
+            self.connection.execute('UPDATE files SET mtime = ? WHERE path = ?', (stat.st_mtime_ns, path))
+
+def is_same_file(first: str, second: str) -> bool:
+    try:
+        return os.path.samefile(first, second)
+    except OSError:
+        return False
+
+def link_duplicate(original: str, duplicate: str) -> None:
+    # Linked next to the duplicate first so that the duplicate is replaced atomically
+    tmp = f'{duplicate}.tmp'
+    os.link(original, tmp)
+    os.replace(tmp, duplicate)
+
+def format_size(size: float) -> str:
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if size < 1024:
+            return f'{size:.1f} {unit}'
+
+        size /= 1024
+
+    return f'{size:.1f} TiB'
+
+def main(args: argparse.Namespace) -> int:
+    directories = [pathlib.Path(path) for path in args.paths]
+    for directory in directories:
+        if not directory.is_dir():
+            print(f'{Colors.red}- {str(directory)!r} is not a directory.{Colors.reset}')
+            return 1
+
+    index = LibraryIndex(pathlib.Path(args.index) if args.index else None)
+
+    start = time.perf_counter()
+    hashed, unchanged, removed = index.scan(directories, workers=args.workers)
+
+    print(
+        f'{Colors.white}- Scanned {hashed + unchanged} files in {time.perf_counter() - start:.2f}s '
+        f'({hashed} hashed, {unchanged} unchanged, {removed} removed from the index).{Colors.reset}'
+    )
+
+    groups = index.get_duplicates(directories)
+
+    reclaimable = 0
+    count = 0
+    handled = 0
+    for original, *others in groups:
+        # Hardlinks of the original don't use any extra space
+        duplicates = [entry for entry in others if not is_same_file(original.path, entry.path)]
+        if not duplicates:
+            continue
+
+        count += len(duplicates)
+        if args.action == 'report':
+            print(f'\n{Colors.green}{original.hash[:16]}{Colors.reset} ({format_size(original.size)})')
+            print(f'  {original.path}')
+
+            for duplicate in duplicates:
+                print(f'  {duplicate.path}')
+                reclaimable += duplicate.size
+
+            continue
+
+        for duplicate in duplicates:
+            try:
+                if args.action == 'link':
+                    link_duplicate(original.path, duplicate.path)
+                    index.update(duplicate.path)
+                else:
+                    os.unlink(duplicate.path)
+                    index.remove(duplicate.path)
+            except OSError as e:
+                logger.error('Failed to %s %r: %s', args.action, duplicate.path, e)
+                continue
+
+            handled += 1
+            reclaimable += duplicate.size
+
+    index.close()
+
+    if args.action == 'report':
+        print(f'\n{Colors.white}- Found {count} duplicates, {format_size(reclaimable)} can be reclaimed.{Colors.reset}')
+    else:
+        verb = 'Linked' if args.action == 'link' else 'Removed'
+        print(f'{Colors.white}- {verb} {handled}/{count} duplicates, reclaiming {format_size(reclaimable)}.{Colors.reset}')
+
+    return 0
@@ -0,0 +1,139 @@
+from typing import Awaitable, Callable, Deque, Dict, Iterable, Mapping, Optional, Set
+
+from collections import deque
+from urllib.parse import urlsplit
+import asyncio
+import logging
+import math
+
+logger = logging.getLogger('neko')
+
+def get_host(url: str) -> str:
+    return urlsplit(url).netloc.lower()
+
+class FairScheduler:
+    """
+    Runs downloads with a fixed amount of concurrency while sharing it fairly between hosts.
+
+    Every host gets a queue of its own. Free slots go to hosts through smooth weighted round-robin, so a host
+    with a weight of 2 gets twice as many downloads as a host with a weight of 1 and the order is interleaved
+    rather than bursty. On top of that a host never has more than its weighted share of the slots in flight,
+    which means a slow host can't hold on to every slot while the others wait. Shares are recomputed as hosts run
+    out of work, so the last host standing gets every slot.
+
+    Parameters
+    ----------
+    urls: Iterable[:class:`str`]
+        The URLs to download.
+    concurrency: :class:`int`
+        The maximum amount of downloads running at once. Defaults to 50.
+    weights: Optional[Mapping[:class:`str`, :class:`float`]]
+        The weight of every host, keyed by host name. Hosts that aren't listed have a weight of 1.
+    get_size: Optional[Callable[[:class:`str`], Optional[:class:`int`]]]
+        Returns the expected size of a URL, if known. When given, the queue of every host is ordered smallest first,
+        so that more images are done early on. URLs of unknown size go last.
+    """
+    def __init__(
+        self,
+        urls: Iterable[str],
+        *,
+        concurrency: int = 50,
+        weights: Optional[Mapping[str, float]] = None,
+        get_size: Optional[Callable[[str], Optional[int]]] = None,
+    ) -> None:
+        self.concurrency = max(concurrency, 1)
+        self.weights: Dict[str, float] = {host.lower(): weight for host, weight in (weights or {}).items()}
+
+        self.queues: Dict[str, Deque[str]] = {}
+        for url in urls:
+            self.queues.setdefault(get_host(url), deque()).append(url)
+
+        if get_size is not None:
+            for host, queue in self.queues.items():
+                sizes = {url: get_size(url) for url in queue}
+                self.queues[host] = deque(sorted(queue, key=lambda url: (sizes[url] is None, sizes[url] or 0)))
+
+        self.active: Dict[str, int] = dict.fromkeys(self.queues, 0)
+        self.current: Dict[str, float] = dict.fromkeys(self.queues, 0.0)
+        self.completed: Dict[str, int] = dict.fromkeys(self.queues, 0)
+
+    def __len__(self) -> int:
+        return sum(len(queue) for queue in self.queues.values())
+
+    def get_weight(self, host: str) -> float:
+        return self.weights.get(host, 1.0)
+
+    def get_limit(self, host: str) -> int:
+        """
+        Returns the amount of slots the given host may use at once.
+
+        Parameters
+        ----------
+        host: :class:`str`
+            The host.
+        """
+        total = sum(self.get_weight(other) for other, queue in self.queues.items() if queue or self.active[other])
+        if not total:
+            return self.concurrency
+
+        return max(1, math.ceil(self.concurrency * self.get_weight(host) / total))
+
+    def select(self) -> Optional[str]:
+        """
+        Returns the host the next download should come from or `None` if no host may start one right now.
+        """
+        candidates = [host for host, queue in self.queues.items() if queue and self.active[host] < self.get_limit(host)]
+        if not candidates:
+            return None
+
+        total = 0.0
+        for host in candidates:
+            weight = self.get_weight(host)
+
+            self.current[host] += weight
+            total += weight
+
+        selected = max(candidates, key=self.current.__getitem__)
+        self.current[selected] -= total
+
+        return selected
+
+    async def run(self, download: Callable[[str], Awaitable[None]]) -> None:
+        """
+        Downloads every URL. This returns once every download finished.
+
+        Parameters
+        ----------
+        download: Callable[[:class:`str`], Awaitable[None]]
+            Downloads a single URL. This shouldn't raise.
+        """
+        hosts: Dict['asyncio.Task[None]', str] = {}
+        tasks: Set['asyncio.Task[None]'] = set()
+
+        while True:
+            while len(tasks) < self.concurrency:
+                host = self.select()
+                if host is None:
+                    break
+
+                task = asyncio.ensure_future(download(self.queues[host].popleft()))
+                hosts[task] = host
+                tasks.add(task)
+
+                self.active[host] += 1
+
+            if not tasks:
+                break
+
+            done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                host = hosts.pop(task)
+
+                self.active[host] -= 1
+                self.completed[host] += 1
+
+                if not task.cancelled() and task.exception() is not None:
+                    logger.error('Unexpected error while downloading from %r.', host, exc_info=task.exception())
+
+        for host, completed in self.completed.items():
+            logger.info('%r: %d downloads.', host, completed)
@@ -0,0 +1,183 @@
+from typing import Deque, Optional, Set
+
+from collections import deque
+import hashlib
+import pathlib
+import logging
+import array
+
+from .utils import get_cache_directory
+
+logger = logging.getLogger('neko')
+
+def get_seen_path(path: pathlib.Path, provider: str, category: str) -> pathlib.Path:
+    """
+    Returns the path where the seen-set of a provider/category pair is persisted.
+    The output directory is part of the key so that different download directories don't share state.
+
+    Parameters
+    ----------
+    path: :class:`pathlib.Path`
+        The output directory.
+    provider: :class:`str`
+        The name of the provider.
+    category: :class:`str`
+        The category being downloaded.
+    """
+    key = hashlib.md5(str(path).encode()).hexdigest()[:16]
+    name = f'{provider}-{category}-{key}.seen'.replace('/', '_')
+
+    return get_cache_directory('seen') / name
+
+class SeenSet:
+    """
+    A compact set of hashed identifiers that have already been fetched from a random-image provider.
+
+    Identifiers are stored as 64-bit hashes, which is enough to make collisions irrelevant in practice
+    while keeping the memory (and on-disk) footprint small.
+
+    Identifiers are only persisted once they are confirmed with :meth:`confirm`, that is once the image was downloaded
+    or found on disk. Identifiers that were only recorded still count as seen for the rest of the run, so a failed or
+    filtered download is retried by the next run instead of being skipped forever.
+
+    Besides membership, this keeps track of the duplicate rate over the last `window` results. When a provider
+    returns images uniformly at random, the probability of getting a duplicate is ``seen / total``, which means
+    the duplicate rate doubles as an estimate of how much of the category has already been downloaded.
+
+    Parameters
+    ----------
+    path: Optional[:class:`pathlib.Path`]
+        The file used to persist the set. If `None`, nothing is persisted.
+    window: :class:`int`
+        The amount of recent results used to compute the duplicate rate. Defaults to 100.
+    """
+    MAX_DELAY = 5.0
+
+    def __init__(self, path: Optional[pathlib.Path] = None, *, window: int = 100) -> None:
+        self.path = path
+        self.digests: Set[int] = set()
+        self.confirmed: Set[int] = set()
+        self.recent: Deque[bool] = deque(maxlen=window)
+
+        self.total = 0
+        self.duplicates = 0
+
+        if path is not None and path.exists():
+            self.load()
+
+    def __len__(self) -> int:
+        return len(self.digests)
+
+    def __contains__(self, identifier: str) -> bool:
+        return self.hash(identifier) in self.digests
+
+    @staticmethod
+    def hash(identifier: str) -> int:
+        digest = hashlib.blake2b(identifier.encode(), digest_size=8).digest()
+        return int.from_bytes(digest, 'little')
+
+    def load(self) -> None:
+        assert self.path is not None
+
+        digests = array.array('Q')
+        try:
+            with self.path.open('rb') as file:
+                digests.frombytes(file.read())
+        except ValueError:
+            # The length isn't a multiple of 8, most likely because a previous run was killed while saving
+            logger.warning('Ignoring the truncated seen-set %r.', self.path.name)
+            return
+
+        self.digests.update(digests)
+        self.confirmed.update(digests)
+        logger.info('Loaded %d seen identifiers from %r.', len(digests), self.path.name)
+
+    def save(self) -> None:
+        if self.path is None:
+            return
+
+        tmp = self.path.with_suffix('.tmp')
+        with tmp.open('wb') as file:
+            array.array('Q', self.confirmed).tofile(file)
+
+        tmp.replace(self.path)
+
+    def record(self, identifier: str, *, duplicate: bool = False) -> bool:
+        """
+        Records a result returned by the provider.
+        This function returns a boolean indicating whether or not the identifier is new.
+
+        Parameters
+        ----------
+        identifier: :class:`str`
+            The identifier of the image.
+        duplicate: :class:`bool`
+            Whether the caller already knows that this is a duplicate, for example because the file exists on disk.
+        """
+        digest = self.hash(identifier)
+
+        duplicate = duplicate or digest in self.digests
+        self.digests.add(digest)
+
+        self.total += 1
+        self.duplicates += duplicate
+        self.recent.append(duplicate)
+
+        return not duplicate
+
+    def confirm(self, identifier: str) -> None:
+        """
+        Marks an identifier as downloaded, which means it is persisted by the next call to :meth:`save`.
+
+        Parameters
+        ----------
+        identifier: :class:`str`
+            The identifier of the image.
+        """
+        digest = self.hash(identifier)
+
+        self.digests.add(digest)
+        self.confirmed.add(digest)
+
+    @property
+    def duplicate_rate(self) -> float:
+        """The fraction of duplicates within the recent window."""
+        if not self.recent:
+            return 0.0
+
+        return sum(self.recent) / len(self.recent)
+
+    @property
+    def estimated_size(self) -> Optional[int]:
+        """An estimate of the total amount of images in the category or `None` if there is not enough data."""
+        rate = self.duplicate_rate
+        if rate == 0:
+            return None
+
+        return max(len(self.digests), round(len(self.digests) / rate))
+
+    def is_saturated(self, threshold: float) -> bool:
+        """
+        Returns whether or not the category is considered exhausted.
+        This only returns `True` once the recent window is full to avoid stopping on a lucky streak of duplicates.
+
+        Parameters
+        ----------
+        threshold: :class:`float`
+            The duplicate rate at which the category is considered exhausted.
+        """
+        if len(self.recent) < (self.recent.maxlen or 0):
+            return False
+
+        return self.duplicate_rate >= threshold
+
+    def get_delay(self) -> float:
+        """
+        Returns the amount of seconds to wait before the next request.
+        The delay grows as the duplicate rate approaches 1 so that nearly exhausted categories aren't hammered.
+        """
+        rate = self.duplicate_rate
+        if rate < 0.5:
+            return 0.0
+
+        return min(self.MAX_DELAY, rate / (1 - rate) * 0.1) if rate < 1 else self.MAX_DELAY
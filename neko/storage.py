@@ -0,0 +1,137 @@
+from typing import Optional
+
+import pathlib
+import logging
+import shutil
+import errno
+import sys
+import os
+
+logger = logging.getLogger('neko')
+
+# ioctl(2) request used to share the extents of a file on copy-on-write filesystems (btrfs, xfs, ...)
+FICLONE = 0x40049409
+
+def reflink(source: pathlib.Path, destination: pathlib.Path) -> bool:
+    """
+    Tries to create a copy-on-write clone of `source` at `destination`.
+    This function returns a boolean indicating whether or not the clone was created.
+
+    Parameters
+    ----------
+    source: :class:`pathlib.Path`
+        The file to clone.
+    destination: :class:`pathlib.Path`
+        The path of the clone. This must not exist.
+    """
+    if sys.platform != 'linux':
+        return False
+
+    import fcntl
+
+    with source.open('rb') as src, destination.open('xb') as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        except OSError:
+            failed = True
+        else:
+            failed = False
+
+    if failed:
+        destination.unlink()
+
+    return not failed
+
+class ContentStore:
+    """
+    A content-addressed store of downloaded files.
+
+    Every file is stored once under its SHA-256 digest, e.g. `ab/abcdef...`, and the paths inside of the output directory
+    are hardlinks to the stored blob. When hardlinks aren't possible (e.g. the store is on another filesystem),
+    a reflink is tried and a plain copy is used as a last resort. Downloading the same content under a different
+    identifier, from the same or another provider, therefore doesn't use any extra disk.
+
+    Since the output files share their data with the store, editing one of them in place edits every other copy too.
+
+    Parameters
+    ----------
+    path: :class:`pathlib.Path`
+        The directory of the store.
+    """
+    def __init__(self, path: pathlib.Path) -> None:
+        self.path = path
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    def get_blob_path(self, digest: str) -> pathlib.Path:
+        return self.path / digest[:2] / digest
+
+    def __contains__(self, digest: str) -> bool:
+        return self.get_blob_path(digest).exists()
+
+    def get(self, digest: str) -> Optional[pathlib.Path]:
+        """
+        Returns the path of the blob with the given digest or `None` if the content isn't stored yet.
+
+        Parameters
+        ----------
+        digest: :class:`str`
+            The hex SHA-256 digest of the content.
+        """
+        path = self.get_blob_path(digest)
+        return path if path.exists() else None
+
+    def link(self, blob: pathlib.Path, path: pathlib.Path) -> None:
+        """
+        Makes `path` point to the given blob, see :class:`ContentStore`.
+        Nothing is done if `path` already exists.
+
+        Parameters
+        ----------
+        blob: :class:`pathlib.Path`
+            The stored blob.
+        path: :class:`pathlib.Path`
+            The user-facing path.
+        """
+        try:
+            os.link(blob, path)
+            return
+        except FileExistsError:
+            return
+        except OSError as e:
+            logger.info('Failed to hardlink %r (%s). Falling back to a copy.', path.name, e.strerror)
+
+        if not reflink(blob, path):
+            shutil.copyfile(blob, path)
+
+    def add(self, tmp: pathlib.Path, path: pathlib.Path, digest: str) -> bool:
+        """
+        Moves a finished download into the store and links it to its final path.
+        This function returns a boolean indicating whether or not the content was new.
+
+        Parameters
+        ----------
+        tmp: :class:`pathlib.Path`
+            The temporary file that the content was downloaded to. This is consumed.
+        path: :class:`pathlib.Path`
+            The final path of the download.
+        digest: :class:`str`
+            The hex SHA-256 digest of the content, computed while it was downloaded.
+        """
+        blob = self.get_blob_path(digest)
+
+        is_new = not blob.exists()
+        if is_new:
+            blob.parent.mkdir(exist_ok=True)
+            try:
+                os.replace(tmp, blob)
+            except OSError as e:
+                if e.errno != errno.EXDEV:
+                    raise
+
+                shutil.move(str(tmp), str(blob))
+        else:
+            tmp.unlink()
+            logger.info('%r has the same content as %r. Linking to it.', path.name, blob.name[:16])
+
+        self.link(blob, path)
+        return is_new
@@ -1,8 +1,11 @@
-from typing import Iterable, Iterator, Tuple, TypeVar, Callable, Any
+from typing import Awaitable, Dict, Generic, Hashable, Iterable, Iterator, Tuple, TypeVar, Callable, Any
 
 from enum import Enum
 import asyncio
 import itertools
+import pathlib
+import sys
+import os
 
 T = TypeVar('T')
 
@@ -31,6 +34,123 @@ def chunk(iterable: Iterable[T], size: int) -> Iterator[Tuple[T]]:
 
         yield chunk
 
+SIZE_UNITS: Dict[str, int] = {
+    'b': 1,
+    'k': 1024,
+    'm': 1024 ** 2,
+    'g': 1024 ** 3,
+    't': 1024 ** 4,
+}
+
+def parse_size(value: str) -> int:
+    """
+    Parses a size in bytes with an optional binary unit, e.g. `512`, `200K`, `1.5G` or `10MiB`.
+
+    Parameters
+    ----------
+    value: :class:`str`
+        The size.
+    """
+    text = value.strip().lower()
+    for suffix in ('ib', 'b'):
+        if text.endswith(suffix) and text[:-len(suffix)][-1:].isalpha():
+            text = text[:-len(suffix)]
+            break
+
+    multiplier = 1
+    if text[-1:] in SIZE_UNITS:
+        multiplier = SIZE_UNITS[text[-1]]
+        text = text[:-1]
+
+    try:
+        size = float(text)
+    except ValueError:
+        raise ValueError(f'Invalid size {value!r}') from None
+
+    if size < 0:
+        raise ValueError(f'Invalid size {value!r}')
+
+    return int(size * multiplier)
+
+def get_cache_directory(*parts: str) -> pathlib.Path:
+    """
+    Returns (and creates) a directory inside of the user's cache directory.
+
+    Parameters
+    ----------
+    *parts: :class:`str`
+        Sub-directories to append to the cache directory.
+    """
+    if sys.platform == 'win32':
+        root = os.environ.get('LOCALAPPDATA') or pathlib.Path.home() / 'AppData' / 'Local'
+    else:
+        root = os.environ.get('XDG_CACHE_HOME') or pathlib.Path.home() / '.cache'
+
+    path = pathlib.Path(root, 'neko', *parts)
+    path.mkdir(parents=True, exist_ok=True)
+
+    return path
+
 async def to_thread(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
     loop = asyncio.get_running_loop()
-    return await loop.run_in_executor(None, func, *args, **kwargs)
\ No newline at end of file
+    return await loop.run_in_executor(None, func, *args, **kwargs)
+
+class _Call(Generic[T]):
+    __slots__ = ('task', 'waiters')
+
+    def __init__(self, task: 'asyncio.Future[T]') -> None:
+        self.task = task
+        self.waiters = 0
+
+class SingleFlight(Generic[T]):
+    """
+    Merges concurrent calls that share the same key so that only one of them actually runs.
+    Every caller receives the same result, or the same exception if the call fails.
+
+    Cancelling one of the callers doesn't affect the others. The underlying call is only cancelled
+    once every caller waiting on it has been cancelled.
+    """
+    def __init__(self) -> None:
+        self.calls: Dict[Hashable, _Call[T]] = {}
+
+        self.total = 0
+        self.hits = 0
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.total if self.total else 0.0
+
+    def _remove(self, key: Hashable, call: _Call[T]) -> None:
+        if self.calls.get(key) is call:
+            del self.calls[key]
+
+        if not call.task.cancelled():
+            call.task.exception() # Mark the exception as retrieved in case every caller was cancelled
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[T]]) -> T:
+        """
+        Runs `func` unless a call with the same key is already in progress, in which case its result is awaited instead.
+
+        Parameters
+        ----------
+        key: Hashable
+            The key identifying the call.
+        func: Callable[[], Awaitable]
+            The function to call.
+        """
+        self.total += 1
+
+        call = self.calls.get(key)
+        if call is None:
+            call = self.calls[key] = _Call(asyncio.ensure_future(func()))
+            call.task.add_done_callback(lambda _: self._remove(key, call))
+        else:
+            self.hits += 1
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                call.task.cancel()
@@ -1,18 +1,28 @@
 from __future__ import annotations
 
-from typing import Any, List, Optional, Tuple
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple, Union
 
 from PIL import Image, ImageTk, UnidentifiedImageError, ImageSequence
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from collections import OrderedDict
 from tkinter import simpledialog
-from itertools import count
 from enum import Enum
+import multiprocessing
+import threading
 import argparse
+import queue
 import logging
 import random
 import tkinter
 import pathlib
+import hashlib
+import json
 import math
 import sys
+import os
+
+from .backends.archive import ArchiveEntry, ArchiveIndex
+from .utils import get_cache_directory
 
 class Colors(str, Enum):
     red = '\u001b[1;31m'
@@ -60,62 +70,748 @@ def create_logger():
 
 logger = create_logger()
 
-def _sort(image: str) -> Any:
-    image, _ = image.split('.')
-    if '_' in image:
-        image, page = image.split('_')
-        if 'p' in page:
-            _, page = page.split('p')
-            print(page)
+def _sort(name: str) -> Tuple[int, int, str, int]:
+    # Names look like `<id>.<ext>` or `<id>_<page>.<ext>` (`<id>_p<page>.<ext>` for pixiv). Numeric IDs are
+    # ordered numerically and before any other name so that the key never compares an int with a str.
+    stem = name.rsplit('.', 1)[0] if '.' in name else name
+
+    base, _, page = stem.rpartition('_')
+    page = page[1:] if page.startswith('p') else page
+
+    if not base or not page.isdigit():
+        base, page = stem, '0'
+
+    if base.isdigit():
+        return (0, int(base), '', int(page))
+
+    return (1, 0, base, int(page))
+
+class IndexEntry(NamedTuple):
+    name: str
+    format: Optional[str]
+    width: int
+    height: int
+    frames: int
+
+def read_header(path: pathlib.Path) -> IndexEntry:
+    """
+    Reads the format, dimensions and frame count of an image without decoding it.
+    Files that aren't images get an entry with a `None` format so that they aren't read again.
+    """
+    try:
+        with Image.open(path) as image:
+            return IndexEntry(path.name, image.format, image.width, image.height, getattr(image, 'n_frames', 1))
+    except (UnidentifiedImageError, OSError):
+        return IndexEntry(path.name, None, 0, 0, 0)
+
+class DirectoryIndex:
+    """
+    A sorted index of the images inside of a directory and its sub-directories (e.g. the `hash` and `tree` layouts
+    of neko-cli), built from file headers only. Hidden files and directories are skipped.
+
+    The index is saved next to the directory (as `.<name>.neko-index.json` in its parent) along with the
+    modification time of every indexed directory. Adding or removing a file only changes the modification time
+    of its own directory, so later launches only list the directories that changed and only read the files that
+    aren't in the index yet. If nothing changed, the files aren't touched at all.
+
+    Parameters
+    ----------
+    directory: :class:`pathlib.Path`
+        The directory to index.
+    """
+    VERSION = 2
+
+    def __init__(self, directory: pathlib.Path) -> None:
+        self.directory = directory
+        self.entries: List[IndexEntry] = []
+
+        # Relative directory (`''` being the root) -> modification time when it was last listed
+        self.directories: Dict[str, int] = {}
+
+        # Updates run on a worker thread while the index is saved from the Tk thread
+        self.lock = threading.Lock()
+
+    @property
+    def path(self) -> pathlib.Path:
+        directory = self.directory.absolute()
+        return directory.parent / f'.{directory.name}.neko-index.json'
+
+    @property
+    def images(self) -> List[pathlib.Path]:
+        return [self.directory / entry.name for entry in self.entries if entry.format is not None]
+
+    def _read(self) -> Tuple[Dict[str, int], List[IndexEntry]]:
+        try:
+            with self.path.open('r') as file:
+                data = json.load(file)
+
+            if data['version'] != self.VERSION:
+                return {}, []
+
+            return data['directories'], [IndexEntry(*entry) for entry in data['entries']]
+        except FileNotFoundError:
+            return {}, []
+        except (ValueError, KeyError, TypeError):
+            logger.warning('Ignoring corrupted index %r.', self.path.name)
+            return {}, []
+
+    def save(self) -> None:
+        with self.lock:
+            data = {
+                'version': self.VERSION,
+                'directories': dict(self.directories),
+                'entries': [list(entry) for entry in self.entries],
+            }
+
+        tmp = self.path.with_suffix('.tmp')
+        try:
+            with tmp.open('w') as file:
+                json.dump(data, file)
+
+            tmp.replace(self.path)
+        except OSError:
+            logger.warning('Failed to save the index of %r.', str(self.directory), exc_info=True)
+
+    def _list(self, relative: str) -> Tuple[int, List[str], List[str]]:
+        path = self.directory / relative
+
+        # Taken before listing so that files added in the meantime are picked up by the next scan
+        mtime = path.stat().st_mtime_ns
+
+        files: List[str] = []
+        directories: List[str] = []
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.name.startswith('.') or entry.name.endswith('.tmp'):
+                    continue
+
+                name = f'{relative}/{entry.name}' if relative else entry.name
+                if entry.is_dir():
+                    directories.append(name)
+                elif entry.is_file():
+                    files.append(name)
+
+        return mtime, files, directories
+
+    def _read_header(self, name: str) -> IndexEntry:
+        return read_header(self.directory / name)._replace(name=name)
+
+    def _scan(self, *, workers: Optional[int] = None) -> Optional[List[IndexEntry]]:
+        # Returns the new entries or `None` if nothing changed
+        pending: List[str] = []
+        removed = False
+
+        for relative, mtime in list(self.directories.items()):
+            try:
+                current = (self.directory / relative).stat().st_mtime_ns
+            except FileNotFoundError:
+                del self.directories[relative]
+                removed = True
+
+                continue
+
+            if current != mtime:
+                pending.append(relative)
+
+        if '' not in self.directories:
+            pending.append('')
+
+        listed: Dict[str, List[str]] = {}
+        while pending:
+            relative = pending.pop()
+            try:
+                mtime, files, directories = self._list(relative)
+            except FileNotFoundError:
+                self.directories.pop(relative, None)
+                removed = True
+
+                continue
+
+            self.directories[relative] = mtime
+            listed[relative] = files
+
+            pending.extend(directory for directory in directories if directory not in self.directories)
+
+        if not listed and not removed:
+            return None
+
+        known = {entry.name: entry for entry in self.entries}
+        names = [name for files in listed.values() for name in files]
 
-        return int(image) if image.isdigit() else image, int(page) if page.isdigit() else page
+        new = [name for name in names if name not in known]
+        added: List[IndexEntry] = []
 
-    if not image.isdigit():
-        return (image, 0)
-    
-    return (int(image), 0)
+        if new:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                added.extend(executor.map(self._read_header, new))
 
-# From https://stackoverflow.com/a/43770948
+            logger.info('Indexed %d new files in %r.', len(new), str(self.directory))
+
+        # Entries of directories that were listed again are replaced and the ones of removed directories are dropped
+        entries: List[IndexEntry] = []
+        for entry in self.entries:
+            parent = entry.name.rpartition('/')[0]
+            if parent in self.directories and parent not in listed:
+                entries.append(entry)
+
+        entries.extend(added)
+        entries.extend(known[name] for name in names if name in known)
+
+        self.entries = sorted(entries, key=lambda entry: _sort(entry.name.rpartition('/')[2]))
+        return added
+
+    def load(self, *, workers: Optional[int] = None) -> List[pathlib.Path]:
+        """
+        Loads the index from disk, listing the directories that changed since it was saved first.
+
+        Parameters
+        ----------
+        workers: Optional[:class:`int`]
+            The amount of threads used to read headers.
+        """
+        self.directories, self.entries = self._read()
+
+        with self.lock:
+            added = self._scan(workers=workers)
+
+        if added is None:
+            logger.info('Loaded the index of %r with %d files.', str(self.directory), len(self.entries))
+        else:
+            self.save()
+
+        return self.images
+
+    def update(self) -> List[pathlib.Path]:
+        """
+        Picks up the files that were added since the last call to :meth:`load` or :meth:`update`.
+        This only costs a `stat` per indexed directory if nothing changed. The index isn't saved, see :meth:`save`.
+
+        Returns
+        -------
+        :class:`list` of :class:`pathlib.Path`
+            The new images.
+        """
+        with self.lock:
+            added = self._scan()
+
+        if not added:
+            return []
+
+        return [self.directory / entry.name for entry in added if entry.format is not None]
+
+JPEG_EXTENSIONS = ('.jpg', '.jpeg', '.jfif')
+# Only the first frame of these is decoded up front, which isn't worth sending to a process
+ANIMATED_EXTENSIONS = ('.gif', '.webp')
+
+# Set in the `info` of the first frame returned by `decode_image` for animated images. Unlike `is_animated`,
+# it survives the image being pickled back from a worker process (e.g. animated PNGs).
+ANIMATED_INFO_KEY = 'neko.animated'
+
+def is_animated(image: Image.Image) -> bool:
+    return bool(getattr(image, 'is_animated', False) or image.info.get(ANIMATED_INFO_KEY))
+
+def get_target_size(width: int, height: int, max_width: int, max_height: int) -> Tuple[int, int]:
+    if width > height:
+        return max_width, math.ceil(height * (max_width / width))
+
+    return math.ceil(width * (max_height / height)), max_height
+
+# Images are either files or downloads stored inside of an archive by the archive backend of neko-cli
+ImageSource = Union[pathlib.Path, ArchiveEntry]
+
+def open_image(source: ImageSource) -> Image.Image:
+    if isinstance(source, ArchiveEntry):
+        return Image.open(source.open())
+
+    return Image.open(source)
+
+def decode_image(path: ImageSource, max_size: Tuple[int, int], thumbnails: Optional[ThumbnailCache] = None) -> Image.Image:
+    """
+    Decodes the given image and resizes it to fit within `max_size`.
+    This is meant to run inside of a worker thread or process.
+
+    JPEGs are decoded with :meth:`PIL.Image.Image.draft`, which lets the decoder skip most of the work
+    by decoding at the smallest scale that is still bigger than the target size.
+    Of animated images only the first frame is decoded, see :func:`is_animated`. The rest is decoded
+    by :class:`FrameStream` while playing, so no file stays open while the image is cached.
+
+    Parameters
+    ----------
+    path: Union[:class:`pathlib.Path`, :class:`ArchiveEntry`]
+        The image.
+    max_size: Tuple[:class:`int`, :class:`int`]
+        The maximum width and height of the resized image.
+    thumbnails: Optional[:class:`ThumbnailCache`]
+        The cache to read the resized image from or store it into.
+    """
+    image = open_image(path)
+    width, height = max_size
+
+    if getattr(image, 'is_animated', False):
+        with image:
+            first = image.convert('RGBA').resize(get_target_size(image.width, image.height, width, height))
+
+        first.info[ANIMATED_INFO_KEY] = True
+        return first
+    if thumbnails is not None:
+        cached = thumbnails.get(path, width, height)
+        if cached is not None:
+            image.close()
+            return cached
+
+    with image:
+        size = get_target_size(image.width, image.height, width, height)
+        if image.format == 'JPEG':
+            image.draft(image.mode, size)
+
+        resized = image.resize(size)
+
+    if thumbnails is not None:
+        thumbnails.put(path, width, height, resized)
+
+    return resized
+
+class ImageCache:
+    """
+    A thread-safe LRU of decoded images that is bounded by the memory used by the images rather than their amount.
+
+    Parameters
+    ----------
+    budget: :class:`int`
+        The maximum amount of bytes used by the cached images.
+    """
+    def __init__(self, budget: int) -> None:
+        self.budget = budget
+        self.size = 0
+
+        self.images: OrderedDict[ImageSource, Image.Image] = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __contains__(self, path: ImageSource) -> bool:
+        return path in self.images
+
+    def __len__(self) -> int:
+        return len(self.images)
+
+    @staticmethod
+    def get_image_size(image: Image.Image) -> int:
+        return image.width * image.height * len(image.getbands())
+
+    def get(self, path: ImageSource) -> Optional[Image.Image]:
+        with self.lock:
+            image = self.images.get(path)
+            if image is not None:
+                self.images.move_to_end(path)
+
+            return image
+
+    def put(self, path: ImageSource, image: Image.Image) -> None:
+        with self.lock:
+            previous = self.images.pop(path, None)
+            if previous is not None:
+                self.size -= self.get_image_size(previous)
+
+            self.images[path] = image
+            self.size += self.get_image_size(image)
+
+            # Always keep at least the image that was just added, even if it's bigger than the budget by itself
+            while self.size > self.budget and len(self.images) > 1:
+                _, evicted = self.images.popitem(last=False)
+                self.size -= self.get_image_size(evicted)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.images.clear()
+            self.size = 0
+
+class ThumbnailCache:
+    """
+    A sharded on-disk cache of resized images.
+
+    Every source file gets its own directory, named after the hash of its path, which holds one file per
+    rendition. Renditions are named after the modification time and size of the source as well as the target
+    dimensions, so a source that changes never matches its old renditions, which are removed on the next write.
+
+    Parameters
+    ----------
+    path: Optional[:class:`pathlib.Path`]
+        The cache directory. Defaults to `thumbnails` inside of the user's cache directory.
+    """
+    def __init__(self, path: Optional[pathlib.Path] = None) -> None:
+        self.path = path or get_cache_directory('thumbnails')
+
+    def get_directory(self, source: ImageSource) -> pathlib.Path:
+        if isinstance(source, ArchiveEntry):
+            name = f'{source.volume.absolute()}:{source.member}'
+        else:
+            name = str(source.absolute())
+
+        key = hashlib.sha1(name.encode()).hexdigest()
+        return self.path / key[:2] / key[2:]
+
+    @staticmethod
+    def get_version(source: ImageSource) -> str:
+        # Archived content never changes in place, a download that is stored again gets a new offset
+        if isinstance(source, ArchiveEntry):
+            return f'{source.offset:x}-{source.size:x}'
+
+        stat = source.stat()
+        return f'{stat.st_mtime_ns:x}-{stat.st_size:x}'
+
+    def get(self, source: ImageSource, width: int, height: int) -> Optional[Image.Image]:
+        """
+        Returns the cached rendition of `source` for the given dimensions or `None` if there is none.
+        """
+        try:
+            version = self.get_version(source)
+            path = self.get_directory(source) / f'{version}-{width}x{height}'
+
+            with Image.open(path) as image:
+                image.load()
+                return image
+        except FileNotFoundError:
+            return None
+        except (OSError, UnidentifiedImageError):
+            logger.warning('Ignoring corrupted thumbnail for %r.', source.name)
+            return None
+
+    def put(self, source: ImageSource, width: int, height: int, image: Image.Image) -> None:
+        """
+        Stores a rendition of `source` for the given dimensions and removes stale renditions.
+        """
+        try:
+            version = self.get_version(source)
+            directory = self.get_directory(source)
+
+            directory.mkdir(parents=True, exist_ok=True)
+            for entry in directory.iterdir():
+                if not entry.name.startswith(f'{version}-'):
+                    entry.unlink()
+
+            path = directory / f'{version}-{width}x{height}'
+            tmp = path.with_suffix('.tmp')
+
+            if image.mode in ('RGB', 'L'):
+                image.save(tmp, format='JPEG', quality=90)
+            else:
+                image.save(tmp, format='PNG')
+
+            tmp.replace(path)
+        except OSError:
+            logger.warning('Failed to cache thumbnail for %r.', source.name, exc_info=True)
+
+class FrameStream(threading.Thread):
+    """
+    Decodes and resizes the frames of an animated image in the background.
+
+    Prepared frames are kept in a small bounded buffer ahead of playback, which means that long animations
+    start playing immediately and use a constant amount of memory no matter how many frames they have.
+    The animation is looped until :meth:`stop` is called.
+
+    Parameters
+    ----------
+    source: Union[:class:`str`, :class:`pathlib.Path`, :class:`ArchiveEntry`]
+        The animated image. It's opened separately so that the thread never shares an image with the caller.
+    size: Tuple[:class:`int`, :class:`int`]
+        The size to resize every frame to.
+    buffer: :class:`int`
+        The maximum amount of prepared frames. Defaults to 8.
+    """
+    def __init__(self, source: Union[str, ImageSource], size: Tuple[int, int], *, buffer: int = 8) -> None:
+        super().__init__(name='neko-viewer-frames', daemon=True)
+
+        self.source = pathlib.Path(source) if isinstance(source, str) else source
+        self.size = size
+
+        self.frames: queue.Queue[Tuple[Image.Image, int]] = queue.Queue(maxsize=buffer)
+        self.stopped = threading.Event()
+
+    def stop(self) -> None:
+        self.stopped.set()
+
+    def _put(self, frame: Image.Image, duration: int) -> None:
+        while not self.stopped.is_set():
+            try:
+                self.frames.put((frame, duration), timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def run(self) -> None:
+        try:
+            with open_image(self.source) as image:
+                while not self.stopped.is_set():
+                    for frame in ImageSequence.Iterator(image):
+                        if self.stopped.is_set():
+                            return
+
+                        duration = frame.info.get('duration') or 100
+                        self._put(frame.convert('RGBA').resize(self.size), duration)
+        except Exception:
+            logger.error('Error while playing %r.', self.source.name, exc_info=True)
+
+# Originally based on https://stackoverflow.com/a/43770948
 class ImageLabel(tkinter.Label):
-    def load(self, image: Image.Image, width: int, height: int):
-        self.location = 0
-        self.frames: List[ImageTk.PhotoImage] = []
+    POLL_INTERVAL = 10
+
+    def load(
+        self, 
+        image: Image.Image, 
+        width: int, 
+        height: int, 
+        *, 
+        size: Optional[Tuple[int, int]] = None, 
+        source: Optional[ImageSource] = None
+    ):
         self.width = width
         self.height = height
         self.after_id: Optional[str] = None
+        self.stream: Optional[FrameStream] = None
+
+        if is_animated(image):
+            self.stream = FrameStream(source or image.filename, size or image.size) # type: ignore
+            self.stream.start()
+
+            # The first frame is already decoded, so it's shown until the stream catches up
+            self.frame = ImageTk.PhotoImage(image)
+            self.config(image=self.frame, width=width, height=height, anchor='center')
 
-        try:
-            for frame in count(1):
-                self.frames.append(ImageTk.PhotoImage(image.copy()))
-                image.seek(frame)
-        except EOFError:
-            pass
-
-        self.delay = image.info.get('duration', 100)
-        if len(self.frames) == 1:
-            self.config(image=self.frames[0], width=width, height=height, anchor='center')
-        else:
             self.next_frame()
+        else:
+            self.frame = ImageTk.PhotoImage(image)
+            self.config(image=self.frame, width=width, height=height, anchor='center')
 
     def unload(self):
         self.config(image='')
-        self.frames = []
-        self.loc = 0
-        self.delay = 0
+        self.frame = None
+
+        if getattr(self, 'stream', None) is not None:
+            self.stream.stop() # type: ignore
+            self.stream = None
 
-        if hasattr(self, 'after_id') and self.after_id:
-            self.after_cancel(self.after_id)
+        if getattr(self, 'after_id', None):
+            self.after_cancel(self.after_id) # type: ignore
             self.after_id = None
 
     def next_frame(self):
-        if self.frames:
-            self.location += 1
-            self.location %= len(self.frames)
+        if self.stream is None:
+            return
+
+        try:
+            frame, delay = self.stream.frames.get_nowait()
+        except queue.Empty:
+            # The next frame isn't ready yet, so the current one stays up a little longer
+            self.after_id = self.after(self.POLL_INTERVAL, self.next_frame)
+            return
+
+        self.frame = ImageTk.PhotoImage(frame)
+        self.config(image=self.frame, width=self.width, height=self.height, anchor='center')
+        
+        self.after_id = self.after(delay, self.next_frame)
+
+class ThumbnailGrid(tkinter.Frame):
+    """
+    A virtualized contact sheet of every image in the application.
+
+    Only the cells inside of the viewport, plus `margin` rows above and below it, have a canvas item and a Tk image.
+    Every other cell is just a position computed from its index, so the cost of scrolling doesn't depend on the amount of images.
+    Thumbnails are decoded off-thread (through the thumbnail cache when enabled) and kept in a small LRU once their cell scrolls away.
+
+    Parameters
+    ----------
+    app: :class:`Application`
+        The application the grid belongs to.
+    size: :class:`int`
+        The size of a thumbnail. Defaults to 160.
+    margin: :class:`int`
+        The amount of rows rendered above and below the viewport. Defaults to 2.
+    memory_budget: :class:`int`
+        The maximum amount of bytes used by thumbnails that aren't rendered. Defaults to 32 MiB.
+    """
+    PADDING = 4
+    POLL_INTERVAL = 15
+
+    def __init__(self, app: Application, *, size: int = 160, margin: int = 2, memory_budget: int = 32 * 1024 * 1024) -> None:
+        super().__init__(app)
+
+        self.app = app
+        self.size = size
+        self.margin = margin
+        self.offset = 0
+
+        self.cache = ImageCache(memory_budget)
+        self.items: Dict[int, int] = {}
+        self.photos: Dict[int, ImageTk.PhotoImage] = {}
+
+        self.decoding: Dict[ImageSource, Future[Image.Image]] = {}
+        self.decoded: queue.Queue[Tuple[ImageSource, Future[Image.Image]]] = queue.Queue()
+        self.poll_id: Optional[str] = None
+
+        self.canvas = tkinter.Canvas(self, highlightthickness=0, background='black')
+        self.scrollbar = tkinter.Scrollbar(self, orient='vertical', command=self.yview)
+
+        self.scrollbar.pack(side='right', fill='y')
+        self.canvas.pack(side='left', fill='both', expand=True)
+
+        self.canvas.bind('<Configure>', lambda _: self.refresh())
+        self.canvas.bind('<Button-1>', self.click)
+        self.canvas.bind('<MouseWheel>', self.wheel)
+        self.canvas.bind('<Button-4>', self.wheel)
+        self.canvas.bind('<Button-5>', self.wheel)
+
+    @property
+    def cell(self) -> int:
+        return self.size + self.PADDING * 2
+
+    @property
+    def columns(self) -> int:
+        return max(1, self.canvas.winfo_width() // self.cell)
+
+    @property
+    def content_height(self) -> int:
+        return math.ceil(len(self.app.images) / self.columns) * self.cell
+
+    def start(self) -> None:
+        if self.poll_id is None:
+            self.poll()
+
+    def stop(self) -> None:
+        if self.poll_id is not None:
+            self.after_cancel(self.poll_id)
+            self.poll_id = None
+
+        for future in self.decoding.values():
+            future.cancel()
+
+        self.decoding.clear()
+
+    def refresh(self) -> None:
+        """
+        Drops every rendered cell and renders the viewport again, for example after the images were shuffled.
+        """
+        self.canvas.delete('all')
+
+        self.items.clear()
+        self.photos.clear()
+
+        self.scroll_to_offset(self.offset)
+
+    def yview(self, *args: str) -> None:
+        # Implements the scrollbar protocol, e.g. ('moveto', '0.5') or ('scroll', '1', 'pages')
+        if args[0] == 'moveto':
+            self.scroll_to_offset(round(float(args[1]) * self.content_height))
+        elif args[0] == 'scroll':
+            step = self.cell if args[2] == 'units' else self.canvas.winfo_height()
+            self.scroll_to_offset(self.offset + int(args[1]) * step)
+
+    def wheel(self, event: Any) -> None:
+        direction = -1 if event.num == 4 or event.delta > 0 else 1
+        self.scroll_to_offset(self.offset + direction * self.cell)
+
+    def scroll_to_offset(self, offset: int) -> None:
+        maximum = max(0, self.content_height - self.canvas.winfo_height())
+        self.offset = min(max(0, offset), maximum)
+
+        self.render()
+
+    def scroll_to(self, index: int) -> None:
+        """
+        Scrolls the grid so that the given index is in the middle of the viewport.
+        """
+        row = index // self.columns
+        self.scroll_to_offset(row * self.cell - (self.canvas.winfo_height() - self.cell) // 2)
+
+    def click(self, event: Any) -> None:
+        column = event.x // self.cell
+        index = (event.y + self.offset) // self.cell * self.columns + column
+
+        if column < self.columns and index < len(self.app.images):
+            self.app.close_grid()
+            self.app.show(index)
+
+    def get_visible_range(self) -> range:
+        height = self.canvas.winfo_height()
+        columns = self.columns
+
+        first = max(0, self.offset // self.cell - self.margin)
+        last = (self.offset + height) // self.cell + self.margin
+
+        return range(first * columns, min(len(self.app.images), (last + 1) * columns))
+
+    def render(self) -> None:
+        visible = self.get_visible_range()
+        columns = self.columns
+
+        for index in list(self.items):
+            if index not in visible:
+                self.canvas.delete(self.items.pop(index))
+                self.photos.pop(index, None)
+
+        paths = set()
+        for index in visible:
+            path = self.app.images[index]
+            paths.add(path)
 
-            frame = self.frames[self.location]
-            self.config(image=frame, width=self.width, height=self.height, anchor='center')
-            
-            self.after_id = self.after(self.delay, self.next_frame)
+            x = (index % columns) * self.cell + self.cell // 2
+            y = (index // columns) * self.cell - self.offset + self.cell // 2
+
+            item = self.items.get(index)
+            if item is not None:
+                self.canvas.coords(item, x, y)
+                continue
+
+            self.items[index] = self.canvas.create_image(x, y, anchor='center')
+
+            image = self.cache.get(path)
+            if image is not None:
+                self.set_thumbnail(index, image)
+            else:
+                self.submit(path)
+
+        # Anything that scrolled out of view before it was decoded isn't needed anymore
+        for path, future in list(self.decoding.items()):
+            if path not in paths and future.cancel():
+                del self.decoding[path]
+
+        content = self.content_height or 1
+        self.scrollbar.set(self.offset / content, (self.offset + self.canvas.winfo_height()) / content)
+
+    def set_thumbnail(self, index: int, image: Image.Image) -> None:
+        photo = ImageTk.PhotoImage(image)
+
+        self.photos[index] = photo
+        self.canvas.itemconfigure(self.items[index], image=photo)
+
+    def submit(self, path: ImageSource) -> None:
+        if path in self.decoding:
+            return
+
+        future = self.app.get_executor(path).submit(decode_image, path, (self.size, self.size), self.app.thumbnails)
+        future.add_done_callback(lambda future: self.decoded.put((path, future)))
+
+        self.decoding[path] = future
+
+    def poll(self) -> None:
+        while True:
+            try:
+                path, future = self.decoded.get_nowait()
+            except queue.Empty:
+                break
+
+            if self.decoding.get(path) is future:
+                del self.decoding[path]
+
+            if future.cancelled() or future.exception() is not None:
+                continue
+
+            image = future.result()
+            self.cache.put(path, image)
+
+            for index in self.get_visible_range():
+                if self.app.images[index] == path and index in self.items:
+                    self.set_thumbnail(index, image)
+
+        self.poll_id = self.after(self.POLL_INTERVAL, self.poll)
 
 class Application(tkinter.Tk):
     def __init__(
@@ -125,6 +821,12 @@ class Application(tkinter.Tk):
         duration: int = 1, 
         width: int = 720,
         height: int = 720,
+        memory_budget: int = 256 * 1024 * 1024,
+        prefetch: int = 2,
+        thumbnails: Optional[ThumbnailCache] = None,
+        workers: Optional[int] = None,
+        watch: bool = False,
+        thumbnail_size: int = 160,
         **kwargs: Any
     ) -> None:
         super().__init__(*args, **kwargs)
@@ -132,10 +834,30 @@ class Application(tkinter.Tk):
         self.height = height
         self.width = width
 
+        self.cache = ImageCache(memory_budget)
+        self.thumbnails = thumbnails
+        self.prefetch_count = prefetch
+
+        self.workers = workers or os.cpu_count() or 1
+        self.threads = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='neko-viewer-decode')
+        self._processes: Optional[ProcessPoolExecutor] = None
+
+        # Finished decodes are handed back to the Tk loop through this queue, see `poll`
+        self.decoding: Dict[ImageSource, Future[Image.Image]] = {}
+        self.decoded: queue.Queue[Tuple[ImageSource, Future[Image.Image]]] = queue.Queue()
+        self.waiting: Optional[ImageSource] = None
+        self.poll_id: Optional[str] = None
+
+        self.indexes: List[DirectoryIndex] = []
+        self.archives: List[ArchiveIndex] = []
+        self.discovered: queue.Queue[List[ImageSource]] = queue.Queue()
+        self.watch_id: Optional[str] = None
+        self.watching: Optional[Future[None]] = None
+
         if not paths:
-            self.images: List[Tuple[Image.Image, str]] = []
+            self.images: List[ImageSource] = []
         else:
-            self.images: List[Tuple[Image.Image, str]] = self.load_images([pathlib.Path(path) for path in paths])
+            self.images: List[ImageSource] = self.load_images([pathlib.Path(path) for path in paths])
 
         self.duration = duration
         self.index = -1
@@ -144,6 +866,10 @@ class Application(tkinter.Tk):
         self.current_image: Optional[Image.Image] = None
         self.is_fullscreen = False
 
+        self.thumbnail_size = thumbnail_size
+        self.grid_view: Optional[ThumbnailGrid] = None
+        self.is_grid_shown = False
+
         self.title('Image viewer')
         self.geometry(f'{self.width}x{self.height}')
 
@@ -153,6 +879,10 @@ class Application(tkinter.Tk):
         self.setup_menu()
         self.setup_keybinds()
 
+        self.poll()
+        if watch:
+            self.watch()
+
     def setup_menu(self):
         root = tkinter.Menu(self)
         self.config(menu=root)
@@ -165,6 +895,7 @@ class Application(tkinter.Tk):
         root.add_command(label='Random', command=self.random, accelerator='Ctrl+R')
         root.add_command(label='Back', command=self.back, accelerator='Ctrl+B')
         root.add_command(label='Goto', command=self.goto, accelerator='Ctrl+G')
+        root.add_command(label='Grid', command=self.toggle_grid, accelerator='Ctrl+T')
 
     def setup_keybinds(self):
         self.bind('<Right>', self.next)
@@ -175,26 +906,229 @@ class Application(tkinter.Tk):
         self.bind('<Control-r>', self.random)
         self.bind('<Control-b>', self.back)
         self.bind('<Control-g>', self.goto)
+        self.bind('<Control-t>', self.toggle_grid)
         self.bind('<Control-q>', self.destroy)
         self.bind('<F11>', self.fullscreen)
 
-    def load_images(self, paths: List[pathlib.Path]) -> List[Tuple[Image.Image, str]]:
-        images: List[Tuple[Image.Image, str]] = []
-        failed = 0
-
+    def load_images(self, paths: List[pathlib.Path]) -> List[ImageSource]:
+        """
+        Indexes the images inside of the given directories, see :class:`DirectoryIndex`.
+        Directories written by the archive backend of neko-cli are read through their :class:`ArchiveIndex` instead.
+        Images are only decoded once they are shown (or prefetched), see :meth:`load`.
+        """
+        images: List[ImageSource] = []
         for dir in paths:
-            for file in dir.iterdir():
-                try:
-                    image = self.resize(Image.open(file))
-                    images.append((image, file.name))
-                except UnidentifiedImageError:
-                    logger.error('Error while loading %r.', file.name, exc_info=True)
-                    failed += 1
+            if ArchiveIndex.exists(dir):
+                archive = ArchiveIndex(dir)
+                images.extend(sorted(self.get_archived_images(archive.update()), key=lambda entry: _sort(entry.name)))
+
+                self.archives.append(archive)
+                continue
+
+            index = DirectoryIndex(dir)
+            images.extend(index.load(workers=self.workers))
+
+            self.indexes.append(index)
+
+        if len(paths) > 1:
+            images.sort(key=lambda image: _sort(image.name))
+
+        logger.info('Found %d images.', len(images))
+        return images
+
+    @staticmethod
+    def get_archived_images(entries: List[ArchiveEntry]) -> List[ArchiveEntry]:
+        extensions = Image.registered_extensions()
+        return [entry for entry in entries if entry.suffix.lower() in extensions]
+
+    def _update_indexes(self) -> None:
+        for archive in self.archives:
+            try:
+                entries = self.get_archived_images(archive.update())
+            except OSError:
+                logger.error('Failed to update the archive index of %r.', str(archive.directory), exc_info=True)
+                continue
+
+            if entries:
+                self.discovered.put(entries)
+
+        for index in self.indexes:
+            try:
+                images = index.update()
+            except OSError:
+                logger.error('Failed to update the index of %r.', str(index.directory), exc_info=True)
+                continue
+
+            if images:
+                self.discovered.put(images)
+
+    def watch(self, interval: int = 500) -> None:
+        """
+        Periodically checks the indexed directories for new files, for example while they are still being downloaded.
+        New images are added to the list without rescanning or decoding the existing ones.
+
+        Parameters
+        ----------
+        interval: :class:`int`
+            The amount of milliseconds between checks. Defaults to 500.
+        """
+        if self.watching is None or self.watching.done():
+            self.watching = self.threads.submit(self._update_indexes)
+
+        self.watch_id = self.after(interval, self.watch, interval)
+
+    def add_images(self, images: List[ImageSource]) -> None:
+        """
+        Appends new images to the list, in the order they were discovered so that the current index stays valid.
+        The first image is shown automatically if nothing was shown yet.
+
+        Parameters
+        ----------
+        images: :class:`list` of :class:`pathlib.Path` or :class:`ArchiveEntry`
+            The images to add.
+        """
+        self.images.extend(images)
+        logger.info('Found %d new images.', len(images))
+
+        if self.grid_view is not None and self.is_grid_shown:
+            self.grid_view.render()
+
+        if self.index < 0:
+            self.next()
+        elif self.waiting is None:
+            path = self.images[self.index]
+            self.title(f'{path.name} | ({self.index + 1}/{len(self.images)})')
+
+    @property
+    def processes(self) -> ProcessPoolExecutor:
+        # Spawned rather than forked since forking a process that is running Tk isn't safe
+        if self._processes is None:
+            context = multiprocessing.get_context('spawn')
+            self._processes = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+
+        return self._processes
+
+    def decode(self, path: ImageSource) -> Image.Image:
+        image = decode_image(path, (self.width, self.height), self.thumbnails)
+        logger.info('Loaded %r with size %dx%d.', path.name, image.width, image.height)
+
+        return image
+
+    def load(self, path: ImageSource) -> Image.Image:
+        """
+        Returns the decoded and resized image for the given path, decoding it in the calling thread if it isn't cached.
+
+        Parameters
+        ----------
+        path: :class:`pathlib.Path` or :class:`ArchiveEntry`
+            The path of the image.
+        """
+        image = self.cache.get(path)
+        if image is None:
+            image = self.decode(path)
+            self.cache.put(path, image)
+
+        return image
+
+    def get_executor(self, path: ImageSource) -> Executor:
+        """
+        Returns the executor used to decode the given image.
+        JPEGs and animated images are decoded by threads, everything else (mostly PNGs, which are CPU-bound) by processes.
+        """
+        suffix = path.suffix.lower()
+        if suffix in JPEG_EXTENSIONS or suffix in ANIMATED_EXTENSIONS:
+            return self.threads
+
+        return self.processes
+
+    def submit(self, path: ImageSource) -> None:
+        """
+        Starts decoding the given image in the background, see :meth:`get_executor`.
+
+        Parameters
+        ----------
+        path: :class:`pathlib.Path` or :class:`ArchiveEntry`
+            The path of the image.
+        """
+        if path in self.decoding or path in self.cache:
+            return
+
+        future = self.get_executor(path).submit(decode_image, path, (self.width, self.height), self.thumbnails)
+        future.add_done_callback(lambda future: self.decoded.put((path, future)))
+
+        self.decoding[path] = future
+
+    def poll(self) -> None:
+        """
+        Moves finished decodes into the cache and shows the image that is being waited on once it's ready.
+        Newly discovered images are added to the list as well.
+        """
+        while True:
+            try:
+                images = self.discovered.get_nowait()
+            except queue.Empty:
+                break
+
+            self.add_images(images)
+
+        while True:
+            try:
+                path, future = self.decoded.get_nowait()
+            except queue.Empty:
+                break
+
+            if self.decoding.get(path) is future:
+                del self.decoding[path]
+
+            if future.cancelled():
+                continue
+
+            error = future.exception()
+            if error is None:
+                image = future.result()
+                self.cache.put(path, image)
+
+                logger.info('Loaded %r with size %dx%d.', path.name, image.width, image.height)
+
+            if path == self.waiting:
+                self.waiting = None
+                if error is not None:
+                    logger.error('Error while loading %r.', path.name, exc_info=error)
+                    self.remove(path)
                 else:
-                    logger.info('Loaded %r with size %dx%d.', file.name, image.width, image.height)
+                    self.display(path, image)
+
+        self.poll_id = self.after(10, self.poll)
 
-        logger.info('Loaded %d/%d images.', len(images) - failed, len(images))
-        return sorted(images, key=lambda image: _sort(image[1]))
+    def prefetch(self) -> None:
+        """
+        Decodes the images around the current index in the background so that navigating to them is instant.
+        """
+        if not self.images:
+            return
+
+        wanted: List[ImageSource] = []
+        for offset in range(1, self.prefetch_count + 1):
+            for index in (self.index + offset, self.index - offset):
+                path = self.images[index % len(self.images)]
+                if path not in wanted:
+                    wanted.append(path)
+
+        for path, future in list(self.decoding.items()):
+            if path not in wanted and path != self.waiting and future.cancel():
+                del self.decoding[path]
+
+        for path in wanted:
+            self.submit(path)
+
+    def get_target_size(
+        self, 
+        image: Image.Image, 
+        *, 
+        max_width: Optional[int] = None, 
+        max_height: Optional[int] = None,
+    ) -> Tuple[int, int]:
+        return get_target_size(image.width, image.height, max_width or self.width, max_height or self.height)
 
     def resize(
         self, 
@@ -203,30 +1137,41 @@ class Application(tkinter.Tk):
         max_width: Optional[int] = None, 
         max_height: Optional[int] = None,
     ) -> Image.Image:
-        max_width = max_width or self.width
-        max_height = max_height or self.height
-
-        width, height = image.width, image.height
-        if width > height:
-            ratio = max_height / width
-            width = max_width
-            height = math.ceil(height * ratio)
-        else:
-            ratio = max_width / height
-            height = max_height
-            width = math.ceil(width * ratio)
-
-        if image.format == 'GIF':
-            for frame in ImageSequence.Iterator(image):
-                frame.resize((width, height))
-            
-            return image
- 
-        return image.resize((width, height))
+        return image.resize(self.get_target_size(image, max_width=max_width, max_height=max_height))
 
-    def set_image(self, image: Image.Image) -> None:
+    def set_image(self, image: Image.Image, source: Optional[ImageSource] = None) -> None:
         self.current_image = image
-        self.slide.load(image, self.width, self.height)
+        self.slide.load(image, self.width, self.height, size=self.get_target_size(image), source=source)
+
+    def toggle_grid(self, *args: Any) -> None:
+        """
+        Switches between showing a single image and the thumbnail grid.
+        """
+        if self.is_grid_shown:
+            self.close_grid()
+            return
+
+        if self.grid_view is None:
+            self.grid_view = ThumbnailGrid(self, size=self.thumbnail_size)
+
+        self.slide.pack_forget()
+        self.grid_view.pack(fill='both', expand=True)
+        self.is_grid_shown = True
+
+        self.grid_view.start()
+        self.update_idletasks()
+
+        self.grid_view.scroll_to(max(self.index, 0))
+
+    def close_grid(self) -> None:
+        if self.grid_view is None or not self.is_grid_shown:
+            return
+
+        self.grid_view.stop()
+        self.grid_view.pack_forget()
+        self.is_grid_shown = False
+
+        self.slide.pack()
 
     def fullscreen(self, *args: Any) -> None:
         if self.is_fullscreen:
@@ -236,33 +1181,84 @@ class Application(tkinter.Tk):
             self.attributes('-fullscreen', True)
             self.is_fullscreen = True
 
-    def show(self, image: Image.Image, name: str):
+    def show(self, index: int) -> None:
+        """
+        Shows the image at the given index.
+        If the image isn't decoded yet, it's shown as soon as it is. Images that fail to load are removed
+        from the list and the next one is shown instead.
+
+        Parameters
+        ----------
+        index: :class:`int`
+            The index of the image.
+        """
+        if not self.images:
+            self.slide.unload()
+            self.title('Image viewer')
+
+            return
+
+        self.index = index % len(self.images)
+        path = self.images[self.index]
+
+        image = self.cache.get(path)
+        if image is not None:
+            self.waiting = None
+            self.display(path, image)
+
+            return
+
+        self.waiting = path
+        self.submit(path)
+
+        self.title(f'{path.name} | ({self.index + 1}/{len(self.images)}) | Loading...')
+        self.prefetch()
+
+    def display(self, path: ImageSource, image: Image.Image) -> None:
         self.slide.unload()
-        self.set_image(image)
+        self.set_image(image, path)
 
-        logger.info('Showing %r', name)
-        self.title(f'{name} | ({self.index + 1}/{len(self.images)})')
+        logger.info('Showing %r', path.name)
+        self.title(f'{path.name} | ({self.index + 1}/{len(self.images)})')
 
-    def next(self, *args: Any) -> None:
-        self.last_index = self.index
-        self.index += 1
+        self.prefetch()
 
+    def remove(self, path: ImageSource) -> None:
+        """
+        Removes an image from the list, showing the next one if it was the current image.
+
+        Parameters
+        ----------
+        path: :class:`pathlib.Path` or :class:`ArchiveEntry`
+            The path of the image.
+        """
         try:
-            image, name = self.images[self.index]
-        except IndexError:
-            self.index = 0
-            image, name = self.images[self.index]
+            index = self.images.index(path)
+        except ValueError:
+            return
 
-        self.show(image, name)
+        del self.images[index]
+        if self.grid_view is not None and self.is_grid_shown:
+            self.grid_view.refresh()
+
+        if index == self.index:
+            self.show(index)
+        elif index < self.index:
+            self.index -= 1
+
+    def next(self, *args: Any) -> None:
+        if not self.images:
+            return
 
-    def previous(self, *args: Any) -> None:
         self.last_index = self.index
-        self.index -= 1
-        if self.index < 0:
-            self.index = len(self.images) - 1
+        self.show(self.index + 1)
 
-        image, name = self.images[self.index]
-        self.show(image, name)
+    def previous(self, *args: Any) -> None:
+        if not self.images:
+            return
+
+        self.last_index = self.index
+        self.show(self.index - 1)
 
     def _run_slideshow(self):
         self.next()
@@ -279,38 +1275,65 @@ class Application(tkinter.Tk):
         random.shuffle(self.images)
         self.index = -1
 
+        if self.grid_view is not None and self.is_grid_shown:
+            self.grid_view.refresh()
+
         self.next()
 
     def random(self, *args: Any) -> None:
-        self.last_index = self.index
-        self.index = random.randint(0, len(self.images) - 1)
+        if not self.images:
+            return
 
-        image, name = self.images[self.index]
-        self.show(image, name)
+        self.last_index = self.index
+        self.show(random.randint(0, len(self.images) - 1))
 
     def goto(self, *args: Any) -> None:
         index = simpledialog.askinteger('Goto', 'Enter the index of the image you want to go to.', parent=self, minvalue=1, maxvalue=len(self.images))
         if index is not None:
             self.last_index = self.index
-            self.index = index - 1
-
-            image, name = self.images[self.index]
-            self.show(image, name)
+            self.show(index - 1)
 
     def back(self, *args: Any) -> None:
         if self.last_index < 0:
             self.last_index = 0
 
-        self.index = self.last_index
-        image, name = self.images[self.index]
-
-        self.show(image, name)
+        self.show(self.last_index)
 
     def destroy(self, *args: Any) -> None:
         if self.is_fullscreen:
             self.attributes('-fullscreen', False)
             self.is_fullscreen = False
         else:
+            if self.poll_id is not None:
+                self.after_cancel(self.poll_id)
+                self.poll_id = None
+
+            if self.watch_id is not None:
+                self.after_cancel(self.watch_id)
+                self.watch_id = None
+
+                # Saved once the update that is still running finished, so that it isn't lost
+                if self.watching is not None:
+                    try:
+                        self.watching.result()
+                    except Exception:
+                        logger.error('Failed to update the indexes.', exc_info=True)
+
+                for index in self.indexes:
+                    index.save()
+
+            for future in self.decoding.values():
+                future.cancel()
+
+            if self.grid_view is not None:
+                self.grid_view.stop()
+
+            self.threads.shutdown(wait=False)
+            if self._processes is not None:
+                self._processes.shutdown(wait=False)
+
+            self.cache.clear()
+
             super().destroy()
 
     def run(self):
@@ -337,6 +1360,48 @@ def main():
         default=720
     )
 
+    parser.add_argument(
+        '--memory', 
+        type=int, 
+        help='The maximum amount of memory in megabytes used to keep decoded images around. Defaults to 256.', 
+        default=256
+    )
+
+    parser.add_argument(
+        '--prefetch', 
+        type=int, 
+        help='The amount of images to decode ahead of time in each direction. Defaults to 2.', 
+        default=2
+    )
+
+    parser.add_argument(
+        '--workers', 
+        type=int, 
+        help='The amount of threads/processes used to decode images. Defaults to the amount of CPUs.', 
+        required=False
+    )
+
+    parser.add_argument(
+        '--no-thumbnail-cache', 
+        action='store_true', 
+        help='Do not cache resized images on disk. Defaults to False.', 
+        default=False
+    )
+
+    parser.add_argument(
+        '--thumbnail-size', 
+        type=int, 
+        help='The size of the thumbnails in the grid (Ctrl+T). Defaults to 160.', 
+        default=160
+    )
+
+    parser.add_argument(
+        '--watch', 
+        action='store_true', 
+        help='Keep checking the directory for new images, e.g. while they are being downloaded. Defaults to False.', 
+        default=False
+    )
+
     parser.add_argument('--debug', action='store_true', help='Print debug messages.', default=False)
 
     args = parser.parse_args()
@@ -344,7 +1409,17 @@ def main():
     if not args.debug:
         logger.setLevel(logging.ERROR)
 
-    app = Application(width=args.width, height=args.height, paths=[args.path])
+    app = Application(
+        width=args.width, 
+        height=args.height, 
+        paths=[args.path], 
+        memory_budget=args.memory * 1024 * 1024, 
+        prefetch=args.prefetch,
+        thumbnails=None if args.no_thumbnail_cache else ThumbnailCache(),
+        workers=args.workers,
+        watch=args.watch,
+        thumbnail_size=args.thumbnail_size
+    )
 
     app.run()
     return 0
@@ -0,0 +1,43 @@
+import pathlib
+import asyncio
+
+from neko.downloader import Downloader
+from neko.filters import DownloadFilter
+
+class Content:
+    def __init__(self, data: bytes) -> None:
+        self.data = data
+
+    async def read(self, size: int) -> bytes:
+        chunk, self.data = self.data[:size], self.data[size:]
+        return chunk
+
+class Response:
+    """
+    Just enough of :class:`aiohttp.ClientResponse` for :meth:`Downloader.write`.
+    """
+    def __init__(self, data: bytes) -> None:
+        self.content = Content(data)
+
+def run(coro):
+    return asyncio.run(coro)
+
+def test_unused_reservation_is_released(tmp_path: pathlib.Path):
+    filter = DownloadFilter(tmp_path, budget=10000)
+
+    # `write` doesn't talk to the provider
+    downloader = Downloader(None, tmp_path, filter=filter) # type: ignore
+
+    # Reserved for a Content-Length of 6000 but the body only had 4000 bytes
+    reserved = filter.reserve(6000)
+    assert run(downloader.write(tmp_path / 'image.png', Response(b'\0' * 4000), reserved=reserved)) # type: ignore
+
+    assert (tmp_path / 'image.png').stat().st_size == 4000
+    assert filter.used == 4000
+
+def test_overflow_is_consumed(tmp_path: pathlib.Path):
+    filter = DownloadFilter(tmp_path, budget=10000)
+    downloader = Downloader(None, tmp_path, filter=filter) # type: ignore
+
+    assert run(downloader.write(tmp_path / 'image.png', Response(b'\0' * 3000), reserved=filter.reserve(2000))) # type: ignore
+    assert filter.used == 3000
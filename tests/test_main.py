@@ -0,0 +1,87 @@
+from typing import Dict, List, Tuple
+
+import pathlib
+import asyncio
+
+from aiohttp import web
+import pytest
+
+from neko.__main__ import create_argument_parser
+from neko.main import main
+from neko.providers import ALL_PROVIDERS, Provider
+from neko.seen import SeenSet, get_seen_path
+
+class RepeatingProvider(Provider):
+    """
+    A random provider that keeps returning the same image.
+    """
+    IS_RANDOM = True
+
+    async def fetch_image(self, category: str) -> str:
+        return self.BASE_URL + '/images/cat.png'
+
+    async def fetch_categories(self) -> Dict[str, int]:
+        return {}
+
+class ImageHost:
+    """
+    Serves the headers of every image but fails every download.
+    """
+    def __init__(self) -> None:
+        self.requests: List[Tuple[str, str]] = []
+
+        self.app = web.Application()
+        self.app.router.add_route('*', '/images/{name}', self.handle)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.requests.append((request.method, request.match_info['name']))
+        if request.method == 'HEAD':
+            return web.Response(content_type='image/png')
+
+        return web.Response(status=500)
+
+def run(coro):
+    return asyncio.run(coro)
+
+@pytest.fixture(autouse=True)
+def cache_directory(tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    # The seen-sets live in the cache directory
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'cache'))
+
+async def serve(host: ImageHost) -> Tuple[web.AppRunner, str]:
+    runner = web.AppRunner(host.app)
+    await runner.setup()
+
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+
+    port = runner.addresses[0][1]
+    return runner, f'http://127.0.0.1:{port}'
+
+def test_failed_duplicate_is_not_persisted(tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch):
+    async def test():
+        host = ImageHost()
+        runner, endpoint = await serve(host)
+
+        monkeypatch.setattr(RepeatingProvider, 'BASE_URL', endpoint, raising=False)
+        monkeypatch.setitem(ALL_PROVIDERS.providers, 'repeating', RepeatingProvider)
+
+        path = tmp_path / 'images'
+        args = create_argument_parser().parse_args(['--provider', 'repeating', '-a', '2', '-p', str(path), '--no-cache'])
+
+        try:
+            assert await main(args) == 0
+        finally:
+            await runner.cleanup()
+
+        # The image came back three times but was only looked up and downloaded (and retried) as one
+        assert host.requests.count(('HEAD', 'cat.png')) == 1
+        assert host.requests.count(('GET', 'cat.png')) == 6
+
+        assert not (path / 'cat.png').exists()
+        assert 'cat.png' not in SeenSet(get_seen_path(path.resolve(), 'repeating', None))
+
+        # --no-cache doesn't create the response cache
+        assert not (tmp_path / 'cache' / 'neko' / 'responses').exists()
+
+    run(test())
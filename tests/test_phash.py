@@ -0,0 +1,52 @@
+import pathlib
+import random
+
+import pytest
+
+from neko.phash import PerceptualIndex, hamming
+
+def flip(hash: int, bits: int, rng: random.Random) -> int:
+    for position in rng.sample(range(64), bits):
+        hash ^= 1 << position
+
+    return hash
+
+@pytest.fixture
+def index(tmp_path: pathlib.Path):
+    index = PerceptualIndex(tmp_path / 'library.sqlite3')
+    yield index
+    index.close()
+
+def test_search_matches_brute_force(tmp_path: pathlib.Path, index: PerceptualIndex):
+    rng = random.Random(0)
+    directory = tmp_path / 'images'
+
+    hashes = {f'{directory}/{i}.png': rng.getrandbits(64) for i in range(2000)}
+
+    # Near copies of some of the images, up to the maximum distance away
+    originals = list(hashes.values())[:200]
+    for i, hash in enumerate(originals):
+        hashes[f'{directory}/copy-{i}.png'] = flip(hash, i % (PerceptualIndex.MAX_DISTANCE + 1), rng)
+
+    index.add_many(directory, hashes.items())
+
+    for distance in range(PerceptualIndex.MAX_DISTANCE + 1):
+        for hash in originals[:50]:
+            expected = sorted((hamming(hash, other), path) for path, other in hashes.items() if hamming(hash, other) <= distance)
+            assert index.search(directory, hash, distance) == expected
+
+def test_search_only_looks_at_one_directory(tmp_path: pathlib.Path, index: PerceptualIndex):
+    hash = 0x0123456789ABCDEF
+
+    index.add(tmp_path / 'first', str(tmp_path / 'first' / 'a.png'), hash)
+    index.add(tmp_path / 'second', str(tmp_path / 'second' / 'a.png'), hash ^ 1)
+
+    assert index.search(tmp_path / 'first', hash, 1) == [(0, str(tmp_path / 'first' / 'a.png'))]
+    assert index.search(tmp_path / 'second', hash, 1) == [(1, str(tmp_path / 'second' / 'a.png'))]
+
+    index.remove(str(tmp_path / 'first' / 'a.png'))
+    assert index.search(tmp_path / 'first', hash, 1) == []
+
+def test_search_rejects_distances_past_the_maximum(tmp_path: pathlib.Path, index: PerceptualIndex):
+    with pytest.raises(ValueError):
+        index.search(tmp_path, 0, PerceptualIndex.MAX_DISTANCE + 1)